@@ -1,9 +1,16 @@
 import argparse
 import os
+import sys
 import urllib
 
-from datasets import LundyProject
-import requests
+from cache import ScanCache
+from database import read_config
+from datasets import LundyProject, insert_documents
+import replay
+import snapshot
+from stream import ProjectWriter
+from push import Uploader
+from spool import Spool
 
 def parse_config_file(config_path):
     config_parameters = ('login', 'password', 'project_name', '')
@@ -20,27 +27,121 @@ def parse_config_file(config_path):
     return project_src
 
 
-def send_project_version():
-    dir_path = os.path.dirname(os.path.realpath(__file__))
-    project_dir = os.path.join(dir_path, 'sample_project_dir')
-    project = LundyProject("Lundy")
-    project.scan(project_dir)
-    url = 'http://127.0.0.1:8000/api/lundy_objects/'
-    data = {'type': 'project', 'data': project.to_json(), 'hash': project.hash, 'id': 4}
-    requests.post(url, json=data)
+def collect(scan_mode=None, use_cache=True, jobs=None, snapshot_path=None, output_path=None):
+    """Scan the project from .lunni
 
-def collect():
+    With `output_path` the project JSON is streamed to that file module by
+    module, the project isn't kept in memory and its hash is returned. The
+    scan cache is not used then, it holds every module in memory.
+    """
     dir_path = os.getcwd()
     lundy_config_path = os.path.join(dir_path, '.lunni')
     if os.path.exists(lundy_config_path):
         project_src = parse_config_file(lundy_config_path)
     else:
         raise("Please provide .lunni config file")
+    config = read_config(lundy_config_path)
+    if scan_mode is None:
+        scan_mode = config.get('scan_mode', 'import')
     project = LundyProject("Lundy")
-    project.scan(project_src)
+    if output_path:
+        return stream_collect(project, project_src, scan_mode, jobs, snapshot_path, output_path)
+    cache = None
+    if use_cache:
+        cache_path = os.path.join(dir_path, config.get('scan_cache', '.lunni_cache'))
+        cache = ScanCache(cache_path, scan_mode)
+    project.scan(project_src, mode=scan_mode, cache=cache, workers=jobs)
+    if cache:
+        cache.save()
+        print("{} modules from cache, {} scanned".format(cache.hits, cache.misses))
+    if snapshot_path:
+        snapshot.save_project(project, snapshot_path)
+        print("Snapshot written to {}".format(snapshot_path))
     print("DATA COLLECTED")
     return project.to_json()
 
+
+def stream_collect(project, project_src, scan_mode, jobs, snapshot_path, output_path):
+    with open(output_path, 'wb') as f:
+        writer = ProjectWriter(f, project.name)
+
+        def written(modules):
+            for module in modules:
+                writer.write(module)
+                yield module
+
+        modules = written(project.iter_scan(project_src, mode=scan_mode, workers=jobs))
+        if snapshot_path:
+            snapshot.save_modules(project.name, modules, snapshot_path)
+        else:
+            for _ in modules:
+                pass
+        project_hash = writer.close()
+    if snapshot_path:
+        print("Snapshot written to {}".format(snapshot_path))
+    print("{} modules written to {}, hash {}".format(writer.count, output_path, project_hash))
+    print("DATA COLLECTED")
+    return project_hash
+
+
+def push(snapshot_path=None, base_path=None):
+    """Upload the project and the spooled runs
+
+    Spooled runs are uploaded with the project when push_url is set in
+    .lunni, otherwise they're inserted into the database. With `base_path`,
+    the snapshot of a version already pushed, only the changes since that
+    version are uploaded.
+    """
+    config = read_config(os.path.join(os.getcwd(), '.lunni'))
+    ledger_path = os.path.join(os.getcwd(), config.get('push_ledger', '.lunni_pushed'))
+    uploader = Uploader.from_config(config, ledger_path)
+    if config.get('spool'):
+        sink = uploader.push_documents if config.get('push_url') else insert_documents
+        drain_spool(config, sink)
+    if snapshot_path:
+        project = snapshot.load_project(snapshot_path)
+    else:
+        project = LundyProject("Lundy")
+        project.scan(parse_config_file(os.path.join(os.getcwd(), '.lunni')),
+                     mode=config.get('scan_mode', 'import'))
+    if base_path:
+        uploader.push_delta(snapshot.load_project(base_path), project)
+    else:
+        uploader.push_project(project)
+    print(uploader.progress.report())
+
+
+def replay_runs(replay_from=None, sample=20, jobs=None):
+    """Replay recorded calls against the current code and print how they compare
+
+    Runs are read from the database, or from `replay_from`, a spool segment
+    or other snapshot of (collection, document) records. Returns the number
+    of calls whose result didn't match the recorded one plus the number of
+    methods or runs that couldn't be replayed.
+    """
+    lundy_config_path = os.path.join(os.getcwd(), '.lunni')
+    os.environ.setdefault('LUNNICONFIG', lundy_config_path)
+    project_src = parse_config_file(lundy_config_path)
+    if replay_from:
+        with open(replay_from, 'rb') as f:
+            methods = list(replay.load_from_file(f, sample))
+    else:
+        methods = list(replay.load_from_database(sample))
+    reports = replay.replay(methods, [project_src], workers=jobs)
+    print(replay.format_reports(reports))
+    mismatches = sum(report['mismatches'] for report in reports)
+    failures = sum(len(report['failures']) for report in reports)
+    print("{} methods, {} calls replayed, {} mismatches, {} failures".format(
+        len(reports), sum(report['calls'] for report in reports), mismatches, failures))
+    return mismatches + failures
+
+
+def drain_spool(config, sink=insert_documents):
+    """Ship the runs spooled on disk"""
+    spool = Spool.from_config(config)
+    shipped = spool.drain(sink, int(config.get('batch_size', 500)))
+    print("{} spooled runs shipped".format(shipped))
+
 def main():
     """Main function for using Lundy agent"""
     parser = argparse.ArgumentParser(
@@ -51,6 +152,37 @@ def main():
         action="store_true",
         help=
         "")
+    parser.add_argument(
+        "--scan-mode",
+        choices=LundyProject.SCAN_MODES,
+        help=
+        "import modules to scan them or parse them statically, "
+        "defaults to scan_mode from .lunni or import")
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help=
+        "rescan every module instead of only the ones changed since the last collect")
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help=
+        "number of processes scanning modules")
+    parser.add_argument(
+        "--snapshot",
+        help=
+        "binary snapshot file written by collect and sent by push")
+    parser.add_argument(
+        "--base",
+        help=
+        "snapshot of the version pushed last, push only the changes since then")
+    parser.add_argument(
+        "-o",
+        "--output",
+        help=
+        "stream the collected project JSON to this file instead of keeping it in memory, "
+        "without the scan cache")
     parser.add_argument(
         "-p",
         "--push",
@@ -58,11 +190,30 @@ def main():
         default=False,
         help=
         "")
+    parser.add_argument(
+        "--replay",
+        action="store_true",
+        help=
+        "call recorded runs again against the current code and compare timings and results")
+    parser.add_argument(
+        "--replay-from",
+        help=
+        "spool segment or snapshot of recorded documents to replay instead of the database")
+    parser.add_argument(
+        "--sample",
+        type=int,
+        default=20,
+        help=
+        "most recent runs replayed per method")
     args = parser.parse_args()
     if args.collect:
-        collect()
+        collect(args.scan_mode, use_cache=not args.no_cache, jobs=args.jobs, snapshot_path=args.snapshot,
+                output_path=args.output)
     if args.push:
-        print "push"
+        push(args.snapshot, args.base)
+    if args.replay:
+        if replay_runs(args.replay_from, args.sample, args.jobs):
+            sys.exit(1)
 
 if __name__ == "__main__":
   main()
\ No newline at end of file
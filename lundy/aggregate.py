@@ -0,0 +1,179 @@
+""" Per method call statistics, for @Lundy.collector(aggregate=True)
+
+Instead of a run document per call, every call updates the counters of its
+method and one lunni_aggregate document per method is shipped every
+`interval` seconds:
+
+    {'hash', 'name', 'start', 'end', 'count', 'errors', 'total_ns', 'min_ns',
+     'max_ns', 'histogram'}
+
+Counters are keyed by the lunni_method hash, which includes the module and
+qualname, so same-named methods of different classes are counted apart.
+
+The histogram counts durations in log-linear buckets, 8 per power of two,
+so percentiles are within 1/8 of the true value. Histograms of different
+intervals or processes are merged by adding up the counts of equal
+buckets, see merge_histograms() and percentile().
+"""
+import atexit
+import datetime
+import os
+import threading
+
+from database import read_config
+from shipper import get_shipper
+
+SUB_BUCKET_BITS = 3
+
+
+def bucket(duration_ns):
+    """Histogram bucket of a duration, larger durations get larger buckets"""
+    if duration_ns < 1 << (SUB_BUCKET_BITS + 1):
+        return max(duration_ns, 0)
+    exponent = duration_ns.bit_length() - SUB_BUCKET_BITS - 1
+    return (exponent << SUB_BUCKET_BITS) + (duration_ns >> exponent)
+
+
+def bucket_upper_bound(index):
+    """Largest duration falling into the bucket"""
+    if index < 1 << (SUB_BUCKET_BITS + 1):
+        return index
+    exponent = (index >> SUB_BUCKET_BITS) - 1
+    mantissa = index - (exponent << SUB_BUCKET_BITS)
+    return ((mantissa + 1) << exponent) - 1
+
+
+def merge_histograms(histograms):
+    merged = {}
+    for histogram in histograms:
+        for index, count in histogram.items():
+            merged[index] = merged.get(index, 0) + count
+    return merged
+
+
+def percentile(histogram, fraction):
+    """Duration in nanoseconds below which `fraction` of the calls are"""
+    counts = sorted((int(index), count) for index, count in histogram.items())
+    total = sum(count for index, count in counts)
+    if not total:
+        return None
+    rank = fraction * total
+    seen = 0
+    for index, count in counts:
+        seen += count
+        if seen >= rank:
+            return bucket_upper_bound(index)
+    return bucket_upper_bound(counts[-1][0])
+
+
+class MethodStats(object):
+    def __init__(self, method_hash, name):
+        self.hash = method_hash
+        self.name = name
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.start = datetime.datetime.now()
+        self.count = 0
+        self.errors = 0
+        self.total_ns = 0
+        self.min_ns = None
+        self.max_ns = None
+        self.histogram = {}
+
+    def record(self, duration_ns, error=False):
+        index = bucket(duration_ns)
+        with self._lock:
+            self.count += 1
+            if error:
+                self.errors += 1
+            self.total_ns += duration_ns
+            if self.min_ns is None or duration_ns < self.min_ns:
+                self.min_ns = duration_ns
+            if self.max_ns is None or duration_ns > self.max_ns:
+                self.max_ns = duration_ns
+            self.histogram[index] = self.histogram.get(index, 0) + 1
+
+    def take(self):
+        """Summary document of the calls since the last take, None if there were none"""
+        with self._lock:
+            if not self.count:
+                return None
+            document = {'hash': self.hash,
+                        'name': self.name,
+                        'start': self.start,
+                        'end': datetime.datetime.now(),
+                        'count': self.count,
+                        'errors': self.errors,
+                        'total_ns': self.total_ns,
+                        'min_ns': self.min_ns,
+                        'max_ns': self.max_ns,
+                        # BSON keys have to be strings
+                        'histogram': dict((str(index), count) for index, count in self.histogram.items())}
+            self._reset()
+        return document
+
+
+class Aggregator(object):
+    def __init__(self, interval=60.0, put=None):
+        self.interval = interval
+        self.put = put
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._worker = None
+        self._pid = None
+
+    def stats(self, method_hash, name):
+        stats = self._stats.get(method_hash)
+        if stats is None or self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    # a forked child starts from empty counters and needs its own worker
+                    self._stats = {}
+                    self._pid = os.getpid()
+                    self._worker = None
+                stats = self._stats.get(method_hash)
+                if stats is None:
+                    stats = self._stats[method_hash] = MethodStats(method_hash, name)
+                self._ensure_worker()
+        return stats
+
+    def flush(self):
+        put = self.put or get_shipper().put
+        for stats in list(self._stats.values()):
+            document = stats.take()
+            if document:
+                put('lunni_aggregate', document)
+
+    def close(self):
+        self._stop.set()
+        if self._worker is not None and self._worker is not threading.current_thread():
+            self._worker.join(5.0)
+        self.flush()
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name='lundy-aggregator')
+            self._worker.daemon = True
+            self._worker.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+
+_aggregator = None
+_aggregator_lock = threading.Lock()
+
+
+def get_aggregator():
+    global _aggregator
+    if _aggregator is None:
+        with _aggregator_lock:
+            if _aggregator is None:
+                aggregator = Aggregator(float(read_config().get('aggregate_interval', 60)))
+                atexit.register(aggregator.close)
+                _aggregator = aggregator
+    return _aggregator
@@ -0,0 +1,52 @@
+""" Overhead of Lundy.collector per call, against the undecorated function
+
+Runs are shipped to an in-memory sink, no database is needed.
+
+python -m lundy.bench.collector
+"""
+from lundy import aggregate, shipper
+from lundy.bench.timing import best_of, result
+from lundy.main import method_wrapper
+from lundy.sampling import SamplingPolicy
+from lundy.test.sample_project_dir.a_bit_complex_class import NormalClass
+
+
+def function(a, b=2):
+    return a + b
+
+
+def method_call(instance, value):
+    return instance.a
+
+
+def discard(batch):
+    pass
+
+
+def run(number=20000):
+    previous = shipper._shipper, aggregate._aggregator
+    shipper._shipper = shipper.RunShipper(discard, queue_size=number * 10, batch_size=1000)
+    aggregate._aggregator = aggregate.Aggregator(put=lambda collection, document: None)
+    try:
+        instance = NormalClass('a' * 100, range(100))
+        cases = [
+            ('recorded', function, method_wrapper(function), (1, )),
+            ('sampled_1_in_100', function, method_wrapper(function, SamplingPolicy(every_nth=100)), (1, )),
+            ('aggregate', function, method_wrapper(function, aggregate=True), (1, )),
+            ('recorded_object_args', method_call, method_wrapper(method_call), (instance, 'value')),
+        ]
+        results = []
+        for name, plain, wrapped, args in cases:
+            plain_seconds = best_of(lambda: plain(*args), number)
+            seconds = best_of(lambda: wrapped(*args), number)
+            results.append(result('collector', name, seconds, number, overhead=seconds - plain_seconds))
+        return results
+    finally:
+        shipper._shipper.close()
+        aggregate._aggregator.close()
+        shipper._shipper, aggregate._aggregator = previous
+
+
+if __name__ == '__main__':
+    for entry in run():
+        print("{name:22} {seconds:.3e}s per call, {overhead:.3e}s overhead".format(**entry))
@@ -0,0 +1,49 @@
+""" Compares two benchmark result files written by lundy.bench.run
+
+python -m lundy.bench.compare base.json new.json --threshold 0.1
+
+Exits with status 1 when a benchmark got slower by more than the threshold.
+"""
+import argparse
+import json
+import sys
+
+
+def key(entry):
+    return entry['suite'], entry['name']
+
+
+def compare(base, new, threshold=0.1):
+    """(suite, name, base seconds, new seconds, ratio, regressed) of the benchmarks in both reports"""
+    base_results = dict((key(entry), entry) for entry in base['results'])
+    rows = []
+    for entry in new['results']:
+        base_entry = base_results.get(key(entry))
+        if base_entry is None:
+            continue
+        ratio = entry['seconds'] / base_entry['seconds'] if base_entry['seconds'] else float('inf')
+        rows.append(key(entry) + (base_entry['seconds'], entry['seconds'], ratio, ratio > 1 + threshold))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare Lundy benchmark results")
+    parser.add_argument("base")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="relative slowdown reported as a regression")
+    args = parser.parse_args()
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    rows = compare(base, new, args.threshold)
+    for suite, name, base_seconds, new_seconds, ratio, regressed in rows:
+        print("{:10} {:32} {:12.4e} {:12.4e} {:6.2f}x{}".format(
+            suite, name, base_seconds, new_seconds, ratio, '  REGRESSION' if regressed else ''))
+    if any(row[-1] for row in rows):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
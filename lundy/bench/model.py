@@ -0,0 +1,53 @@
+""" Hashing and (de)serialization of a scanned project
+
+python -m lundy.bench.model
+"""
+import os
+import shutil
+import tempfile
+
+from lundy import snapshot
+from lundy.bench.scan import make_tree
+from lundy.bench.timing import best_of, result
+from lundy.datasets import LundyProject
+
+
+def scanned_project(modules):
+    directory = tempfile.mkdtemp()
+    try:
+        make_tree(directory, 'lundy_bench_model', modules)
+        project = LundyProject('bench')
+        project.scan(directory, mode='static')
+        return project
+    finally:
+        shutil.rmtree(directory)
+
+
+def run(modules=1000, number=3):
+    project = scanned_project(modules)
+    string = project.to_string()
+    fresh = lambda: LundyProject.from_string(string)
+    fd, path = tempfile.mkstemp()
+    os.close(fd)
+    try:
+        snapshot.save_project(project, path)
+        results = [
+            result('model', 'to_string', best_of(project.to_string, number), number),
+            result('model', 'from_string', best_of(fresh, number), number),
+            result('model', 'hash', best_of(lambda tree: tree.hash, 1, number, fresh), 1),
+            result('model', 'merkle_hash', best_of(lambda tree: tree.merkle_hash, 1, number, fresh), 1),
+            result('model', 'memoized_hash', best_of(lambda: project.hash, number * 1000), number * 1000),
+            result('model', 'snapshot_save', best_of(lambda: snapshot.save_project(project, path), number), number),
+            result('model', 'snapshot_load', best_of(lambda: snapshot.load_project(path), number), number),
+        ]
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+    for entry in results:
+        entry['modules'] = modules
+    return results
+
+
+if __name__ == '__main__':
+    for entry in run():
+        print("{name:16} {seconds:.4f}s".format(**entry))
@@ -0,0 +1,60 @@
+""" Runs the benchmark suites and writes their results as JSON
+
+python -m lundy.bench.run --output results.json
+python -m lundy.bench.run --quick --suite collector --suite payload
+
+Compare two result files with lundy.bench.compare.
+"""
+import argparse
+import datetime
+import json
+import platform
+import subprocess
+import sys
+
+from lundy.bench import collector, model, scan, serializer
+
+SUITES = {
+    'collector': lambda quick: collector.run(number=2000 if quick else 20000),
+    'payload': lambda quick: serializer.results(number=2 if quick else 20),
+    'scan': lambda quick: scan.run(sizes=(100, 1000) if quick else (100, 1000, 10000), import_sizes=(100, )),
+    'model': lambda quick: model.run(modules=100 if quick else 1000, number=1 if quick else 3),
+}
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.STDOUT).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(suites=None, quick=False):
+    results = []
+    for name in suites or sorted(SUITES):
+        results.extend(SUITES[name](quick))
+    return {'meta': {'commit': git_commit(),
+                     'python': sys.version.split()[0],
+                     'platform': platform.platform(),
+                     'date': datetime.datetime.utcnow().isoformat(),
+                     'quick': quick},
+            'results': results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lundy benchmarks")
+    parser.add_argument("--suite", action="append", choices=sorted(SUITES), help="suite to run, all by default")
+    parser.add_argument("--quick", action="store_true", help="smaller inputs and fewer repetitions")
+    parser.add_argument("--output", help="JSON file for the results, stdout by default")
+    args = parser.parse_args()
+    report = run(args.suite, args.quick)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    else:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        print('')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+""" LundyProject.scan on synthetic projects
+
+python -m lundy.bench.scan
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from lundy.bench.timing import result
+from lundy.datasets import LundyProject
+
+MODULE_TEMPLATE = '''
+class Class{index}:
+    attribute = 'value{index}'
+
+    def __init__(self, a, b=None):
+        self.a = a
+
+    def method(self, a, b='{index}', c=({index}, 2)):
+        return a
+
+    def other_method(self, *args, **kwargs):
+        return args
+'''
+
+
+def make_tree(directory, package, modules, classes=5):
+    """Package of `modules` modules with `classes` classes each, in subpackages of 100"""
+    root = os.path.join(directory, package)
+    for index in range(modules):
+        subpackage = os.path.join(root, 'sub{}'.format(index // 100))
+        if not os.path.isdir(subpackage):
+            os.makedirs(subpackage)
+            open(os.path.join(subpackage, '__init__.py'), 'w').close()
+        with open(os.path.join(subpackage, 'module{}.py'.format(index)), 'w') as f:
+            for class_index in range(classes):
+                f.write(MODULE_TEMPLATE.format(index=index * classes + class_index))
+    open(os.path.join(root, '__init__.py'), 'w').close()
+    return root
+
+
+def scan_seconds(src, mode, workers=None):
+    project = LundyProject('bench')
+    start = time.time()
+    project.scan(src, mode=mode, workers=workers)
+    return time.time() - start, project
+
+
+def run(sizes=(100, 1000, 10000), import_sizes=(100, 1000), workers=None):
+    directory = tempfile.mkdtemp()
+    path = list(sys.path)
+    try:
+        results = []
+        for size in sizes:
+            package = 'lundy_bench_{}'.format(size)
+            src = make_tree(directory, package, size)
+            seconds, project = scan_seconds(directory, 'static')
+            results.append(result('scan', 'static_{}'.format(size), seconds, 1, modules=len(project.modules)))
+            if workers:
+                seconds, project = scan_seconds(directory, 'static', workers)
+                results.append(result('scan', 'static_{}_workers_{}'.format(size, workers), seconds, 1))
+            if size in import_sizes:
+                seconds, project = scan_seconds(directory, 'import')
+                results.append(result('scan', 'import_{}'.format(size), seconds, 1))
+            shutil.rmtree(src)
+        return results
+    finally:
+        sys.path[:] = path
+        for name in list(sys.modules):
+            if name.startswith('lundy_bench_'):
+                del sys.modules[name]
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    for entry in run():
+        print("{name:24} {seconds:.3f}s".format(**entry))
@@ -0,0 +1,103 @@
+""" Compares Serializer with the recursive args_to_json it replaced
+
+python -m lundy.bench.serializer
+"""
+import datetime
+import timeit
+
+from lundy.bench.timing import best_of, result
+from lundy.datasets import ResultPackage
+from lundy.serializer import Serializer
+from lundy.test.sample_project_dir.a_bit_complex_class import NormalClass
+
+
+def legacy_args_to_json(args):
+    if type(args) is list:
+        new_args = []
+        for arg in args:
+            new_args.append(legacy_args_to_json(arg))
+    elif type(args) is tuple:
+        new_args = ()
+        for arg in args:
+            new_args += (legacy_args_to_json(arg), )
+    elif type(args) is dict:
+        new_args = {}
+        for key, value in args.items():
+            new_args[key] = legacy_args_to_json(value)
+    elif str(type(args)) == "<type 'instance'>" or getattr(args, '__dict__', None):
+        new_args = {}
+        for key, value in legacy_args_to_json(args.__dict__).items():
+            new_args[key] = value
+    elif str(type(args)) in ["<type 'NoneType'>", "<type 'type'>"]:
+        new_args = 'type'
+    else:
+        new_args = args
+    return new_args
+
+
+def small_payload():
+    return (NormalClass('a', 'b'), 'arg', 1, None)
+
+
+def deep_payload(depth=500):
+    value = {'leaf': 1}
+    for _ in range(depth):
+        value = NormalClass([value], 1)
+    return (value, )
+
+
+def wide_payload(width=5000):
+    return (NormalClass(dict(('key{}'.format(i), (i, str(i))) for i in range(width)), range(width)), )
+
+
+def cyclic_payload():
+    value = NormalClass(None, None)
+    value.a = value
+    value.b = [value, {'parent': value}]
+    return (value, )
+
+
+PAYLOADS = [
+    ('small', small_payload),
+    ('deep', deep_payload),
+    ('wide', wide_payload),
+    ('cyclic', cyclic_payload),
+]
+
+
+def measure(function, payload, number):
+    try:
+        return min(timeit.repeat(lambda: function(payload), number=number, repeat=3)) / number
+    except RuntimeError as e:
+        return e
+
+
+def run(number=20):
+    serializer = Serializer(max_depth=10000, max_items=10 ** 6, max_bytes=10 ** 8)
+    results = []
+    for name, build_payload in PAYLOADS:
+        payload = build_payload()
+        results.append({'payload': name,
+                        'legacy': measure(legacy_args_to_json, payload, number),
+                        'serializer': measure(serializer.serialize, payload, number)})
+    return results
+
+
+def results(number=20):
+    """run() and ResultPackage.to_document() timings as benchmark results"""
+    entries = []
+    for timing in run(number):
+        for implementation in ('legacy', 'serializer'):
+            seconds = timing[implementation]
+            if isinstance(seconds, float):
+                entries.append(result('payload', '{}_{}'.format(timing['payload'], implementation), seconds, number))
+    for name, build_payload in PAYLOADS:
+        package = ResultPackage(name, build_payload(), {}, None, 'hash', datetime.datetime.now(), 0.1)
+        entries.append(result('payload', '{}_to_document'.format(name),
+                              best_of(package.to_document, number), number))
+    return entries
+
+
+if __name__ == '__main__':
+    for result in run():
+        print("{payload:8} legacy: {legacy!s:40} serializer: {serializer!s}".format(**result))
@@ -0,0 +1,23 @@
+import timeit
+
+
+def best_of(function, number, repeat=3, setup=None):
+    """Best time of one call of `function` in seconds, over `repeat` runs of `number` calls
+
+    `setup` is called before each run and its result passed to `function`.
+    """
+    times = []
+    for _ in range(repeat):
+        argument = setup() if setup else None
+        if setup:
+            timer = timeit.Timer(lambda: function(argument))
+        else:
+            timer = timeit.Timer(function)
+        times.append(timer.timeit(number))
+    return min(times) / number
+
+
+def result(suite, name, seconds, number, **extra):
+    entry = {'suite': suite, 'name': name, 'seconds': seconds, 'number': number}
+    entry.update(extra)
+    return entry
@@ -0,0 +1,213 @@
+""" Content-addressed storage of recorded args, kwargs and results
+
+Calls repeating the same inputs serialize to the same payload. With a blob
+store configured, payloads larger than `min_size` bytes are stored once
+under the sha1 of their JSON encoding and the run document only keeps the
+digest:
+
+    {'hash': ..., 'timestamp': ..., 'data': {'duration': ..., 'blobs': {'args': <digest>}}}
+
+Payloads are digested and blobs written in the shipper worker, by the
+sink wrap_sink() puts around the shipper's sink, so instrumented calls
+only queue their run. resolve() puts the payloads back. Digests already
+stored by the process are remembered, up to `remember` of them, and not
+stored again. A digest is only remembered once its blob is written, or
+for the mongo store added to the batch, and forgotten if that batch can't
+be shipped.
+
+.lunni keys: blob_store=mongo|file, blob_dir for the file store and
+blob_min_size.
+"""
+import abc
+import collections
+import errno
+import hashlib
+import json
+import logging
+import os
+import threading
+
+from database import get_database, read_config
+
+logger = logging.getLogger(__name__)
+
+BLOB_FIELDS = ('args', 'kwargs', 'result')
+
+
+def encode(value):
+    # sorted keys so equal dicts give equal digests
+    return json.dumps(value, default=repr, sort_keys=True)
+
+
+class BlobStore(object):
+    __metaclass__ = abc.ABCMeta
+
+    def __init__(self, min_size=256, remember=10000):
+        self.min_size = min_size
+        self.remember = remember
+        self.stored = 0
+        self.reused = 0
+        self._seen = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def externalize(self, data):
+        """Replace the large payloads of a run's data by their digests, in place
+
+        Returns the lunni_blob documents to ship with the run. `data` is left
+        untouched if a blob can't be written.
+        """
+        blobs = {}
+        documents = []
+        for field in BLOB_FIELDS:
+            if field not in data:
+                continue
+            encoded = encode(data[field])
+            if len(encoded) < self.min_size:
+                continue
+            digest = hashlib.sha1(encoded).hexdigest()
+            if self._seen_before(digest):
+                self.reused += 1
+            else:
+                document = self.write(digest, data[field], encoded)
+                if document is not None:
+                    documents.append(document)
+                self.stored += 1
+            blobs[field] = digest
+        for field in blobs:
+            del data[field]
+        if blobs:
+            data['blobs'] = blobs
+        return documents
+
+    def wrap_sink(self, sink):
+        """Shipper sink externalizing the payloads of lunni_run documents before calling `sink`"""
+        def blob_sink(batch):
+            shipped = []
+            for collection, document in batch:
+                if collection == 'lunni_run' and 'data' in document:
+                    try:
+                        shipped.extend(('lunni_blob', blob) for blob in self.externalize(document['data']))
+                    except Exception:
+                        logger.exception("Lundy could not store the payloads of a run, kept in the run")
+                shipped.append((collection, document))
+            try:
+                sink(shipped)
+            except Exception:
+                for collection, document in shipped:
+                    if collection == 'lunni_blob':
+                        self.lost_blob(document['_id'])
+                raise
+        return blob_sink
+
+    def resolve(self, data):
+        """Put the payloads referenced by a run's data back, in place"""
+        for field, digest in data.pop('blobs', {}).items():
+            data[field] = self.read(digest)
+        return data
+
+    def _seen_before(self, digest):
+        with self._lock:
+            if digest in self._seen:
+                # most recently used last
+                del self._seen[digest]
+                self._seen[digest] = True
+                return True
+            return False
+
+    def stored_blob(self, digest):
+        """Remember a digest whose blob needs no further writes"""
+        with self._lock:
+            self._seen[digest] = True
+            if len(self._seen) > self.remember:
+                self._seen.popitem(last=False)
+
+    def lost_blob(self, digest):
+        with self._lock:
+            self._seen.pop(digest, None)
+
+    @abc.abstractmethod
+    def write(self, digest, value, encoded):
+        """Store a blob and call stored_blob(), raise if it can't be stored
+
+        Returns the lunni_blob document to ship with the run, if any.
+        """
+
+    @abc.abstractmethod
+    def read(self, digest):
+        """Value of a stored blob, KeyError if there's none"""
+
+
+class MongoBlobStore(BlobStore):
+    """ Blobs in the lunni_blob collection, shipped in the batch of their run """
+    def write(self, digest, value, encoded):
+        self.stored_blob(digest)
+        return {'_id': digest, 'value': value, 'size': len(encoded)}
+
+    def read(self, digest):
+        document = get_database().lunni_blob.find_one({'_id': digest})
+        if document is None:
+            raise KeyError(digest)
+        return document['value']
+
+
+class FileBlobStore(BlobStore):
+    """ Blobs as JSON files named by their digest under `directory` """
+    def __init__(self, directory, **kwargs):
+        BlobStore.__init__(self, **kwargs)
+        self.directory = directory
+
+    def path(self, digest):
+        return os.path.join(self.directory, digest[:2], digest[2:])
+
+    def write(self, digest, value, encoded):
+        path = self.path(digest)
+        if os.path.exists(path):
+            self.stored_blob(digest)
+            return
+        try:
+            os.makedirs(os.path.dirname(path))
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            f.write(encoded)
+        os.rename(tmp_path, path)
+        self.stored_blob(digest)
+
+    def read(self, digest):
+        try:
+            with open(self.path(digest)) as f:
+                return json.load(f)
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                raise KeyError(digest)
+            raise
+
+
+def from_config(config):
+    """Blob store configured in .lunni, None if payloads are kept in the runs"""
+    kind = config.get('blob_store')
+    options = {'min_size': int(config.get('blob_min_size', 256))}
+    if kind == 'mongo':
+        return MongoBlobStore(**options)
+    if kind == 'file':
+        return FileBlobStore(config.get('blob_dir', '.lunni_blobs'), **options)
+    if kind:
+        raise ValueError("Unknown blob store {}".format(kind))
+    return None
+
+
+_blob_store = None
+_configured = False
+_blob_store_lock = threading.Lock()
+
+
+def get_blob_store():
+    global _blob_store, _configured
+    if not _configured:
+        with _blob_store_lock:
+            if not _configured:
+                _blob_store = from_config(read_config())
+                _configured = True
+    return _blob_store
@@ -0,0 +1,165 @@
+import ast
+import hashlib
+import json
+import os
+
+
+class ScanCache(object):
+    """ On disk cache of scanned modules, keyed by their path relative to the project
+
+    Each entry keeps the file size, mtime and content digest with the
+    module's serialized scan result and hash. A file whose size and mtime
+    are unchanged is not read at all, a file that was touched but has the
+    same content is not rescanned.
+
+    In import scan mode the members of a module include what it imports, so
+    the entry also keeps the size and mtime of the project modules it
+    imports, directly or not, and is rescanned when one of them changed.
+    """
+    VERSION = 3
+
+    def __init__(self, path, mode='import'):
+        self.path = path
+        self.mode = mode
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self._imports = {}
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except ValueError:
+            return
+        if data.get('version') == self.VERSION and data.get('mode') == self.mode:
+            self.entries = data['entries']
+
+    def save(self):
+        data = {'version': self.VERSION, 'mode': self.mode, 'entries': self.entries}
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.rename(tmp_path, self.path)
+
+    def lookup(self, os_path, full_path):
+        """to_json() of the module of an unchanged file, None if it has to be scanned"""
+        entry = self.entries.get(os_path)
+        if entry is None:
+            self.misses += 1
+            return None
+        stat = os.stat(full_path)
+        unchanged = entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime
+        if not unchanged and entry['size'] == stat.st_size and entry['digest'] == file_digest(full_path):
+            entry['mtime'] = stat.st_mtime
+            unchanged = True
+        if unchanged and self.dependencies_unchanged(entry, source_root(os_path, full_path)):
+            self.hits += 1
+            return entry['module']
+        self.misses += 1
+        return None
+
+    def dependencies_unchanged(self, entry, src):
+        for dependency, (size, mtime) in entry.get('dependencies', {}).items():
+            try:
+                stat = os.stat(os.path.join(src, dependency))
+            except OSError:
+                return False
+            if stat.st_size != size or stat.st_mtime != mtime:
+                return False
+        return True
+
+    def store(self, os_path, full_path, module):
+        stat = os.stat(full_path)
+        self.entries[os_path] = {
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'digest': file_digest(full_path),
+            'module': module.to_json(),
+            'hash': module.hash,
+        }
+        if self.mode == 'import':
+            src = source_root(os_path, full_path)
+            dependencies = {}
+            for dependency in self.dependencies(src, os_path):
+                stat = os.stat(os.path.join(src, dependency))
+                dependencies[dependency] = [stat.st_size, stat.st_mtime]
+            self.entries[os_path]['dependencies'] = dependencies
+
+    def dependencies(self, src, os_path):
+        """Paths relative to src of the project modules `os_path` imports, directly or not"""
+        found = set()
+        pending = [os_path]
+        while pending:
+            for dependency in self.imports(src, pending.pop()):
+                if dependency != os_path and dependency not in found:
+                    found.add(dependency)
+                    pending.append(dependency)
+        return found
+
+    def imports(self, src, os_path):
+        if os_path not in self._imports:
+            self._imports[os_path] = project_imports(src, os_path)
+        return self._imports[os_path]
+
+    def prune(self, os_paths):
+        """Drop the entries of files which no longer exist"""
+        for os_path in set(self.entries) - set(os_paths):
+            del self.entries[os_path]
+
+
+def source_root(os_path, full_path):
+    return full_path[:len(full_path) - len(os_path)] or os.curdir
+
+
+def project_imports(src, os_path):
+    """Paths relative to src of the project modules and packages imported by the module at `os_path`"""
+    try:
+        with open(os.path.join(src, os_path)) as f:
+            tree = ast.parse(f.read(), os_path)
+    except (IOError, SyntaxError, TypeError):
+        return []
+    package = os.path.dirname(os_path)
+    names = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                names.append(('', alias.name))
+                names.append((package, alias.name))
+        elif isinstance(node, ast.ImportFrom):
+            if node.level:
+                base = package
+                for _ in range(node.level - 1):
+                    base = os.path.dirname(base)
+                bases = [base]
+            else:
+                # absolute, or implicitly relative to the package in Python 2
+                bases = ['', package]
+            for base in bases:
+                module = node.module or ''
+                names.append((base, module))
+                for alias in node.names:
+                    names.append((base, '.'.join(filter(None, [module, alias.name]))))
+    found = set()
+    for base, name in names:
+        if not name:
+            continue
+        parts = name.split('.')
+        # every package on the way is imported too
+        for end in range(1, len(parts) + 1):
+            path = os.path.join(base, *parts[:end])
+            for candidate in (path + '.py', os.path.join(path, '__init__.py')):
+                if os.path.isfile(os.path.join(src, candidate)):
+                    found.add(os.path.normpath(candidate))
+    return sorted(found)
+
+
+def file_digest(full_path):
+    digest = hashlib.sha1()
+    with open(full_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
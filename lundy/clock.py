@@ -0,0 +1,69 @@
+""" Clocks used to time wrapped calls
+
+monotonic_ns - nanoseconds from a monotonic clock, for durations
+thread_cpu_ns - CPU time of the calling thread in nanoseconds
+allocated_blocks - memory blocks currently allocated by the interpreter,
+                   None when the interpreter can't tell
+"""
+import ctypes
+import ctypes.util
+import sys
+import threading
+import time
+
+CLOCK_MONOTONIC = 1
+CLOCK_THREAD_CPUTIME_ID = 3
+
+
+class timespec(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+
+def _clock_gettime(clock_id):
+    """Build a reader for a POSIX clock, None if clock_gettime is unavailable
+
+    Each thread reads into its own timespec, the GIL may switch threads
+    between the call and reading the result. Clock ids are Linux's.
+    """
+    if not sys.platform.startswith('linux'):
+        return None
+    library = ctypes.util.find_library('rt') or ctypes.util.find_library('c')
+    try:
+        clock_gettime = ctypes.PyDLL(library).clock_gettime
+    except (OSError, AttributeError):
+        return None
+    if clock_gettime(clock_id, ctypes.byref(timespec())) != 0:
+        return None
+    local = threading.local()
+
+    def read_clock():
+        try:
+            value, reference = local.value, local.reference
+        except AttributeError:
+            value = local.value = timespec()
+            reference = local.reference = ctypes.byref(value)
+        clock_gettime(clock_id, reference)
+        return value.tv_sec * 1000000000 + value.tv_nsec
+    return read_clock
+
+
+def _seconds_to_ns(clock):
+    return lambda: int(clock() * 1000000000)
+
+
+if hasattr(time, 'perf_counter_ns'):
+    monotonic_ns = time.perf_counter_ns
+elif hasattr(time, 'perf_counter'):
+    monotonic_ns = _seconds_to_ns(time.perf_counter)
+else:
+    monotonic_ns = _clock_gettime(CLOCK_MONOTONIC) or _seconds_to_ns(time.time)
+
+if hasattr(time, 'thread_time_ns'):
+    thread_cpu_ns = time.thread_time_ns
+else:
+    thread_cpu_ns = _clock_gettime(CLOCK_THREAD_CPUTIME_ID) or _seconds_to_ns(time.clock)
+
+if hasattr(sys, 'getallocatedblocks'):
+    allocated_blocks = sys.getallocatedblocks
+else:
+    allocated_blocks = lambda: None
@@ -1,20 +1,114 @@
 import os
+import threading
 import urllib
 
 from mongomock import MongoClient
+from pymongo import ASCENDING
+
+# .lunni key -> MongoClient option
+CLIENT_OPTIONS = {
+    'pool_size': ('maxPoolSize', int),
+    'connect_timeout': ('connectTimeoutMS', int),
+    'socket_timeout': ('socketTimeoutMS', int),
+    'server_selection_timeout': ('serverSelectionTimeoutMS', int),
+}
+
+_config_cache = {}
+
+
+def read_config(config_path=None):
+    """Parse the key=value lines of a .lunni config file into a dict
+
+    Parsed files are cached until their mtime or size changes, callers get
+    a copy they are free to change.
+    """
+    if config_path is None:
+        config_path = os.environ.get('LUNNICONFIG')
+    if not config_path:
+        return {}
+    try:
+        stat = os.stat(config_path)
+    except OSError:
+        return {}
+    fingerprint = (stat.st_mtime, stat.st_size)
+    cached = _config_cache.get(config_path)
+    if cached and cached[0] == fingerprint:
+        return dict(cached[1])
+    config = {}
+    with open(config_path) as f:
+        for line in f:
+            command = line.rstrip('\n')
+            command = command.split('=', 1)
+            if len(command) == 2:
+                config[command[0]] = command[1]
+    _config_cache[config_path] = (fingerprint, config)
+    return dict(config)
+
+
+class ConnectionManager(object):
+    """ Process wide pool of database clients, one per uri and options
+
+    Clients are dropped in a forked child and lazily recreated there,
+    sockets inherited from the parent are never reused.
+    """
+    def __init__(self):
+        self._clients = {}
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def get_client(self, uri, **options):
+        key = (uri, tuple(sorted(options.items())))
+        with self._lock:
+            if self._pid != os.getpid():
+                self._clients = {}
+                self._pid = os.getpid()
+            client = self._clients.get(key)
+            if client is None:
+                client = MongoClient(uri, **options)
+                self._clients[key] = client
+            return client
+
+    def reset(self):
+        with self._lock:
+            self._clients = {}
+
+
+connections = ConnectionManager()
+
+
+def client_options(config):
+    options = {}
+    for key, (option, option_type) in CLIENT_OPTIONS.items():
+        if key in config:
+            options[option] = option_type(config[key])
+    return options
 
 
 def get_database():
     config_path = os.environ.get('LUNNICONFIG')
     if not config_path:
         raise "MISS CONFIGURATION"
-    with open(config_path) as f:
-        for line in f:
-            command = line[:-1]
-            command = command.split('=')
-            if command[0] == 'uri':
-                uri_path = command[1]
-    uri_path = urllib.quote_plus(uri_path)
-    client = MongoClient(uri_path)
+    config = read_config(config_path)
+    uri_path = urllib.quote_plus(config['uri'])
+    client = connections.get_client(uri_path, **client_options(config))
     db = client.lunni_test
-    return db
\ No newline at end of file
+    if id(client) not in _indexed_clients:
+        ensure_indexes(db)
+        _indexed_clients.add(id(client))
+    return db
+
+
+# The indexes are created once per client, create_index is a no-op for existing ones
+_indexed_clients = set()
+
+INDEXES = {
+    'lunni_run': [[('hash', ASCENDING), ('timestamp', ASCENDING)], [('timestamp', ASCENDING)]],
+    'lunni_method': [[('module', ASCENDING), ('qualname', ASCENDING)]],
+    'lunni_aggregate': [[('hash', ASCENDING), ('start', ASCENDING)]],
+}
+
+
+def ensure_indexes(db):
+    for collection, indexes in INDEXES.items():
+        for keys in indexes:
+            db[collection].create_index(keys)
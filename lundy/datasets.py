@@ -1,15 +1,19 @@
+import ast
 import copy
 import hashlib
 import importlib
 import inspect
 import json
+import multiprocessing
 import os
 
 
 
 import sys
+import traceback
 
-from database import get_database
+from database import get_database, read_config
+from serializer import Serializer
 
 
 def dumper(obj):
@@ -19,12 +23,168 @@ def dumper(obj):
         return obj.__dict__
 
 
+def memoized_hash(function):
+    """Property computed once and kept until the node or one of its children changes"""
+    name = function.__name__
+
+    def cached(self):
+        hashes = getattr(self, '_hashes', None)
+        if hashes is None:
+            hashes = {}
+            object.__setattr__(self, '_hashes', hashes)
+        if name not in hashes:
+            hashes[name] = function(self)
+        return hashes[name]
+    cached.__name__ = name
+    cached.__doc__ = function.__doc__
+    return property(cached)
+
+
+def intern_name(value):
+    """Names repeat all over the tree, keep a single copy of each"""
+    if isinstance(value, unicode):
+        try:
+            value = value.encode('ascii')
+        except UnicodeEncodeError:
+            return value
+    if isinstance(value, str):
+        return intern(value)
+    return value
+
+
+_type_names = {}
+
+
+def type_name(value):
+    try:
+        return _type_names[value]
+    except KeyError:
+        name = _type_names[value] = intern(str(value))
+        return name
+
+
+class NodeList(list):
+    """ Children of a LundyObject, mutating it invalidates the owner's hashes """
+    __slots__ = ('owner', )
+
+    def __init__(self, owner, items=()):
+        list.__init__(self, items)
+        self.owner = owner
+        for item in self:
+            object.__setattr__(item, '_parent', owner)
+
+    def _changed(self, items=()):
+        for item in items:
+            object.__setattr__(item, '_parent', self.owner)
+        self.owner.invalidate()
+
+    def append(self, item):
+        list.append(self, item)
+        self._changed([item])
+
+    def extend(self, items):
+        items = list(items)
+        list.extend(self, items)
+        self._changed(items)
+
+    def insert(self, index, item):
+        list.insert(self, index, item)
+        self._changed([item])
+
+    def __setitem__(self, index, item):
+        list.__setitem__(self, index, item)
+        self._changed(item if isinstance(index, slice) else [item])
+
+    def __setslice__(self, i, j, items):
+        items = list(items)
+        list.__setslice__(self, i, j, items)
+        self._changed(items)
+
+    def __iadd__(self, items):
+        self.extend(items)
+        return self
+
+    def __imul__(self, n):
+        list.__imul__(self, n)
+        self._changed()
+        return self
+
+    def __delitem__(self, index):
+        list.__delitem__(self, index)
+        self._changed()
+
+    def __delslice__(self, i, j):
+        list.__delslice__(self, i, j)
+        self._changed()
+
+    def remove(self, item):
+        list.remove(self, item)
+        self._changed()
+
+    def pop(self, *args):
+        item = list.pop(self, *args)
+        self._changed()
+        return item
+
+    def sort(self, *args, **kwargs):
+        list.sort(self, *args, **kwargs)
+        self._changed()
+
+    def reverse(self):
+        list.reverse(self)
+        self._changed()
+
+
 class LundyObject(object):
-    @property
+    """ Node of the project tree
+
+    Nodes are slotted, FIELDS are their public attributes in the order
+    to_json() puts them in. Hashes are memoized on each node. Setting a
+    public attribute or mutating the CHILDREN list drops the cached hashes
+    of the node and of all its ancestors.
+    """
+    __slots__ = ('_hashes', '_parent')
+    FIELDS = ()
+    CHILDREN = None
+    CHILD_CLASS = None
+    KEY = 'name'
+
+    def __setattr__(self, name, value):
+        if name == self.CHILDREN and not isinstance(value, NodeList):
+            value = NodeList(self, value)
+        object.__setattr__(self, name, value)
+        if not name.startswith('_'):
+            self.invalidate()
+
+    def invalidate(self):
+        node = self
+        while node is not None:
+            if getattr(node, '_hashes', None):
+                object.__setattr__(node, '_hashes', None)
+            node = getattr(node, '_parent', None)
+
+    def public_fields(self):
+        fields = {}
+        for name in self.FIELDS:
+            fields[name] = getattr(self, name)
+        return fields
+
+    def children(self):
+        return getattr(self, self.CHILDREN) if self.CHILDREN else []
+
+    def key(self):
+        """Identifies the node among its siblings"""
+        return getattr(self, self.KEY)
+
+    def update_fields(self, fields):
+        for name, value in fields.items():
+            setattr(self, name, value)
+
+    @memoized_hash
     def obj_hash(self):
         return hashlib.md5(self.name).hexdigest()
 
-    @property
+    @memoized_hash
     def family_hash(self):
         return hashlib.md5(self.to_string()).hexdigest()
 
@@ -32,51 +192,78 @@ class LundyObject(object):
     def hash(self):
         return self.obj_hash + self.family_hash
 
+    @memoized_hash
+    def merkle_hash(self):
+        """Hash of the node's own fields and its children's merkle hashes
+
+        Equal merkle hashes mean equal subtrees, so two trees can be compared
+        by descending only into children whose merkle hashes differ.
+        """
+        digest = hashlib.md5(json.dumps(sorted(self.to_json(allow_child=False).items())))
+        for child in self.children():
+            digest.update(child.merkle_hash)
+        return digest.hexdigest()
+
     def to_string(self):
         obj = self.to_json()
         return json.dumps(obj)
 
 
 class LundyArg(LundyObject):
+    FIELDS = ('name', 'default', 'type')
+    __slots__ = FIELDS
     type_mapping = {u"<type 'str'>": str,
                     u"<type 'NoneType'>": type(None),
                     u"<type 'int'>": int,
                     None: None}
 
     def __init__(self, name, default=None, type=None):
-        self.name = name
+        self.name = intern_name(name)
         self.default = default
         self.type = type
 
     def to_json(self, allow_child=True):
-        obj = copy.copy(self)
-        if self.type:
-            obj.type = str(obj.type)
-        return obj.__dict__
+        return {'name': self.name,
+                'default': self.default,
+                'type': type_name(self.type) if self.type else self.type}
 
     def __eq__(self, other):
-        return self.__dict__ == other.__dict__
+        return self.public_fields() == other.public_fields()
 
-    @property
+    def update_fields(self, fields):
+        fields = dict(fields)
+        if 'type' in fields:
+            fields['type'] = LundyArg.type_mapping.get(fields['type'], fields['type'])
+        LundyObject.update_fields(self, fields)
+
+    @memoized_hash
     def obj_hash(self):
         return hashlib.md5(self.to_string()).hexdigest()
 
     @classmethod
     def from_string(cls, str):
-        json_from_str = json.loads(str)
+        return cls.from_dict(json.loads(str))
+
+    @classmethod
+    def from_dict(cls, json_from_str):
         name = json_from_str['name']
         lundy_arg = LundyArg(name)
 
         arg_type = json_from_str['type']
-        lundy_arg.type = LundyArg.type_mapping.get(arg_type)
+        lundy_arg.type = LundyArg.type_mapping.get(arg_type) or intern_name(arg_type)
         if lundy_arg.type:
             lundy_arg.default = json_from_str['default']
         return lundy_arg
 
 
 class LundyMethod(LundyObject):
+    FIELDS = ('name', 'args')
+    __slots__ = FIELDS
+    CHILDREN = 'args'
+    CHILD_CLASS = LundyArg
+
     def __init__(self, name):
-        self.name = name
+        self.name = intern_name(name)
         self.args = []
 
     def scan(self, obj):
@@ -92,24 +279,41 @@ class LundyMethod(LundyObject):
                 lundy_arg = LundyArg(arg, default, type(default))
                 self.args.append(lundy_arg)
 
+    def scan_node(self, node):
+        """Static counterpart of scan() for an ast.FunctionDef
+
+        Defaults which are not literals can't be evaluated without running
+        the code, their args are recorded without a default.
+        """
+        args = [getattr(arg, 'arg', None) or getattr(arg, 'id', None) for arg in node.args.args]
+        defaults = node.args.defaults
+        for arg in args[:len(args) - len(defaults)]:
+            self.args.append(LundyArg(arg))
+        for arg, default_node in zip(args[len(args) - len(defaults):], defaults):
+            try:
+                default = ast.literal_eval(default_node)
+            except ValueError:
+                self.args.append(LundyArg(arg))
+                continue
+            self.args.append(LundyArg(arg, default, type(default)))
+
     def to_json(self, allow_child=True):
-        obj = copy.copy(self)
-        obj.args = []
-        if allow_child:
-            for arg in self.args:
-                obj.args.append(arg.to_json())
-        return obj.__dict__
+        return {'name': self.name,
+                'args': [arg.to_json() for arg in self.args] if allow_child else []}
 
     def __eq__(self, other):
         return all([arg for arg in self.args if arg in other.args]) and self.name == other.name
 
     @classmethod
     def from_string(cls, str):
-        json_from_str = json.loads(str)
+        return cls.from_dict(json.loads(str))
+
+    @classmethod
+    def from_dict(cls, json_from_str):
         name = json_from_str['name']
         args = []
         for arg in json_from_str['args']:
-            lundy_arg = LundyArg.from_string(json.dumps(arg))
+            lundy_arg = LundyArg.from_dict(arg)
             args.append(lundy_arg)
 
         lundy_method = LundyMethod(name)
@@ -118,8 +322,13 @@ class LundyMethod(LundyObject):
 
 
 class LundyClass(LundyObject):
+    FIELDS = ('name', 'methods')
+    __slots__ = FIELDS
+    CHILDREN = 'methods'
+    CHILD_CLASS = LundyMethod
+
     def __init__(self, name):
-        self.name = name
+        self.name = intern_name(name)
         self.methods = []
 
     def scan(self, obj):
@@ -128,24 +337,45 @@ class LundyClass(LundyObject):
             lundy_method.scan(method_obj)
             self.methods.append(lundy_method)
 
+    def scan_node(self, node):
+        """Static counterpart of scan() for an ast.ClassDef
+
+        Matches scan() for classes without bases, members inherited from
+        base classes are not known without importing them.
+        """
+        members = {'__doc__': None, '__module__': None}
+        for statement in node.body:
+            if isinstance(statement, ast.FunctionDef):
+                members[statement.name] = statement
+            elif isinstance(statement, ast.ClassDef):
+                members[statement.name] = None
+            elif isinstance(statement, ast.Assign):
+                for target in statement.targets:
+                    if isinstance(target, ast.Name):
+                        members[target.id] = None
+        for method_name in sorted(members):
+            lundy_method = LundyMethod(method_name)
+            if members[method_name]:
+                lundy_method.scan_node(members[method_name])
+            self.methods.append(lundy_method)
+
     def to_json(self, allow_child=True):
-        obj = copy.copy(self)
-        obj.methods = []
-        if allow_child:
-            for method in self.methods:
-                obj.methods.append(method.to_json())
-        return obj.__dict__
+        return {'name': self.name,
+                'methods': [method.to_json() for method in self.methods] if allow_child else []}
 
     def __eq__(self, other):
         return all([method for method in self.methods if method in other.methods]) and self.name == other.name
 
     @classmethod
     def from_string(cls, str):
-        json_from_str = json.loads(str)
+        return cls.from_dict(json.loads(str))
+
+    @classmethod
+    def from_dict(cls, json_from_str):
         name = json_from_str['name']
         methods = []
         for method in json_from_str['methods']:
-            lundy_method = LundyMethod.from_string(json.dumps(method))
+            lundy_method = LundyMethod.from_dict(method)
             methods.append(lundy_method)
 
         lundy_class = LundyClass(name)
@@ -155,6 +385,12 @@ class LundyClass(LundyObject):
 
 class LundyModule(LundyObject):
     FORBIDDEN_CLASSES = ['Lundy']
+    FIELDS = ('py_path', 'os_path', 'classes')
+    __slots__ = FIELDS
+    CHILDREN = 'classes'
+    CHILD_CLASS = LundyClass
+    KEY = 'os_path'
+
     def __init__(self, py_path, os_path):
         self.py_path = py_path
         self.os_path = os_path
@@ -164,14 +400,11 @@ class LundyModule(LundyObject):
         return "[LundyModule] {}".format(self.py_path)
 
     def to_json(self, allow_child=True):
-        obj = copy.copy(self)
-        obj.classes = []
-        if  allow_child:
-            for cls in self.classes:
-                obj.classes.append(cls.to_json())
-        return obj.__dict__
+        return {'py_path': self.py_path,
+                'os_path': self.os_path,
+                'classes': [cls.to_json() for cls in self.classes] if allow_child else []}
 
-    @property
+    @memoized_hash
     def obj_hash(self):
         return hashlib.md5(self.py_path + self.os_path).hexdigest()
 
@@ -184,17 +417,35 @@ class LundyModule(LundyObject):
             lundy_class.scan(obj)
             self.classes.append(lundy_class)
 
+    def scan_source(self, source):
+        """Static counterpart of scan(), parses the module source instead of importing it
+
+        Only classes defined at the module's top level are found.
+        """
+        tree = ast.parse(source, self.os_path)
+        class_nodes = {}
+        for node in tree.body:
+            if isinstance(node, ast.ClassDef) and node.name not in self.FORBIDDEN_CLASSES:
+                class_nodes[node.name] = node
+        for name in sorted(class_nodes):
+            lundy_class = LundyClass(name)
+            lundy_class.scan_node(class_nodes[name])
+            self.classes.append(lundy_class)
+
     def __eq__(self, other):
         return all([cls for cls in self.classes if cls in other.classes]) and self.py_path == other.py_path and self.os_path == other.os_path
 
     @classmethod
     def from_string(cls, str):
-        json_from_str = json.loads(str)
+        return cls.from_dict(json.loads(str))
+
+    @classmethod
+    def from_dict(cls, json_from_str):
         py_path = json_from_str['py_path']
         os_path = json_from_str['os_path']
         classes = []
         for class_string in json_from_str['classes']:
-            lundy_class = LundyClass.from_string(json.dumps(class_string))
+            lundy_class = LundyClass.from_dict(class_string)
             classes.append(lundy_class)
 
         lundy_module = LundyModule(py_path, os_path)
@@ -204,62 +455,150 @@ class LundyModule(LundyObject):
 
 class LundyProject(LundyObject):
     MODULE_SEP = '.'
+    SCAN_MODES = ('import', 'static')
+    FIELDS = ('name', 'modules')
+    __slots__ = FIELDS
+    CHILDREN = 'modules'
+    CHILD_CLASS = LundyModule
 
     def __init__(self, name):
         self.name = name
         self.modules = []
 
-    def scan(self, src):
-        sys.path.append(src)
+    def scan(self, src, mode='import', cache=None, workers=None):
+        """
+        :param src: project source directory
+        :param mode: 'import' imports every module and inspects it, 'static'
+            parses the sources with ast without executing them
+        :param cache: ScanCache, only new and changed modules are scanned
+        :param workers: number of processes scanning modules, modules are
+            merged in path order so the result doesn't depend on it
+        """
+        self.modules.extend(self.iter_scan(src, mode, cache, workers))
+
+    def iter_scan(self, src, mode='import', cache=None, workers=None):
+        """Yield the scanned modules one at a time in path order, see scan()
+
+        The modules are not added to the project.
+        """
+        if mode not in self.SCAN_MODES:
+            raise ValueError("Unknown scan mode {}".format(mode))
+        if mode == 'import':
+            sys.path.append(src)
+        paths = list(self.iter_module_paths(src))
+        # only which modules are cached, their entries are read from the cache as they're yielded
+        cached_indexes = set()
+        tasks = []
+        for index, (full_module_path, os_module_path, project_module_path) in enumerate(paths):
+            if cache and cache.lookup(os_module_path, full_module_path):
+                cached_indexes.add(index)
+            else:
+                tasks.append((mode, ) + paths[index])
+
+        pool = None
+        if workers and workers > 1 and len(tasks) > 1:
+            pool = multiprocessing.Pool(workers)
+            chunksize = max(1, len(tasks) // (workers * 4))
+            scanned = (LundyModule.from_dict(module_json)
+                       for module_json in pool.imap(scan_module_json, tasks, chunksize))
+        else:
+            scanned = (scan_module(*task) for task in tasks)
+        try:
+            for index, (full_module_path, os_module_path, _) in enumerate(paths):
+                if index in cached_indexes:
+                    yield LundyModule.from_dict(cache.entries[os_module_path]['module'])
+                    continue
+                module = next(scanned)
+                if cache:
+                    cache.store(os_module_path, full_module_path, module)
+                yield module
+        finally:
+            if pool:
+                pool.terminate()
+                pool.join()
+        if cache:
+            cache.prune([os_module_path for _, os_module_path, _ in paths])
+
+    def iter_module_paths(self, src):
+        """Yield (full path, path relative to src, python path) of every project module"""
         for dirpath, dirnames, filenames in os.walk(src):
+            # sorted, os.walk order depends on the filesystem and the project hash on module order
+            dirnames.sort()
             if '__init__.py' not in filenames:
                 continue
-            for filename in filenames:
+            for filename in sorted(filenames):
                 if filename == '__init__.py' or filename.endswith('.pyc'):
                     continue
                 full_module_path = os.path.join(dirpath, filename)
                 os_module_path = os.path.relpath(full_module_path, src)
                 project_module_path = os_module_path.replace(os.sep, self.MODULE_SEP).replace('.py', '')
-
-                importlib.import_module(project_module_path)
-                module = LundyModule(project_module_path, os_module_path)
-                module.scan()
-                self.modules.append(module)
+                yield full_module_path, os_module_path, project_module_path
 
     def to_json(self, allow_child=True):
-        obj = copy.copy(self)
-        obj.modules = []
-        if allow_child:
-            for mod in self.modules:
-                obj.modules.append(mod.to_json())
-        return obj.__dict__
+        return {'name': self.name,
+                'modules': [mod.to_json() for mod in self.modules] if allow_child else []}
 
     def __eq__(self, other):
         return all([module for module in self.modules if module in other.modules]) and self.name == other.name
 
     @classmethod
     def from_string(cls, str):
-        json_from_str = json.loads(str)
+        return cls.from_dict(json.loads(str))
+
+    @classmethod
+    def from_dict(cls, json_from_str):
         name = json_from_str['name']
         modules = []
         for module in json_from_str['modules']:
-            lundy_module = LundyModule.from_string(json.dumps(module))
+            lundy_module = LundyModule.from_dict(module)
             modules.append(lundy_module)
 
         lundy_project = LundyProject(name)
         lundy_project.modules = modules
         return lundy_project
 
+
+def scan_module(mode, full_module_path, os_module_path, project_module_path):
+    module = LundyModule(project_module_path, os_module_path)
+    if mode == 'static':
+        with open(full_module_path) as f:
+            module.scan_source(f.read())
+    else:
+        module.scan()
+    return module
+
+
+def scan_module_json(task):
+    """Scan a module in a worker process, serialized to be sent back"""
+    return scan_module(*task).to_json()
+
+
+_serializer = None
+
+
+def get_serializer():
+    global _serializer
+    if _serializer is None:
+        _serializer = Serializer.from_config(read_config())
+    return _serializer
+
+
 class ResultPackage:
-    def __init__(self, name, args, kwargs, result, hash, start_time, duration):
+    def __init__(self, name, args, kwargs, result, hash, start_time, duration, duration_ns=None,
+                 cpu_time=None, allocations=None, exception=None):
         """
         :param name: string
         :param args: tuple
         :param kwargs:
         :param result:
         :param hash:
-        :param start_time:
-        :param duration:
+        :param start_time: wall clock datetime of the call
+        :param duration: seconds
+        :param duration_ns: nanoseconds from a monotonic clock
+        :param cpu_time: thread CPU time in nanoseconds
+        :param allocations: net change of allocated memory blocks
+        :param exception: exception_info() of the exception the call raised,
+            the durations are then measured until the raise
         """
         self.name = name
         self.args = args
@@ -267,30 +606,14 @@ class ResultPackage:
         self.result = result
         self.timestamp = start_time
         self.duration = duration
+        self.duration_ns = duration_ns
+        self.cpu_time = cpu_time
+        self.allocations = allocations
+        self.exception = exception
         self.hash = hash
 
     def args_to_json(self, args):
-        if type(args) is list:
-            new_args = []
-            for arg in args:
-                new_args.append(self.args_to_json(arg))
-        elif type(args) is tuple:
-            new_args = ()
-            for arg in args:
-                new_args += (self.args_to_json(arg), )
-        elif type(args) is dict:
-            new_args = {}
-            for key, value in args.items():
-                new_args[key] = self.args_to_json(value)
-        elif str(type(args)) == "<type 'instance'>" or getattr(args,'__dict__', None):
-            new_args = {}
-            for key, value in self.args_to_json(args.__dict__).items():
-                new_args[key] = value
-        elif str(type(args)) in ["<type 'NoneType'>", "<type 'type'>"]:
-            new_args = 'type'
-        else:
-            new_args = args
-        return new_args
+        return get_serializer().serialize(args)
 
     def to_json(self):
         obj = copy.copy(self)
@@ -302,7 +625,57 @@ class ResultPackage:
         obj = self.to_json()
         return json.dumps(obj)
 
+    def to_document(self):
+        """Run document referencing its method in lunni_method by hash"""
+        return {'hash': self.hash,
+                'timestamp': self.timestamp,
+                'data': {'args': self.args_to_json(self.args),
+                         'kwargs': self.args_to_json(self.kwargs),
+                         'result': self.args_to_json(self.result),
+                         'duration': self.duration,
+                         'duration_ns': self.duration_ns,
+                         'cpu_time': self.cpu_time,
+                         'allocations': self.allocations,
+                         'exception': self.exception}}
+
     def save(self):
         db = get_database()
-        data = self.to_json()
-        db.lunni_run.insert({'hash': self.hash, 'data': data})
+        db.lunni_run.insert(self.to_document())
+
+
+# Collections whose documents are stored once by _id, method signatures and payload blobs
+UPSERT_COLLECTIONS = frozenset(['lunni_method', 'lunni_blob'])
+
+
+TRACEBACK_FRAMES = 20
+TRACEBACK_BYTES = 4096
+
+
+def exception_info(exc_info):
+    """Type, message and the innermost frames of the traceback of an exception"""
+    exc_type, exc_value, exc_traceback = exc_info
+    frames = traceback.extract_tb(exc_traceback)[-TRACEBACK_FRAMES:]
+    formatted = ''.join(traceback.format_list(frames))
+    if len(formatted) > TRACEBACK_BYTES:
+        formatted = formatted[-TRACEBACK_BYTES:]
+    try:
+        message = unicode(exc_value)
+    except Exception:
+        message = repr(exc_value)
+    return {'type': '{}.{}'.format(exc_type.__module__, exc_type.__name__),
+            'message': message[:TRACEBACK_BYTES],
+            'traceback': formatted}
+
+
+def insert_documents(batch):
+    """Bulk insert (collection, document) pairs, one insert per collection"""
+    db = get_database()
+    collections = {}
+    for collection, document in batch:
+        collections.setdefault(collection, []).append(document)
+    for collection, documents in collections.items():
+        if collection in UPSERT_COLLECTIONS:
+            for document in documents:
+                db[collection].update_one({'_id': document['_id']}, {'$setOnInsert': document}, upsert=True)
+        else:
+            db[collection].insert_many(documents, ordered=False)
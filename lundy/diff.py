@@ -0,0 +1,94 @@
+""" Structural diff of two versions of a project tree
+
+A delta describes how to turn one node into another:
+
+    {'key': 'sample_class.py',
+     'fields': {...},            # own fields that changed
+     'added': [{...}, ...],      # to_json() of new children
+     'removed': ['name', ...],   # keys of children that are gone
+     'changed': [{...}, ...],    # deltas of children present in both
+     'order': ['name', ...]}     # keys of all children, only if reordered
+
+Only the parts that differ are present. Children are matched by key, the
+os_path of a module and the name of anything else, and subtrees with equal
+merkle hashes are skipped without being walked.
+"""
+
+
+def index(nodes):
+    return dict((node.key(), node) for node in nodes)
+
+
+def diff_nodes(old, new):
+    """Delta turning `old` into `new`, None when they are equal"""
+    if old.merkle_hash == new.merkle_hash:
+        return None
+    delta = {'key': old.key()}
+    old_fields = old.to_json(allow_child=False)
+    fields = {}
+    for name, value in new.to_json(allow_child=False).items():
+        if name != new.CHILDREN and old_fields.get(name) != value:
+            fields[name] = value
+    if fields:
+        delta['fields'] = fields
+    if new.CHILDREN:
+        delta.update(diff_children(old.children(), new.children()))
+    return delta
+
+
+def diff_children(old_children, new_children):
+    old_index = index(old_children)
+    new_index = index(new_children)
+    added = []
+    changed = []
+    for child in new_children:
+        old_child = old_index.get(child.key())
+        if old_child is None:
+            added.append(child.to_json())
+            continue
+        child_delta = diff_nodes(old_child, child)
+        if child_delta:
+            changed.append(child_delta)
+    removed = [child.key() for child in old_children if child.key() not in new_index]
+
+    delta = {}
+    if added:
+        delta['added'] = added
+    if removed:
+        delta['removed'] = removed
+    if changed:
+        delta['changed'] = changed
+    # apply_delta keeps the old order and appends added children
+    new_order = [child.key() for child in new_children]
+    kept_order = [child.key() for child in old_children if child.key() in new_index]
+    added_order = [child.key() for child in new_children if child.key() not in old_index]
+    if kept_order + added_order != new_order:
+        delta['order'] = new_order
+    return delta
+
+
+def diff_projects(old, new):
+    """Delta between two LundyProject versions, an empty dict when they are equal"""
+    return diff_nodes(old, new) or {}
+
+
+def apply_delta(node, delta):
+    """Change `node` in place as described by `delta`"""
+    if 'fields' in delta:
+        node.update_fields(delta['fields'])
+    if not node.CHILDREN:
+        return node
+    children = node.children()
+    removed = set(delta.get('removed', ()))
+    if removed:
+        children[:] = [child for child in children if child.key() not in removed]
+    if 'changed' in delta:
+        children_index = index(children)
+        for child_delta in delta['changed']:
+            apply_delta(children_index[child_delta['key']], child_delta)
+    for child_json in delta.get('added', ()):
+        children.append(node.CHILD_CLASS.from_dict(child_json))
+    if 'order' in delta:
+        children_index = index(children)
+        children[:] = [children_index[key] for key in delta['order']]
+    return node
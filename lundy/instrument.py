@@ -0,0 +1,142 @@
+""" Import hook wrapping the functions and methods selected in .lunni
+
+    instrument=myapp.db.*,myapp.cache:Cache.get*
+    instrument_exclude=myapp.db.migrations*,myapp.db.query:*.__repr__
+
+Patterns are `module glob[:qualname glob]`, the qualname of a method is
+`Class.method`, a pattern without qualname selects everything in the
+module. Functions and methods defined in a module matching an `instrument`
+pattern and no `instrument_exclude` pattern are wrapped with
+method_wrapper() when the module is imported, with the sampling and
+measurement options of .lunni. Other modules are imported as usual and
+left untouched.
+
+install() adds the hook, e.g. from sitecustomize.py, and does nothing when
+.lunni has no instrument key, so instrumentation is turned off by editing
+the config.
+"""
+import fnmatch
+import imp
+import importlib
+import inspect
+import re
+import sys
+import threading
+
+from database import read_config
+from main import measure_options, method_wrapper
+from sampling import SamplingPolicy
+
+
+def parse_patterns(value):
+    """(module regex, qualname regex) pairs of a comma separated pattern list"""
+    patterns = []
+    for pattern in (value or '').split(','):
+        pattern = pattern.strip()
+        if not pattern:
+            continue
+        module, _, qualname = pattern.partition(':')
+        patterns.append((re.compile(fnmatch.translate(module)), re.compile(fnmatch.translate(qualname or '*'))))
+    return patterns
+
+
+class InstrumentHook(object):
+    """ sys.meta_path finder and loader of the modules to instrument """
+    lundy_instrument = True
+
+    def __init__(self, include, exclude=(), config=None):
+        self.include = include
+        self.exclude = exclude
+        self.config = config or {}
+        self.wrapped = 0
+        self._loading = threading.local()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(parse_patterns(config.get('instrument')), parse_patterns(config.get('instrument_exclude')),
+                   config)
+
+    def matches_module(self, module_name):
+        return any(module.match(module_name) for module, _ in self.include)
+
+    def matches(self, module_name, qualname):
+        return (any(module.match(module_name) and name.match(qualname) for module, name in self.include) and
+                not any(module.match(module_name) and name.match(qualname) for module, name in self.exclude))
+
+    def find_module(self, fullname, path=None):
+        if fullname in self._loading.__dict__ or not self.matches_module(fullname):
+            return None
+        # Python 2 tries `import os` in package `app` as app.os first, a name that must stay unclaimed
+        try:
+            found = imp.find_module(fullname.rpartition('.')[2], path)
+        except ImportError:
+            return None
+        if found[0] is not None:
+            found[0].close()
+        return self
+
+    def load_module(self, fullname):
+        # the regular import machinery loads the module, this hook steps aside meanwhile
+        self._loading.__dict__[fullname] = True
+        try:
+            module = importlib.import_module(fullname)
+        finally:
+            del self._loading.__dict__[fullname]
+        self.instrument(module)
+        return module
+
+    def instrument(self, module):
+        """Wrap the selected functions and methods defined in `module`"""
+        module_name = module.__name__
+        for name, obj in list(vars(module).items()):
+            if getattr(obj, '__module__', None) != module_name:
+                continue
+            if inspect.isfunction(obj) and self.matches(module_name, name):
+                setattr(module, name, self.wrap(obj, name))
+            elif inspect.isclass(obj):
+                self.instrument_class(obj, module_name)
+
+    def instrument_class(self, cls, module_name):
+        for name, attribute in list(vars(cls).items()):
+            qualname = '{}.{}'.format(cls.__name__, name)
+            if isinstance(attribute, (staticmethod, classmethod)):
+                function = attribute.__func__
+            else:
+                function = attribute
+            if not inspect.isfunction(function) or not self.matches(module_name, qualname):
+                continue
+            wrapped = self.wrap(function, qualname)
+            if isinstance(attribute, (staticmethod, classmethod)):
+                wrapped = type(attribute)(wrapped)
+            setattr(cls, name, wrapped)
+
+    def wrap(self, function, qualname):
+        if hasattr(function, 'lundy_signature'):
+            return function
+        policy = SamplingPolicy.from_options({}, self.config)
+        self.wrapped += 1
+        return method_wrapper(function, policy, qualname=qualname, **measure_options({}, self.config))
+
+
+def install(config=None):
+    """Add the hook configured in .lunni, returns it, None when nothing is to be instrumented
+
+    Matching modules imported before the hook was installed are instrumented
+    right away.
+    """
+    if config is None:
+        config = read_config()
+    hook = InstrumentHook.from_config(config)
+    if not hook.include:
+        return None
+    uninstall()
+    sys.meta_path.insert(0, hook)
+    for module_name, module in list(sys.modules.items()):
+        if module is not None and hook.matches_module(module_name):
+            hook.instrument(module)
+    return hook
+
+
+def uninstall():
+    """Remove the hook, modules already instrumented stay so"""
+    sys.meta_path[:] = [finder for finder in sys.meta_path if not getattr(finder, 'lundy_instrument', False)]
@@ -0,0 +1,106 @@
+""" Loading stored project snapshots
+
+load_project - the whole tree from one json.load
+iter_modules - modules of a project JSON file one at a time, the file is
+               read in chunks and never held in memory as a whole
+stream_project - LundyProject built from iter_modules
+"""
+import json
+
+from datasets import LundyModule, LundyProject
+
+WHITESPACE = ' \t\n\r'
+
+
+def load_project(f):
+    return LundyProject.from_dict(json.load(f))
+
+
+class _Reader(object):
+    """Decodes consecutive JSON values from a file read in chunks"""
+    def __init__(self, f, chunk_size):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.position = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _read(self):
+        # at least doubles the buffer so a value spanning many chunks isn't decoded over and over
+        chunk = self.f.read(max(self.chunk_size, len(self.buffer) - self.position))
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        return True
+
+    def char(self):
+        """Next character which is not whitespace, it is not consumed"""
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position] in WHITESPACE:
+                self.position += 1
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self._read():
+                raise ValueError("Unexpected end of project JSON")
+
+    def expect(self, chars):
+        char = self.char()
+        if char not in chars:
+            raise ValueError("Expected one of {!r} at {!r}".format(chars, self.buffer[self.position:][:20]))
+        self.position += 1
+        return char
+
+    def value(self):
+        self.char()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+            except ValueError:
+                if self._read():
+                    continue
+                raise
+            # a number at the end of the buffer may continue in the next chunk
+            if end < len(self.buffer) or self.eof or not self._read():
+                self.position = end
+                return value
+
+
+def iter_modules(f, chunk_size=65536, fields=None):
+    """Yield the LundyModules of a project JSON file in order
+
+    :param fields: dict filled with the project's other fields, e.g. its
+        name, as they are read
+    """
+    reader = _Reader(f, chunk_size)
+    reader.expect('{')
+    if reader.char() == '}':
+        return
+    while True:
+        key = reader.value()
+        reader.expect(':')
+        if key == 'modules':
+            reader.expect('[')
+            if reader.char() == ']':
+                reader.position += 1
+            else:
+                while True:
+                    yield LundyModule.from_dict(reader.value())
+                    if reader.expect(',]') == ']':
+                        break
+        elif fields is not None:
+            fields[key] = reader.value()
+        else:
+            reader.value()
+        if reader.expect(',}') == '}':
+            return
+
+
+def stream_project(f, chunk_size=65536):
+    fields = {}
+    modules = list(iter_modules(f, chunk_size, fields))
+    project = LundyProject(fields['name'])
+    project.modules = modules
+    return project
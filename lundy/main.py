@@ -1,10 +1,21 @@
 import datetime
+import hashlib
 import inspect
+import logging
 import os
+import sys
+import weakref
 
 from boltons.funcutils import wraps
 
-from datasets import LundyMethod, ResultPackage
+from aggregate import get_aggregator
+from clock import allocated_blocks, monotonic_ns, thread_cpu_ns
+from database import read_config
+from datasets import LundyMethod, ResultPackage, exception_info
+from sampling import SamplingPolicy
+from shipper import get_shipper
+
+logger = logging.getLogger(__name__)
 
 
 class Lundy:
@@ -20,6 +31,28 @@ class Lundy:
     @Lundy.collector()
     class class1():
         pass
+
+    Only a sample of the calls can be recorded, see SamplingPolicy:
+
+    @Lundy.collector(sample_rate=0.01, slow_ms=50)
+    def method2:
+        pass
+
+    CPU time and allocated memory blocks per call are recorded on request:
+
+    @Lundy.collector(cpu_time=True, allocations=True)
+    def method3:
+        pass
+
+    Per method statistics can be kept instead of recording calls, see
+    lundy.aggregate:
+
+    @Lundy.collector(aggregate=True)
+    def method4:
+        pass
+
+    A call returning a future (asyncio, Tornado, concurrent.futures) is
+    recorded when the future completes, with its result or exception.
     """
     @staticmethod
     def collector(*spec_args, **spec_kwargs):
@@ -27,40 +60,274 @@ class Lundy:
         if config:
             os.environ['LUNNICONFIG'] = config
         def collector_decorator(obj):
+            policy_options = (spec_kwargs, read_config())
+            measure = measure_options(*policy_options)
             if inspect.isfunction(obj):
-                return method_wrapper(obj)
+                return method_wrapper(obj, SamplingPolicy.from_options(*policy_options), **measure)
             elif inspect.isclass(obj):
                 for method in obj.__dict__:
                     method_object = getattr(obj, method)
                     if inspect.ismethod(method_object):
-                        setattr(obj, method, method_wrapper(method_object))
+                        policy = SamplingPolicy.from_options(*policy_options)
+                        setattr(obj, method, method_wrapper(method_object, policy, **measure))
                 return obj
         return collector_decorator
 
+    @staticmethod
+    def invalidate_signatures():
+        """Drop every cached method signature, e.g. after reloading code"""
+        for wrapper in list(_wrappers):
+            wrapper.lundy_signature.invalidate()
+
+    @staticmethod
+    def sampling_stats():
+        """Sampled, slow and dropped call counters per wrapped method"""
+        stats = {}
+        for wrapper in list(_wrappers):
+            method_stats = stats.setdefault(wrapper.lundy_signature.name(), {'sampled': 0, 'slow': 0, 'dropped': 0})
+            for key, value in wrapper.lundy_policy.stats().items():
+                method_stats[key] += value
+        return stats
+
+
+_wrappers = weakref.WeakSet()
+
+MEASURE_OPTIONS = ('cpu_time', 'allocations', 'aggregate')
+
+
+def measure_options(options, config):
+    """Optional per call measurements and aggregate mode, enabled by the collector or .lunni"""
+    measure = {}
+    for key in MEASURE_OPTIONS:
+        value = options.get(key, config.get(key))
+        measure[key] = value in (True, '1', 'true', 'yes')
+    return measure
+
+
+class MethodSignature(object):
+    """ Scanned LundyMethod and hash of a wrapped method
+
+    The hash identifies the method, md5 of its module.qualname followed by
+    the signature hash of the LundyMethod, so same-named methods with the
+    same args in different classes or modules are told apart. Computed on
+    first use and kept until invalidated, either explicitly or because the
+    method's code or defaults were replaced.
+    """
+    def __init__(self, obj, qualname=None):
+        self.obj = obj
+        self._qualname = qualname
+        self._searched_size = None
+        self.invalidate()
+
+    def invalidate(self):
+        self.code = None
+        self.defaults = None
+        self.method = None
+        self.hash = None
+        self.hashed_name = None
+
+    def qualname(self):
+        if self._qualname:
+            return self._qualname
+        qualname = getattr(self.obj, '__qualname__', None)
+        if qualname:
+            return qualname
+        owner = getattr(self.obj, 'im_class', None)
+        if owner is not None:
+            return '{}.{}'.format(owner.__name__, self.obj.__name__)
+        # a function decorated in a class body is found once its class is bound in the module, a
+        # search that found nothing is only run again once the module gained or lost names
+        module = sys.modules.get(self.obj.__module__)
+        module_size = len(vars(module)) if module is not None else None
+        if module_size is not None and module_size == self._searched_size:
+            return self.obj.__name__
+        qualname = find_class_member(self.obj)
+        if qualname:
+            self._qualname = qualname
+            return qualname
+        self._searched_size = module_size
+        return self.obj.__name__
+
+    def name(self):
+        """module.qualname of the method, tells apart same-named methods of different classes"""
+        return '{}.{}'.format(self.obj.__module__, self.qualname())
+
+    def document(self):
+        """lunni_method document of the method, keyed by its hash"""
+        self.get_hash()
+        return {'_id': self.hash,
+                'hash': self.hash,
+                'signature_hash': self.method.hash,
+                'name': self.obj.__name__,
+                'module': self.obj.__module__,
+                'qualname': self.qualname(),
+                'args': [arg.to_json() for arg in self.method.args]}
+
+    def get_hash(self):
+        code = getattr(self.obj, '__code__', None)
+        defaults = getattr(self.obj, '__defaults__', None)
+        name = self.name()
+        if self.hash is None or code is not self.code or defaults is not self.defaults or name != self.hashed_name:
+            lundy_method = LundyMethod(self.obj.__name__)
+            lundy_method.scan(self.obj)
+            self.method = lundy_method
+            self.hash = hashlib.md5(name).hexdigest() + lundy_method.hash
+            self.hashed_name = name
+            self.code = code
+            self.defaults = defaults
+        return self.hash
+
+
+def find_class_member(function):
+    """Class.name of a function defined in a class of its module, None if there's none"""
+    module = sys.modules.get(function.__module__)
+    if module is None:
+        return None
+    for owner in list(vars(module).values()):
+        if not inspect.isclass(owner) or getattr(owner, '__module__', None) != module.__name__:
+            continue
+        for name, attribute in list(vars(owner).items()):
+            if isinstance(attribute, (staticmethod, classmethod)):
+                attribute = attribute.__func__
+            if attribute is function or getattr(attribute, '__wrapped__', None) is function:
+                return '{}.{}'.format(owner.__name__, name)
+    return None
+
+
+# Hashes of the methods this process already sent to lunni_method
+_stored_methods = set()
+
+
+def store_method(signature, block=True):
+    method_hash = signature.get_hash()
+    if method_hash not in _stored_methods:
+        _stored_methods.add(method_hash)
+        # sent again with a later run if this document never reaches the database
+        get_shipper().put('lunni_method', signature.document(), block=block,
+                          on_lost=lambda: _stored_methods.discard(method_hash))
+    return method_hash
+
+
+def is_future(value):
+    """Whether a call returned a future, duck typed so no event loop library is needed"""
+    return (callable(getattr(value, 'add_done_callback', None)) and
+            callable(getattr(value, 'exception', None)) and callable(getattr(value, 'cancelled', None)))
+
+
+def future_outcome(future):
+    """(result, exc_info) of a done future, None if it was cancelled"""
+    if future.cancelled():
+        return None
+    error = future.exception()
+    if error is None:
+        return future.result(), None
+    return None, (type(error), error, getattr(error, '__traceback__', None))
+
+
+def blocks_delta(start_blocks):
+    if start_blocks is None:
+        return None
+    return allocated_blocks() - start_blocks
+
+
+def end_measurements(start, start_cpu, start_blocks):
+    """Duration, CPU time and allocations of a call, read as soon as it ends so Lundy's own work isn't counted"""
+    duration_ns = monotonic_ns() - start
+    cpu_ns = thread_cpu_ns() - start_cpu if start_cpu is not None else None
+    return duration_ns, cpu_ns, blocks_delta(start_blocks)
+
+
+def method_wrapper(obj, policy=None, cpu_time=False, allocations=False, aggregate=False, qualname=None):
+    signature = MethodSignature(obj, qualname)
+    if policy is None:
+        policy = SamplingPolicy()
+
+    @wraps(obj)
+    def aggregate_wrapper(*args, **kwargs):
+        stats = get_aggregator().stats(store_method(signature), signature.hashed_name)
+        start = monotonic_ns()
+        try:
+            result = obj(*args, **kwargs)
+        except Exception:
+            stats.record(monotonic_ns() - start, error=True)
+            raise
+        if is_future(result):
+            def done(future):
+                outcome = future_outcome(future)
+                if outcome is not None:
+                    stats.record(monotonic_ns() - start, error=outcome[1] is not None)
+            result.add_done_callback(done)
+            return result
+        stats.record(monotonic_ns() - start)
+        return result
 
-def method_wrapper(obj):
     @wraps(obj)
     def func_wrapper(*args, **kwargs):
+        sampled = policy.sample(signature)
+        if not sampled and policy.slow_ms is None:
+            policy.drop()
+            return obj(*args, **kwargs)
         start_time = datetime.datetime.now()
-        # if getattr(obj, '_lundy_run_hash', False):
-        #     # TODO
-        #     print(obj._lundy_run_hash)
-        # else:
-        #     setattr(obj, '_lundy_run_hash', 'timehash')
-        result = obj(*args, **kwargs)
-        duration = (datetime.datetime.now() - start_time).total_seconds()
-        lundy_method = LundyMethod(obj.__name__)
-        lundy_method.scan(obj)
-        method_hash = lundy_method.hash
+        start_cpu = thread_cpu_ns() if cpu_time else None
+        start_blocks = allocated_blocks() if allocations else None
+        start = monotonic_ns()
+        try:
+            result = obj(*args, **kwargs)
+        except Exception:
+            measured = end_measurements(start, start_cpu, start_blocks)
+            exc_info = sys.exc_info()
+            try:
+                record(sampled, args, kwargs, None, start_time, measured, exception_info(exc_info))
+            except Exception:
+                logger.exception("Lundy could not record a failed call of %s", signature.name())
+            # re-raised explicitly, recording may have replaced the current exception
+            raise exc_info[0], exc_info[1], exc_info[2]
+        if is_future(result):
+            result.add_done_callback(lambda future: record_future(future, sampled, args, kwargs, start_time,
+                                                                  start, start_blocks))
+            return result
+        measured = end_measurements(start, start_cpu, start_blocks)
+        try:
+            record(sampled, args, kwargs, result, start_time, measured)
+        except Exception:
+            logger.exception("Lundy could not record a call of %s", signature.name())
+        return result
+
+    def record_future(future, sampled, args, kwargs, start_time, start, start_blocks):
+        # runs in the event loop or executor completing the future, which must not wait for the shipper
+        try:
+            measured = end_measurements(start, None, start_blocks)
+            outcome = future_outcome(future)
+            if outcome is None:
+                return
+            result, exc_info = outcome
+            record(sampled, args, kwargs, result, start_time, measured,
+                   exception_info(exc_info) if exc_info else None, block=False)
+        except Exception:
+            logger.exception("Lundy could not record a call of %s", signature.name())
+
+    def record(sampled, args, kwargs, result, start_time, measured, exception=None, block=True):
+        duration_ns, cpu_ns, allocated = measured
+        duration = duration_ns / 1e9
+        if not policy.keep(sampled, duration):
+            return
         m = ResultPackage(name=obj.__name__,
                    args=args,
                    kwargs=kwargs,
                    result=result,
-                   hash=method_hash,
+                   hash=store_method(signature, block),
                    start_time=start_time,
-                   duration=duration
+                   duration=duration,
+                   duration_ns=duration_ns,
+                   cpu_time=cpu_ns,
+                   allocations=allocated,
+                   exception=exception
                    )
-        m.save()
-        return result
+        get_shipper().put('lunni_run', m.to_document(), block=block)
 
+    if aggregate:
+        func_wrapper = aggregate_wrapper
+    func_wrapper.lundy_signature = signature
+    func_wrapper.lundy_policy = policy
+    _wrappers.add(func_wrapper)
     return func_wrapper
\ No newline at end of file
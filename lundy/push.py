@@ -0,0 +1,233 @@
+""" Uploads collected projects and spooled runs to Lunni
+
+Data is sent in chunks from a small pool of threads sharing a keep-alive
+session. Every chunk carries an idempotency key derived from the hashes of
+what it holds, so a chunk sent twice is recognised by the server. Keys of
+acknowledged chunks are kept in a local ledger and skipped when a push is
+run again after an interruption, or when a new version of the project
+holds the same chunks.
+
+Module chunks end after a module whose hash falls on a boundary, about
+every `chunk_size` modules. Since the boundaries depend on the modules and
+not on their positions, adding or removing a module only changes the chunk
+holding it.
+
+Failed requests (connection errors, timeouts, 429 and 5xx responses) are
+retried with exponential backoff, other 4xx responses fail the push.
+"""
+import collections
+import datetime
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+import requests
+
+from diff import diff_projects
+
+DEFAULT_URL = 'http://127.0.0.1:8000/api/lundy_objects/'
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+
+
+class UploadError(Exception):
+    pass
+
+
+def json_default(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    raise TypeError("{!r} is not JSON serializable".format(value))
+
+
+class Ledger(object):
+    """ Append-only file of the idempotency keys the server acknowledged
+
+    Only the `max_keys` most recent keys are kept, the file is rewritten
+    with them once it holds twice as many lines.
+    """
+    def __init__(self, path=None, max_keys=100000):
+        self.path = path
+        self.max_keys = max_keys
+        self.keys = collections.OrderedDict()
+        self._lines = 0
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    key = line.strip()
+                    if key:
+                        self._remember(key)
+                        self._lines += 1
+            if self._lines > len(self.keys):
+                self._compact()
+
+    def __contains__(self, key):
+        return key in self.keys
+
+    def add(self, key):
+        with self._lock:
+            self._remember(key)
+            if self.path:
+                with open(self.path, 'a') as f:
+                    f.write(key + '\n')
+                self._lines += 1
+                if self._lines > 2 * self.max_keys:
+                    self._compact()
+
+    def _remember(self, key):
+        self.keys.pop(key, None)
+        self.keys[key] = True
+        while len(self.keys) > self.max_keys:
+            self.keys.popitem(last=False)
+
+    def _compact(self):
+        tmp_path = '{}.{}.tmp'.format(self.path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            f.writelines(key + '\n' for key in self.keys)
+        os.rename(tmp_path, self.path)
+        self._lines = len(self.keys)
+
+
+class Progress(object):
+    def __init__(self):
+        self.chunks = 0
+        self.skipped = 0
+        self.retries = 0
+        self.bytes = 0
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    def sent(self, size):
+        with self._lock:
+            self.chunks += 1
+            self.bytes += size
+
+    def count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def report(self):
+        elapsed = max(time.time() - self.started, 1e-6)
+        return ("{} chunks sent, {} already sent, {} retries, {:.1f} KB in {:.2f}s ({:.1f} KB/s)"
+                .format(self.chunks, self.skipped, self.retries, self.bytes / 1024.0, elapsed,
+                        self.bytes / 1024.0 / elapsed))
+
+
+class Uploader(object):
+    def __init__(self, url=DEFAULT_URL, workers=4, chunk_size=50, retries=5, backoff=0.5, timeout=30,
+                 ledger_path=None, session=None):
+        self.url = url
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.ledger = Ledger(ledger_path)
+        self.progress = Progress()
+        if session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+        self.session = session
+
+    @classmethod
+    def from_config(cls, config, ledger_path=None):
+        return cls(config.get('push_url', DEFAULT_URL),
+                   workers=int(config.get('push_workers', 4)),
+                   chunk_size=int(config.get('push_chunk_size', 50)),
+                   retries=int(config.get('push_retries', 5)),
+                   backoff=float(config.get('push_backoff', 0.5)),
+                   timeout=float(config.get('push_timeout', 30)),
+                   ledger_path=ledger_path)
+
+    def push_project(self, project):
+        """Upload the modules of `project` in chunks, then the project referencing them"""
+        chunks = []
+        for chunk in self.module_chunks(project.modules):
+            key = hashlib.md5(''.join(module.hash for module in chunk)).hexdigest()
+            chunks.append((key, {'type': 'modules', 'project': project.name,
+                                 'modules': [module.to_json() for module in chunk]}))
+        self.send_all(chunks)
+        self.send(project.hash, {'type': 'project', 'name': project.name, 'hash': project.hash,
+                                 'modules': [module.hash for module in project.modules]})
+
+    def push_delta(self, previous, project):
+        """Upload only the changes since the `previous` version of the project, see diff.py"""
+        key = hashlib.md5(previous.hash + project.hash).hexdigest()
+        self.send(key, {'type': 'project_delta', 'name': project.name, 'base': previous.hash,
+                        'hash': project.hash, 'data': diff_projects(previous, project)})
+
+    def module_chunks(self, modules):
+        """Modules split after boundary hashes, a chunk is cut at 4 * chunk_size modules without one"""
+        chunk = []
+        for module in modules:
+            chunk.append(module)
+            if int(module.hash[-8:], 16) % self.chunk_size == 0 or len(chunk) >= 4 * self.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def push_documents(self, batch):
+        """Upload (collection, document) pairs, can be used as a Spool drain sink"""
+        collections = {}
+        for collection, document in batch:
+            collections.setdefault(collection, []).append(document)
+        chunks = []
+        for collection, documents in sorted(collections.items()):
+            for start in range(0, len(documents), self.chunk_size):
+                body = {'type': 'documents', 'collection': collection,
+                        'documents': documents[start:start + self.chunk_size]}
+                key = hashlib.md5(json.dumps(body, sort_keys=True, default=json_default)).hexdigest()
+                chunks.append((key, body))
+        self.send_all(chunks)
+
+    def send_all(self, chunks):
+        chunks = [(key, body) for key, body in chunks if not self._skip(key)]
+        if len(chunks) <= 1 or self.workers <= 1:
+            for key, body in chunks:
+                self.send(key, body)
+            return
+        pool = ThreadPool(min(self.workers, len(chunks)))
+        try:
+            # map re-raises the first failure once every chunk is done
+            pool.map(lambda chunk: self.send(*chunk), chunks)
+        finally:
+            pool.close()
+            pool.join()
+
+    def _skip(self, key):
+        if key in self.ledger:
+            self.progress.count('skipped')
+            return True
+        return False
+
+    def send(self, key, body):
+        if self._skip(key):
+            return
+        body = dict(body, key=key)
+        data = json.dumps(body, default=json_default)
+        headers = {'Content-Type': 'application/json', 'Idempotency-Key': key}
+        for attempt in range(self.retries + 1):
+            try:
+                response = self.session.post(self.url, data=data, headers=headers, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            else:
+                # 409, the server already has the chunk
+                if response.status_code < 300 or response.status_code == 409:
+                    self.ledger.add(key)
+                    self.progress.sent(len(data))
+                    return
+                error = UploadError("{} responded {} to chunk {}".format(self.url, response.status_code, key))
+                if response.status_code not in RETRY_STATUSES:
+                    raise error
+            if attempt < self.retries:
+                self.progress.count('retries')
+                time.sleep(self.backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+        raise UploadError("Chunk {} not uploaded after {} attempts: {}".format(key, self.retries + 1, error))
@@ -0,0 +1,190 @@
+""" Replays recorded calls against the current code
+
+A sample of the recorded lunni_run documents of every method is called
+again with the recorded args and kwargs, in worker processes that import
+the project afresh and are not reused between methods. Each call is timed
+and its result, or exception type, compared to the recorded one:
+
+    {'hash', 'module', 'qualname', 'calls', 'mismatches', 'failures',
+     'recorded_ns', 'replayed_ns'}
+
+Methods are found by the module and qualname of their lunni_method
+document, Lundy wrappers are unwrapped through __wrapped__ so replayed
+calls are not recorded again. The self of a method is rebuilt from its
+recorded attributes, other arguments are passed as recorded, objects as
+the dicts they were serialized to, so replays are faithful for methods
+taking plain values.
+"""
+import inspect
+import importlib
+import json
+import multiprocessing
+import sys
+import types
+
+from blobs import get_blob_store
+from clock import monotonic_ns
+from database import get_database
+from datasets import exception_info, get_serializer
+from snapshot import iter_records, unpack
+
+
+def load_from_database(sample=20):
+    """(method document, runs) of every method with recorded runs, the `sample` most recent runs"""
+    db = get_database()
+    for method in db.lunni_method.find():
+        runs = list(db.lunni_run.find({'hash': method['hash']}).sort([('timestamp', -1), ('_id', -1)]).limit(sample))
+        if runs:
+            yield method, runs
+
+
+def load_from_file(f, sample=20):
+    """Same as load_from_database() from a snapshot of (collection, document) records, e.g. a spool segment"""
+    methods = {}
+    runs = {}
+    for record in iter_records(f):
+        collection, document = unpack(record)
+        if collection == 'lunni_method':
+            methods[document['hash']] = document
+        elif collection == 'lunni_run':
+            runs.setdefault(document['hash'], []).append(document)
+    for method_hash, method in sorted(methods.items()):
+        if method_hash in runs:
+            yield method, runs[method_hash][-sample:]
+
+
+def resolve(module_name, qualname):
+    """(function, owner class or None, kind) of a recorded method, kind is one of function, method,
+    staticmethod and classmethod"""
+    module = importlib.import_module(module_name)
+    owner_name, _, name = qualname.rpartition('.')
+    if not owner_name:
+        return unwrap(getattr(module, name)), None, 'function'
+    owner = module
+    for part in owner_name.split('.'):
+        owner = getattr(owner, part)
+    attribute = vars(owner)[name]
+    if isinstance(attribute, (staticmethod, classmethod)):
+        return unwrap(attribute.__func__), owner, type(attribute).__name__
+    return unwrap(attribute), owner, 'method'
+
+
+def unwrap(function):
+    while True:
+        if hasattr(function, '__wrapped__'):
+            function = function.__wrapped__
+        elif inspect.ismethod(function):
+            function = function.__func__
+        else:
+            return function
+
+
+def rebuild_instance(cls, attributes):
+    if isinstance(cls, types.ClassType):
+        instance = types.InstanceType(cls)
+    else:
+        instance = cls.__new__(cls)
+    if isinstance(attributes, dict):
+        instance.__dict__.update(attributes)
+    return instance
+
+
+def normalized(value):
+    """Recorded and replayed values compared after the same JSON round trip"""
+    return json.loads(json.dumps(value, default=repr))
+
+
+def outcome(data):
+    exception = data.get('exception')
+    if exception:
+        return 'exception', exception['type']
+    return 'result', normalized(data.get('result'))
+
+
+def recorded_ns(data):
+    if data.get('duration_ns') is not None:
+        return data['duration_ns']
+    return int(data['duration'] * 1e9)
+
+
+def replay_method(task):
+    """Replay the runs of one method, called in a worker process"""
+    paths, method, runs = task
+    for path in paths:
+        if path not in sys.path:
+            sys.path.append(path)
+    report = {'hash': method['hash'], 'module': method['module'], 'qualname': method['qualname'],
+              'calls': 0, 'mismatches': 0, 'failures': [], 'recorded_ns': [], 'replayed_ns': []}
+    try:
+        function, owner, kind = resolve(method['module'], method['qualname'])
+    except Exception as e:
+        report['failures'].append("Cannot find {}.{}: {!r}".format(method['module'], method['qualname'], e))
+        return report
+    serializer = get_serializer()
+    blob_store = get_blob_store()
+    for run in runs:
+        data = run['data']
+        if 'blobs' in data:
+            data = blob_store.resolve(dict(data)) if blob_store else None
+        if data is None:
+            report['failures'].append("Run of {} references blobs but no blob store is configured"
+                                      .format(run.get('timestamp')))
+            continue
+        args = list(data.get('args') or [])
+        kwargs = dict(data.get('kwargs') or {})
+        if kind == 'method' and args:
+            args[0] = rebuild_instance(owner, args[0])
+        elif kind == 'classmethod' and args:
+            args[0] = owner
+        start = monotonic_ns()
+        try:
+            result = function(*args, **kwargs)
+        except Exception:
+            duration_ns = monotonic_ns() - start
+            replayed = 'exception', exception_info(sys.exc_info())['type']
+        else:
+            duration_ns = monotonic_ns() - start
+            replayed = 'result', normalized(serializer.serialize(result))
+        report['calls'] += 1
+        report['recorded_ns'].append(recorded_ns(data))
+        report['replayed_ns'].append(duration_ns)
+        if replayed != outcome(data):
+            report['mismatches'] += 1
+    return report
+
+
+def replay(methods, paths=(), workers=None):
+    """Reports of replaying (method document, runs) pairs, in the same order"""
+    tasks = [(list(paths), method, runs) for method, runs in methods]
+    if workers is not None and workers <= 1:
+        return [replay_method(task) for task in tasks]
+    pool = multiprocessing.Pool(workers, maxtasksperchild=1)
+    try:
+        return pool.map(replay_method, tasks, 1)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def percentile(durations, fraction):
+    if not durations:
+        return None
+    durations = sorted(durations)
+    return durations[min(int(fraction * len(durations)), len(durations) - 1)]
+
+
+def format_reports(reports):
+    lines = []
+    for report in reports:
+        name = '{}.{}'.format(report['module'], report['qualname'])
+        if report['calls']:
+            recorded = percentile(report['recorded_ns'], 0.5)
+            replayed = percentile(report['replayed_ns'], 0.5)
+            lines.append("{}: {} calls, median {:.1f}us recorded, {:.1f}us replayed ({:+.1%}), "
+                         "p90 {:.1f}us replayed, {} mismatches"
+                         .format(name, report['calls'], recorded / 1e3, replayed / 1e3,
+                                 float(replayed - recorded) / recorded if recorded else 0.0,
+                                 percentile(report['replayed_ns'], 0.9) / 1e3, report['mismatches']))
+        for failure in report['failures']:
+            lines.append("{}: {}".format(name, failure))
+    return '\n'.join(lines)
@@ -0,0 +1,122 @@
+import itertools
+import random
+import threading
+import time
+
+# .lunni key / collector keyword -> type
+POLICY_OPTIONS = {
+    'sample_rate': float,
+    'every_nth': int,
+    'rate_limit': float,
+    'burst': float,
+    'slow_ms': float,
+}
+
+
+class TokenBucket(object):
+    """ Allows `rate` records per second with bursts of up to `burst` records """
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(rate, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.time()
+        self._lock = threading.Lock()
+
+    def take(self):
+        with self._lock:
+            now = time.time()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def get_bucket(method_hash, rate, burst=None):
+    """Token bucket shared by every wrapper of the method with `method_hash`"""
+    bucket = _buckets.get(method_hash)
+    if bucket is None:
+        with _buckets_lock:
+            bucket = _buckets.setdefault(method_hash, TokenBucket(rate, burst))
+    return bucket
+
+
+class SamplingPolicy(object):
+    """ Decides which calls of a wrapped method are recorded
+
+    sample_rate - record calls with this probability
+    every_nth - record every n-th call
+    rate_limit - record at most this many calls per second per method hash
+    burst - token bucket size for rate_limit
+    slow_ms - always record calls slower than this, whatever the above decided
+
+    A call is sampled when all of the configured samplers agree. Without any
+    sampler every call is recorded.
+    """
+    def __init__(self, sample_rate=None, every_nth=None, rate_limit=None, burst=None, slow_ms=None):
+        # checked here so a bad value fails at decoration time, not inside every wrapped call
+        if sample_rate is not None and not 0 <= sample_rate <= 1:
+            raise ValueError("sample_rate must be between 0 and 1, not {}".format(sample_rate))
+        if every_nth is not None and every_nth < 1:
+            raise ValueError("every_nth must be a positive integer, not {}".format(every_nth))
+        self.sample_rate = sample_rate
+        self.every_nth = every_nth
+        self.rate_limit = rate_limit
+        self.burst = burst
+        self.slow_ms = slow_ms
+        self.sampled = 0
+        self.slow = 0
+        self.dropped = 0
+        self._counters_lock = threading.Lock()
+        self._calls = itertools.count()
+        self.record_all = sample_rate is None and every_nth is None and rate_limit is None
+
+    @classmethod
+    def from_options(cls, options, config=None):
+        """Collector keyword arguments take precedence over .lunni values"""
+        kwargs = {}
+        for key, option_type in POLICY_OPTIONS.items():
+            value = options.get(key)
+            if value is None and config:
+                value = config.get(key)
+            if value is not None:
+                kwargs[key] = option_type(value)
+        return cls(**kwargs)
+
+    def sample(self, signature):
+        """Decide before the call whether it should be recorded"""
+        if self.record_all:
+            return True
+        if self.every_nth is not None and next(self._calls) % self.every_nth:
+            return False
+        if self.sample_rate is not None and random.random() >= self.sample_rate:
+            return False
+        if self.rate_limit is not None:
+            return get_bucket(signature.get_hash(), self.rate_limit, self.burst).take()
+        return True
+
+    def keep(self, sampled, duration):
+        """Final decision once the call duration (in seconds) is known"""
+        with self._counters_lock:
+            if sampled:
+                self.sampled += 1
+                return True
+            if self.slow_ms is not None and duration * 1000 >= self.slow_ms:
+                self.slow += 1
+                return True
+            self.dropped += 1
+            return False
+
+    def drop(self):
+        """Count a call not recorded without calling keep()"""
+        with self._counters_lock:
+            self.dropped += 1
+
+    def stats(self):
+        with self._counters_lock:
+            return {'sampled': self.sampled, 'slow': self.slow, 'dropped': self.dropped}
@@ -0,0 +1,183 @@
+import types
+
+CYCLE = '<cycle>'
+TRUNCATED = '<truncated>'
+
+SCALAR_TYPES = (str, unicode, int, long, float, bool)
+NUMBER_TYPES = frozenset([int, long, float, bool])
+STRING_TYPES = frozenset([str, unicode])
+
+# Marks the end of a container on the work stack
+_EXIT = object()
+
+
+class Serializer(object):
+    """ Turns call arguments and results into JSON/BSON friendly values
+
+    Lists, tuples and dicts are kept, objects become the dict of their
+    __dict__, None and types become 'type' and anything else is passed
+    through as is.
+
+    The object graph is walked with an explicit work stack so deep graphs
+    can't exhaust the interpreter stack. Containers found again inside
+    themselves are replaced by CYCLE. Containers deeper than `max_depth`,
+    values after the first `max_items` and strings over the `max_bytes`
+    budget are replaced or cut with TRUNCATED.
+    """
+    def __init__(self, max_depth=32, max_items=10000, max_bytes=1024 * 1024):
+        self.max_depth = max_depth
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self._handlers = {
+            list: self._sequence,
+            tuple: self._sequence,
+            dict: self._dict,
+            types.InstanceType: self._object,
+            types.NoneType: self._type,
+            type: self._type,
+            types.ClassType: self._type,
+        }
+        for scalar_type in SCALAR_TYPES:
+            self._handlers[scalar_type] = self._scalar
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(max_depth=int(config.get('max_depth', 32)),
+                   max_items=int(config.get('max_items', 10000)),
+                   max_bytes=int(config.get('max_bytes', 1024 * 1024)))
+
+    def serialize(self, value):
+        walk = _Walk(self.max_items, self.max_bytes)
+        root = [None]
+        stack = [(value, root, 0, 0)]
+        while stack:
+            value, parent, key, depth = stack.pop()
+            if value is _EXIT:
+                # parent holds the id of the container being left
+                walk.active.discard(parent)
+                continue
+            if walk.items >= self.max_items:
+                parent[key] = TRUNCATED
+                continue
+            walk.items += 1
+            handler = self._handlers.get(type(value)) or self._handler(type(value))
+            parent[key] = handler(value, parent, key, depth, stack, walk)
+        for items, parent, key in reversed(walk.tuples):
+            parent[key] = tuple(items)
+        return root[0]
+
+    def _handler(self, value_type):
+        if issubclass(value_type, (list, tuple)):
+            handler = self._sequence
+        elif issubclass(value_type, dict):
+            handler = self._dict
+        elif issubclass(value_type, SCALAR_TYPES):
+            handler = self._scalar
+        elif issubclass(value_type, type):
+            handler = self._type
+        else:
+            handler = self._object
+        self._handlers[value_type] = handler
+        return handler
+
+    def _check(self, value, depth, walk):
+        """Marker replacing a container that can't be entered, None otherwise"""
+        if depth >= self.max_depth:
+            return TRUNCATED
+        if id(value) in walk.active:
+            return CYCLE
+        return None
+
+    def _push(self, value, containers, stack, walk):
+        """Schedule the nested containers of `value`, it is active until they're done"""
+        if containers:
+            walk.active.add(id(value))
+            stack.append((_EXIT, id(value), None, None))
+            stack.extend(reversed(containers))
+
+    def _sequence(self, value, parent, key, depth, stack, walk):
+        marker = self._check(value, depth, walk)
+        if marker:
+            return marker
+        budget = self.max_items - walk.items
+        size = len(value)
+        new_value = [None] * min(size, budget)
+        containers = []
+        for index in xrange(len(new_value)):
+            item = value[index]
+            # Leaves are converted in place, only containers go on the stack
+            if type(item) in NUMBER_TYPES:
+                walk.items += 1
+                walk.bytes_left -= 8
+                new_value[index] = item
+            elif type(item) in STRING_TYPES and len(item) <= walk.bytes_left:
+                walk.items += 1
+                walk.bytes_left -= len(item)
+                new_value[index] = item
+            elif item is None:
+                walk.items += 1
+                new_value[index] = 'type'
+            else:
+                containers.append((item, new_value, index, depth + 1))
+        if size > budget:
+            new_value.append(TRUNCATED)
+        self._push(value, containers, stack, walk)
+        if isinstance(value, tuple):
+            walk.tuples.append((new_value, parent, key))
+        return new_value
+
+    def _dict(self, value, parent, key, depth, stack, walk, owner=None):
+        marker = self._check(owner or value, depth, walk)
+        if marker:
+            return marker
+        new_value = {}
+        budget = self.max_items - walk.items
+        containers = []
+        for item_key, item in value.iteritems():
+            if budget <= 0:
+                new_value[item_key] = TRUNCATED
+                break
+            budget -= 1
+            if type(item) in NUMBER_TYPES:
+                walk.items += 1
+                walk.bytes_left -= 8
+                new_value[item_key] = item
+            elif type(item) in STRING_TYPES and len(item) <= walk.bytes_left:
+                walk.items += 1
+                walk.bytes_left -= len(item)
+                new_value[item_key] = item
+            elif item is None:
+                walk.items += 1
+                new_value[item_key] = 'type'
+            else:
+                containers.append((item, new_value, item_key, depth + 1))
+        self._push(owner or value, containers, stack, walk)
+        return new_value
+
+    def _object(self, value, parent, key, depth, stack, walk):
+        attributes = getattr(value, '__dict__', None)
+        if not isinstance(attributes, dict):
+            return value
+        return self._dict(attributes, parent, key, depth, stack, walk, owner=value)
+
+    def _type(self, value, parent, key, depth, stack, walk):
+        return 'type'
+
+    def _scalar(self, value, parent, key, depth, stack, walk):
+        if isinstance(value, basestring):
+            size = len(value)
+            if size > walk.bytes_left:
+                value = value[:max(walk.bytes_left, 0)] + TRUNCATED
+            walk.bytes_left -= size
+        else:
+            walk.bytes_left -= 8
+        return value
+
+
+class _Walk(object):
+    """State of a single serialize() call"""
+    def __init__(self, max_items, max_bytes):
+        self.items = 0
+        self.bytes_left = max_bytes
+        self.active = set()
+        self.tuples = []
@@ -0,0 +1,193 @@
+import atexit
+import collections
+import logging
+import os
+import random
+import threading
+import time
+
+from blobs import get_blob_store
+from database import read_config
+from datasets import insert_documents
+from spool import Spool
+
+logger = logging.getLogger(__name__)
+
+
+class RunShipper(object):
+    """ Ships recorded documents to the database from a background thread
+
+    Documents are put on a bounded in-memory queue by the instrumented code
+    and bulk-inserted by a worker thread in batches of `batch_size`, or
+    whatever is queued after `linger` seconds.
+
+    Overflow policies, applied when the queue holds `queue_size` documents:
+        drop_oldest - discard the oldest queued document
+        block - wait in the caller until the worker makes room
+        sample - keep a uniform random sample of everything that overflowed
+
+    put() takes an optional `on_lost` callback, called without arguments if
+    the document is dropped or its batch can't be shipped.
+    """
+    OVERFLOW_POLICIES = ('drop_oldest', 'block', 'sample')
+
+    def __init__(self, sink=insert_documents, queue_size=10000, batch_size=500, linger=1.0,
+                 overflow='drop_oldest'):
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise ValueError("Unknown overflow policy {}".format(overflow))
+        self.sink = sink
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.linger = linger
+        self.overflow = overflow
+        self.shipped = 0
+        self.dropped = 0
+        self.failed = 0
+        self._queue = collections.deque()
+        self._condition = threading.Condition()
+        self._overflowed = 0
+        self._closing = False
+        self._worker = None
+        self._pid = None
+
+    @classmethod
+    def from_config(cls, config, sink=insert_documents):
+        return cls(sink,
+                   queue_size=int(config.get('queue_size', 10000)),
+                   batch_size=int(config.get('batch_size', 500)),
+                   linger=float(config.get('linger', 1.0)),
+                   overflow=config.get('overflow', 'drop_oldest'))
+
+    def put(self, collection, document, block=True, on_lost=None):
+        """Queue a document, with block=False the caller never waits, not even with the block policy"""
+        item = (collection, document, on_lost)
+        lost = None
+        with self._condition:
+            self._ensure_worker()
+            if len(self._queue) >= self.queue_size:
+                if self.overflow == 'block':
+                    if not block:
+                        self.dropped += 1
+                        lost = item
+                        item = None
+                    while item is not None and len(self._queue) >= self.queue_size:
+                        self._condition.wait()
+                elif self.overflow == 'drop_oldest':
+                    lost = self._queue.popleft()
+                    self.dropped += 1
+                else:
+                    self._overflowed += 1
+                    self.dropped += 1
+                    index = random.randint(0, self.queue_size + self._overflowed - 1)
+                    if index < self.queue_size:
+                        lost = self._queue[index]
+                        self._queue[index] = item
+                    else:
+                        lost = item
+                    item = None
+            if item is not None:
+                self._queue.append(item)
+                if len(self._queue) >= self.batch_size:
+                    self._condition.notify_all()
+        if lost is not None:
+            _notify_lost([lost])
+
+    def flush(self):
+        """Ship everything queued so far from the calling thread"""
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                return
+            self._ship(batch)
+
+    def close(self, timeout=5.0):
+        with self._condition:
+            self._closing = True
+            self._condition.notify_all()
+        # a daemon worker still waiting when the interpreter tears down fails noisily
+        worker = self._worker
+        if worker is not None and worker is not threading.current_thread() and self._pid == os.getpid():
+            worker.join(timeout)
+        self.flush()
+
+    def _ensure_worker(self):
+        # A forked child inherits the queue but not the worker thread
+        if self._pid == os.getpid() and self._worker.is_alive():
+            return
+        if self._pid is not None and self._pid != os.getpid():
+            self._queue.clear()
+        self._pid = os.getpid()
+        self._closing = False
+        self._worker = threading.Thread(target=self._run, name='lundy-shipper')
+        self._worker.daemon = True
+        self._worker.start()
+
+    def _take_batch(self):
+        with self._condition:
+            batch = []
+            while self._queue and len(batch) < self.batch_size:
+                batch.append(self._queue.popleft())
+            if not self._queue:
+                self._overflowed = 0
+            self._condition.notify_all()
+            return batch
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._queue and not self._closing:
+                    self._condition.wait()
+                if self._closing:
+                    return
+                deadline = time.time() + self.linger
+                while len(self._queue) < self.batch_size and not self._closing:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+            self._ship(self._take_batch())
+
+    def _ship(self, batch):
+        if not batch:
+            return
+        try:
+            self.sink([(collection, document) for collection, document, _ in batch])
+            self.shipped += len(batch)
+        except Exception:
+            self.failed += len(batch)
+            logger.exception("Lundy could not ship %s documents", len(batch))
+            _notify_lost(batch)
+
+
+def _notify_lost(items):
+    for _, _, on_lost in items:
+        if on_lost is None:
+            continue
+        try:
+            on_lost()
+        except Exception:
+            logger.exception("Lundy could not handle a lost document")
+
+
+_shipper = None
+_shipper_lock = threading.Lock()
+
+
+def get_shipper():
+    global _shipper
+    if _shipper is None:
+        with _shipper_lock:
+            if _shipper is None:
+                config = read_config()
+                sink = insert_documents
+                if config.get('spool'):
+                    spool = Spool.from_config(config)
+                    atexit.register(spool.close)
+                    sink = spool.append
+                blob_store = get_blob_store()
+                if blob_store is not None:
+                    sink = blob_store.wrap_sink(sink)
+                shipper = RunShipper.from_config(config, sink)
+                atexit.register(shipper.close)
+                _shipper = shipper
+    return _shipper
@@ -0,0 +1,207 @@
+""" Binary snapshots of collected projects and recorded runs
+
+A snapshot file is a header followed by length-prefixed records:
+
+    'LUNS' | version (1 byte) | flags (1 byte) | records...
+
+and each record is a 4 byte big-endian length and a marshal (version 2)
+payload. Marshal writes an interned string once per record and refers to
+it by index afterwards, the names of the project tree are interned so
+repeated names like `self` or type strings form the record's string table.
+With FLAG_ZLIB everything after the header is a single zlib stream.
+
+The first record describes the snapshot, {'kind': 'project', 'name': ...}
+or {'kind': 'runs'}, the others hold a module's to_json() or a run's
+to_document(). Datetimes of runs are stored as tagged tuples and other
+values marshal can't write, like objects the serializer passed through,
+as their repr().
+
+Snapshots are local artifacts: marshal's format is only guaranteed within
+a Python version, a snapshot is read by the Python version that wrote it,
+and marshal must not be used on untrusted files.
+"""
+import datetime
+import marshal
+import struct
+import zlib
+
+from datasets import LundyModule, LundyProject
+
+MAGIC = 'LUNS'
+VERSION = 1
+FLAG_ZLIB = 1
+MARSHAL_VERSION = 2
+
+_header = struct.Struct('>4sBB')
+_length = struct.Struct('>I')
+
+DATETIME_TAG = '\x00datetime'
+
+# Values marshal writes as they are, containers are packed item by item
+MARSHAL_TYPES = (type(None), bool, int, long, float, complex, str, unicode)
+
+
+class SnapshotError(ValueError):
+    pass
+
+
+def pack(value):
+    """Value with datetimes replaced by tuples marshal can write"""
+    if isinstance(value, datetime.datetime):
+        return (DATETIME_TAG, value.year, value.month, value.day, value.hour,
+                value.minute, value.second, value.microsecond)
+    if isinstance(value, dict):
+        return dict((key, pack(item)) for key, item in value.iteritems())
+    if isinstance(value, list):
+        return [pack(item) for item in value]
+    if isinstance(value, tuple):
+        return tuple(pack(item) for item in value)
+    if isinstance(value, MARSHAL_TYPES):
+        return value
+    return repr(value)
+
+
+def unpack(value):
+    if isinstance(value, tuple):
+        if len(value) == 8 and value[0] == DATETIME_TAG:
+            return datetime.datetime(*value[1:])
+        return tuple(unpack(item) for item in value)
+    if isinstance(value, dict):
+        return dict((key, unpack(item)) for key, item in value.iteritems())
+    if isinstance(value, list):
+        return [unpack(item) for item in value]
+    return value
+
+
+class SnapshotWriter(object):
+    def __init__(self, f, compress=True):
+        self.f = f
+        self.compressor = zlib.compressobj() if compress else None
+        f.write(_header.pack(MAGIC, VERSION, FLAG_ZLIB if compress else 0))
+
+    def write(self, value):
+        payload = marshal.dumps(value, MARSHAL_VERSION)
+        data = _length.pack(len(payload)) + payload
+        if self.compressor:
+            data = self.compressor.compress(data)
+        self.f.write(data)
+
+    def close(self):
+        if self.compressor:
+            self.f.write(self.compressor.flush())
+            self.compressor = None
+
+
+HEADER_SIZE = _header.size
+
+
+def read_header(f):
+    """Check the header of a snapshot file, returns its flags"""
+    header = f.read(_header.size)
+    if len(header) < _header.size:
+        raise SnapshotError("Not a snapshot file")
+    magic, version, flags = _header.unpack(header)
+    if magic != MAGIC:
+        raise SnapshotError("Not a snapshot file")
+    if version != VERSION:
+        raise SnapshotError("Unsupported snapshot version {}".format(version))
+    return flags
+
+
+def iter_records(f, chunk_size=65536):
+    flags = read_header(f)
+    decompressor = zlib.decompressobj() if flags & FLAG_ZLIB else None
+    buffer = ''
+    position = 0
+    while True:
+        raw = f.read(chunk_size)
+        chunk = raw
+        if decompressor:
+            # a small compressed chunk may decompress to nothing before the end of the file
+            chunk = decompressor.decompress(raw) if raw else decompressor.flush()
+        if chunk:
+            buffer = buffer[position:] + chunk
+            position = 0
+            while position + _length.size <= len(buffer):
+                length, = _length.unpack_from(buffer, position)
+                end = position + _length.size + length
+                if end > len(buffer):
+                    break
+                yield marshal.loads(buffer[position + _length.size:end])
+                position = end
+        if not raw:
+            break
+    if position != len(buffer):
+        raise SnapshotError("Truncated snapshot file")
+
+
+def iter_appended(f, position, chunk_size=65536):
+    """Yield (record, offset after it) of an uncompressed file from `position`
+
+    Stops quietly at a record which is still being written.
+    """
+    f.seek(position)
+    buffer = ''
+    start = 0
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            return
+        buffer = buffer[start:] + chunk
+        start = 0
+        while start + _length.size <= len(buffer):
+            length, = _length.unpack_from(buffer, start)
+            end = start + _length.size + length
+            if end > len(buffer):
+                break
+            position += end - start
+            yield marshal.loads(buffer[start + _length.size:end]), position
+            start = end
+
+
+def save_project(project, path, compress=True):
+    save_modules(project.name, project.modules, path, compress)
+
+
+def save_modules(name, modules, path, compress=True):
+    """Write a project snapshot from `modules`, an iterable, see LundyProject.iter_scan()"""
+    with open(path, 'wb') as f:
+        writer = SnapshotWriter(f, compress)
+        writer.write({'kind': 'project', 'name': name})
+        for module in modules:
+            writer.write(module.to_json())
+        writer.close()
+
+
+def load_project(path):
+    with open(path, 'rb') as f:
+        records = iter_records(f)
+        info = _first_record(records, 'project')
+        project = LundyProject(info['name'])
+        project.modules = [LundyModule.from_dict(module_json) for module_json in records]
+    return project
+
+
+def save_runs(documents, path, compress=True):
+    """Write the to_document() of recorded runs"""
+    with open(path, 'wb') as f:
+        writer = SnapshotWriter(f, compress)
+        writer.write({'kind': 'runs'})
+        for document in documents:
+            writer.write(pack(document))
+        writer.close()
+
+
+def load_runs(path):
+    with open(path, 'rb') as f:
+        records = iter_records(f)
+        _first_record(records, 'runs')
+        return [unpack(document) for document in records]
+
+
+def _first_record(records, kind):
+    for info in records:
+        if info.get('kind') != kind:
+            raise SnapshotError("Expected a {} snapshot, got {}".format(kind, info.get('kind')))
+        return info
+    raise SnapshotError("Empty snapshot file")
@@ -0,0 +1,219 @@
+""" Append-only local spool of recorded runs
+
+Runs are appended to segment files in the spool directory instead of being
+inserted into the database, drain() ships them to the database later in
+bulk. Segments are uncompressed snapshot files (see snapshot.py) holding
+one (collection, document) record each:
+
+    <created>-<pid>-<n>.luns.open   segment a process is appending to
+    <created>-<pid>-<n>.luns        closed segment
+    offsets                         how far each segment has been drained, by
+                                    <created>-<pid>-<n>
+
+A process rotates its segment once it's larger than `segment_size`.
+Writes are flushed after every batch and fsynced at most every
+`fsync_interval` seconds. Records are dropped, and counted, while the spool
+holds more than `max_bytes`. The size is tracked as records are written
+and only recounted from the directory on rotation, after a drain and, at
+most once a second, while the spool seems full, since another process may
+have drained it.
+
+Delivery is at least once, a drain interrupted between shipping a batch
+and saving its offset ships that batch again.
+"""
+import errno
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+
+from snapshot import HEADER_SIZE, SnapshotWriter, iter_appended, pack, read_header, unpack
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_SUFFIX = '.luns'
+OPEN_SUFFIX = SEGMENT_SUFFIX + '.open'
+
+
+class Spool(object):
+    def __init__(self, directory, segment_size=16 * 1024 * 1024, max_bytes=1024 * 1024 * 1024,
+                 fsync_interval=1.0):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.max_bytes = max_bytes
+        self.fsync_interval = fsync_interval
+        self.written = 0
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._file = None
+        self._writer = None
+        self._pid = None
+        self._synced = 0
+        self._sequence = 0
+        self._size = None
+        self._size_checked = 0
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config['spool'],
+                   segment_size=int(config.get('spool_segment_size', 16 * 1024 * 1024)),
+                   max_bytes=int(config.get('spool_max_bytes', 1024 * 1024 * 1024)),
+                   fsync_interval=float(config.get('spool_fsync_interval', 1.0)))
+
+    def append(self, batch):
+        """Spool (collection, document) pairs, can be used as a RunShipper sink"""
+        with self._lock:
+            if self._full():
+                if not self.dropped:
+                    logger.warning("Lundy spool %s is full, dropping runs", self.directory)
+                self.dropped += len(batch)
+                return
+            if self._file is None or self._pid != os.getpid():
+                self._open_segment()
+            start = self._file.tell()
+            for collection, document in batch:
+                self._writer.write(pack((collection, document)))
+            self._file.flush()
+            self._size += self._file.tell() - start
+            self.written += len(batch)
+            if time.time() - self._synced >= self.fsync_interval:
+                os.fsync(self._file.fileno())
+                self._synced = time.time()
+            if self._file.tell() >= self.segment_size:
+                self._close_segment()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None and self._pid == os.getpid():
+                self._close_segment()
+
+    def _full(self):
+        now = time.time()
+        if self._size is None or (self._size > self.max_bytes and now - self._size_checked >= 1.0):
+            self._size = self.size()
+            self._size_checked = now
+        return self._size > self.max_bytes
+
+    def size(self):
+        total = 0
+        for name in os.listdir(self.directory):
+            if name.endswith(SEGMENT_SUFFIX) or name.endswith(OPEN_SUFFIX):
+                total += os.path.getsize(os.path.join(self.directory, name))
+        return total
+
+    def _open_segment(self):
+        # a forked child gets its own segment, the parent's stays with the parent
+        self._pid = os.getpid()
+        self._sequence += 1
+        name = '{:016d}-{}-{}{}'.format(int(time.time() * 1000000), self._pid, self._sequence, OPEN_SUFFIX)
+        self._file = open(os.path.join(self.directory, name), 'wb')
+        self._writer = SnapshotWriter(self._file, compress=False)
+        # a concurrent drain must never see the segment without its header
+        self._file.flush()
+        self._synced = time.time()
+
+    def _close_segment(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        path = self._file.name
+        os.rename(path, path[:-len(OPEN_SUFFIX)] + SEGMENT_SUFFIX)
+        self._file = None
+        self._writer = None
+        self._size = None
+
+    def segments(self):
+        """Segment file names, oldest first"""
+        names = [name for name in os.listdir(self.directory)
+                 if name.endswith(SEGMENT_SUFFIX) or name.endswith(OPEN_SUFFIX)]
+        return sorted(names)
+
+    def drain(self, sink, batch_size=500):
+        """Ship spooled records with `sink` in batches, returns how many were shipped
+
+        Only one process drains a spool at a time, others return 0. An
+        exception raised by `sink` stops the drain, what was shipped before
+        is not shipped again.
+        """
+        with open(os.path.join(self.directory, 'drain.lock'), 'a') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except IOError as e:
+                if e.errno in (errno.EAGAIN, errno.EACCES):
+                    return 0
+                raise
+            offsets = self._load_offsets()
+            try:
+                return self._drain(sink, batch_size, offsets)
+            finally:
+                self._save_offsets(offsets)
+                with self._lock:
+                    self._size = None
+
+    def _drain(self, sink, batch_size, offsets):
+        shipped = 0
+        for name in self.segments():
+            # offsets are kept by segment id so they survive closing the segment
+            segment_id = name.split('.')[0]
+            path = os.path.join(self.directory, name)
+            if not os.path.exists(path):
+                name = segment_id + SEGMENT_SUFFIX
+                path = os.path.join(self.directory, name)
+            if name.endswith(OPEN_SUFFIX) and os.path.getsize(path) < HEADER_SIZE:
+                # just created, nothing to ship yet
+                continue
+            with open(path, 'rb') as f:
+                offset = offsets.get(segment_id)
+                if offset is None:
+                    read_header(f)
+                    offset = HEADER_SIZE
+                batch = []
+                for record, end in iter_appended(f, offset):
+                    collection, document = unpack(record)
+                    batch.append((collection, document))
+                    if len(batch) >= batch_size:
+                        shipped += self._ship(sink, batch, offsets, segment_id, end)
+                        batch = []
+                if batch:
+                    shipped += self._ship(sink, batch, offsets, segment_id, end)
+            if name.endswith(SEGMENT_SUFFIX) or not _writer_alive(name):
+                os.remove(path)
+                offsets.pop(segment_id, None)
+                self._save_offsets(offsets)
+        return shipped
+
+    def _ship(self, sink, batch, offsets, segment_id, end):
+        sink(batch)
+        # saved right away, a drain killed later on ships only the batch it was in again
+        offsets[segment_id] = end
+        self._save_offsets(offsets)
+        return len(batch)
+
+    def _load_offsets(self):
+        try:
+            with open(os.path.join(self.directory, 'offsets')) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return {}
+
+    def _save_offsets(self, offsets):
+        path = os.path.join(self.directory, 'offsets')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(offsets, f)
+        os.rename(path + '.tmp', path)
+
+
+def _writer_alive(name):
+    """Whether the process appending to an open segment is still running"""
+    pid = int(name[:-len(OPEN_SUFFIX)].split('-')[1])
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
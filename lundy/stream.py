@@ -0,0 +1,56 @@
+""" Streaming project JSON writer
+
+Writes the same JSON as LundyProject.to_string() one module at a time, so a
+project doesn't have to be held in memory to be saved or sent:
+
+    with open('project.json', 'wb') as f:
+        writer = ProjectWriter(f, 'Lundy')
+        for module in project.iter_scan(src):
+            writer.write(module)
+        project_hash = writer.close()
+
+`f` is anything with a write method, e.g. a file or socket.makefile('wb').
+The project hash is computed while writing and equals LundyProject.hash.
+"""
+import hashlib
+import json
+
+from datasets import LundyProject
+
+MODULES_PLACEHOLDER = '"modules": []'
+
+
+class ProjectWriter(object):
+    def __init__(self, f, name):
+        self.f = f
+        self.name = name
+        self.count = 0
+        self._digest = hashlib.md5()
+        skeleton = json.dumps(LundyProject(name).to_json(allow_child=False))
+        prefix, self._suffix = skeleton.split(MODULES_PLACEHOLDER)
+        self._emit(prefix + MODULES_PLACEHOLDER[:-1])
+
+    def write(self, module):
+        if self.count:
+            self._emit(', ')
+        self._emit(module.to_string())
+        self.count += 1
+
+    def close(self):
+        """Finish the document, returns the project hash"""
+        self._emit(']' + self._suffix)
+        if hasattr(self.f, 'flush'):
+            self.f.flush()
+        return hashlib.md5(self.name).hexdigest() + self._digest.hexdigest()
+
+    def _emit(self, data):
+        self._digest.update(data)
+        self.f.write(data)
+
+
+def write_project(f, name, modules):
+    """Write the project JSON of `modules`, an iterable, returns the project hash"""
+    writer = ProjectWriter(f, name)
+    for module in modules:
+        writer.write(module)
+    return writer.close()
@@ -0,0 +1,96 @@
+import random
+import unittest
+
+from mock import patch
+
+from lundy.aggregate import (Aggregator, MethodStats, bucket, bucket_upper_bound, merge_histograms,
+                             percentile)
+from main import method_wrapper
+
+
+class FirstCache(object):
+    def get(self, key):
+        return key
+
+
+class SecondCache(object):
+    def get(self, key):
+        return key
+
+
+class HistogramTests(unittest.TestCase):
+    def test_buckets_are_within_an_eighth(self):
+        for duration in [0, 1, 15, 16, 17, 1000, 123456789, 10 ** 12]:
+            upper_bound = bucket_upper_bound(bucket(duration))
+            self.assertGreaterEqual(upper_bound, duration)
+            self.assertLessEqual(upper_bound - duration, duration / 8.0 + 1)
+
+    def test_percentile(self):
+        durations = [random.randint(1000, 10 ** 7) for _ in range(10000)]
+        stats = MethodStats('hash', 'name')
+        for duration in durations:
+            stats.record(duration)
+        histogram = stats.take()['histogram']
+        durations.sort()
+        for fraction in (0.5, 0.9, 0.99):
+            exact = durations[int(fraction * len(durations)) - 1]
+            self.assertAlmostEqual(percentile(histogram, fraction), exact, delta=exact / 8.0 + 1)
+        self.assertIsNone(percentile({}, 0.5))
+
+    def test_merge(self):
+        self.assertEqual(merge_histograms([{'1': 2, '5': 1}, {'5': 3}]), {'1': 2, '5': 4})
+
+
+class MethodStatsTests(unittest.TestCase):
+    def test_take_resets(self):
+        stats = MethodStats('hash', 'name')
+        stats.record(100)
+        stats.record(300, error=True)
+        document = stats.take()
+        self.assertEqual((document['count'], document['errors'], document['total_ns'],
+                          document['min_ns'], document['max_ns']), (2, 1, 400, 100, 300))
+        self.assertEqual(sum(document['histogram'].values()), 2)
+        self.assertIsNone(stats.take())
+
+
+class AggregatorTests(unittest.TestCase):
+    def setUp(self):
+        self.documents = []
+        self.aggregator = Aggregator(interval=60, put=lambda collection, document:
+                                     self.documents.append((collection, document)))
+        self.addCleanup(self.aggregator.close)
+
+    def test_one_document_per_method(self):
+        self.aggregator.stats('a', 'first').record(10)
+        self.aggregator.stats('a', 'first').record(20)
+        self.aggregator.stats('b', 'second').record(30)
+        self.aggregator.flush()
+        self.assertEqual(sorted((collection, document['name'], document['count'])
+                                for collection, document in self.documents),
+                         [('lunni_aggregate', 'first', 2), ('lunni_aggregate', 'second', 1)])
+        self.aggregator.flush()
+        self.assertEqual(len(self.documents), 2)
+
+    def test_aggregate_wrapper(self):
+        def divide(a, b):
+            return a / b
+        with patch('main.get_aggregator', return_value=self.aggregator), patch('main.get_shipper') as shipper:
+            wrapped = method_wrapper(divide, aggregate=True)
+            self.assertEqual(wrapped(4, 2), 2)
+            self.assertRaises(ZeroDivisionError, wrapped, 1, 0)
+            self.aggregator.flush()
+        document, = [document for collection, document in self.documents]
+        self.assertEqual((document['count'], document['errors']), (2, 1))
+        self.assertEqual(document['hash'], wrapped.lundy_signature.hash)
+        self.assertEqual([call[0][0] for call in shipper.return_value.put.call_args_list], ['lunni_method'])
+
+    def test_same_signature_in_different_classes(self):
+        with patch('main.get_aggregator', return_value=self.aggregator), patch('main.get_shipper'):
+            first = method_wrapper(FirstCache.get.__func__, aggregate=True)
+            second = method_wrapper(SecondCache.get.__func__, aggregate=True)
+            first(None, 1)
+            second(None, 1)
+            second(None, 2)
+            self.aggregator.flush()
+        self.assertEqual(sorted((document['name'], document['count']) for _, document in self.documents),
+                         [(__name__ + '.FirstCache.get', 1), (__name__ + '.SecondCache.get', 2)])
@@ -0,0 +1,25 @@
+import unittest
+
+from lundy.bench import collector
+from lundy.bench.compare import compare
+
+
+def report(**seconds):
+    return {'results': [{'suite': 'suite', 'name': name, 'seconds': value, 'number': 1}
+                        for name, value in seconds.items()]}
+
+
+class CompareTests(unittest.TestCase):
+    def test_regressions(self):
+        rows = compare(report(a=1.0, b=1.0, gone=1.0), report(a=1.05, b=2.0, new=1.0), threshold=0.1)
+        self.assertEqual(sorted(rows), [('suite', 'a', 1.0, 1.05, 1.05, False),
+                                        ('suite', 'b', 1.0, 2.0, 2.0, True)])
+
+
+class CollectorBenchmarkTests(unittest.TestCase):
+    def test_run(self):
+        results = collector.run(number=10)
+        self.assertEqual([entry['name'] for entry in results],
+                         ['recorded', 'sampled_1_in_100', 'aggregate', 'recorded_object_args'])
+        for entry in results:
+            self.assertGreater(entry['seconds'], 0)
@@ -0,0 +1,125 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import patch
+
+import mongomock
+
+from lundy.blobs import BlobStore, FileBlobStore, MongoBlobStore, encode, from_config
+from lundy.datasets import insert_documents
+from lundy.shipper import RunShipper
+from main import method_wrapper
+
+LARGE = {'state': 'x' * 1000}
+
+
+class FileBlobStoreTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.store = FileBlobStore(self.directory, min_size=100)
+
+    def test_large_payloads_are_referenced(self):
+        data = {'args': (LARGE, 1), 'kwargs': {}, 'result': None, 'duration': 1.0}
+        self.assertEqual(self.store.externalize(data), [])
+        self.assertEqual(sorted(data), ['blobs', 'duration', 'kwargs', 'result'])
+        self.assertEqual(sorted(data['blobs']), ['args'])
+        self.assertTrue(os.path.exists(self.store.path(data['blobs']['args'])))
+        self.assertEqual(self.store.resolve(data)['args'], [LARGE, 1])
+
+    def test_repeated_payload_stored_once(self):
+        first = {'args': (LARGE, ), 'result': LARGE}
+        second = {'args': (LARGE, ), 'result': LARGE}
+        self.store.externalize(first)
+        self.store.externalize(second)
+        self.assertEqual(first, second)
+        self.assertEqual((self.store.stored, self.store.reused), (2, 2))
+        self.assertEqual(len(os.listdir(self.directory)), 2)
+
+    def test_forgotten_digest_is_rewritten(self):
+        store = FileBlobStore(self.directory, min_size=100, remember=1)
+        store.externalize({'args': ({'a': 'x' * 200}, )})
+        store.externalize({'args': ({'b': 'x' * 200}, )})
+        store.externalize({'args': ({'a': 'x' * 200}, )})
+        self.assertEqual((store.stored, store.reused), (3, 0))
+
+    def test_failed_write_keeps_payloads(self):
+        data = {'args': (LARGE, ), 'result': dict(LARGE, other=1)}
+        with patch.object(self.store, 'write', side_effect=[None, IOError("disk is full")]):
+            self.assertRaises(IOError, self.store.externalize, data)
+        self.assertEqual(data, {'args': (LARGE, ), 'result': dict(LARGE, other=1)})
+
+    def test_missing_blob(self):
+        with self.assertRaises(KeyError):
+            self.store.resolve({'blobs': {'args': 'ff' * 20}})
+
+
+class MongoBlobStoreTests(unittest.TestCase):
+    @patch('lundy.blobs.get_database')
+    @patch('lundy.datasets.get_database')
+    def test_round_trip(self, datasets_get_database, blobs_get_database):
+        db = mongomock.MongoClient().lunni_test
+        datasets_get_database.return_value = blobs_get_database.return_value = db
+        store = MongoBlobStore(min_size=100)
+        data = {'result': LARGE}
+        blobs = store.externalize(data)
+        self.assertEqual(store.externalize({'result': LARGE}), [])
+        insert_documents([('lunni_blob', blob) for blob in blobs + blobs])
+        self.assertEqual(db.lunni_blob.count_documents({}), 1)
+        self.assertEqual(store.resolve(data), {'result': LARGE})
+
+    def test_sink_ships_blobs_with_their_run(self):
+        batches = []
+        sink = MongoBlobStore(min_size=100).wrap_sink(batches.append)
+        sink([('lunni_method', {'_id': 'm'}), ('lunni_run', {'data': {'result': LARGE}})])
+        sink([('lunni_run', {'data': {'result': LARGE}})])
+        self.assertEqual([collection for collection, _ in batches[0]], ['lunni_method', 'lunni_blob', 'lunni_run'])
+        blob = batches[0][1][1]
+        self.assertEqual(blob['value'], LARGE)
+        self.assertEqual(batches[1], [('lunni_run', {'data': {'blobs': {'result': blob['_id']}}})])
+
+    def test_lost_blob_is_stored_again(self):
+        store = MongoBlobStore(min_size=100)
+
+        def broken_sink(batch):
+            raise IOError("database is down")
+        self.assertRaises(IOError, store.wrap_sink(broken_sink), [('lunni_run', {'data': {'result': LARGE}})])
+        batches = []
+        store.wrap_sink(batches.append)([('lunni_run', {'data': {'result': LARGE}})])
+        self.assertEqual([collection for collection, _ in batches[0]], ['lunni_blob', 'lunni_run'])
+        self.assertEqual((store.stored, store.reused), (2, 0))
+
+
+class ConfigTests(unittest.TestCase):
+    def test_equal_dicts_equal_encodings(self):
+        first = dict(('key{}'.format(i), i) for i in range(50))
+        second = dict(('key{}'.format(i), i) for i in reversed(range(50)))
+        self.assertEqual(encode(first), encode(second))
+
+    def test_blob_store_is_abstract(self):
+        self.assertRaises(TypeError, BlobStore)
+
+    def test_from_config(self):
+        self.assertIsNone(from_config({}))
+        store = from_config({'blob_store': 'file', 'blob_dir': '/tmp/blobs', 'blob_min_size': '10'})
+        self.assertEqual((store.directory, store.min_size), ('/tmp/blobs', 10))
+        self.assertRaises(ValueError, from_config, {'blob_store': 'ftp'})
+
+    @patch('main.get_shipper')
+    def test_wrapper_only_queues_the_run(self, get_shipper_patch):
+        method_wrapper(lambda state: len(state))('x' * 500)
+        document = get_shipper_patch.return_value.put.call_args[0][1]
+        self.assertEqual(document['data']['args'], ('x' * 500, ))
+
+    def test_shipper_sink_externalizes_payloads(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        batches = []
+        shipper = RunShipper(FileBlobStore(directory, min_size=100).wrap_sink(batches.extend))
+        shipper.put('lunni_run', {'data': {'args': ('x' * 500, ), 'result': 500}})
+        shipper.close()
+        (collection, document), = batches
+        self.assertEqual(sorted(document['data']['blobs']), ['args'])
+        self.assertEqual(document['data']['result'], 500)
@@ -0,0 +1,90 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from lundy.cache import ScanCache
+from lundy.datasets import LundyProject
+
+MODULE_SOURCE = '''
+class {name}:
+    def method(self, a, b={default}):
+        pass
+'''
+
+
+class ScanCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.src = os.path.join(self.tmp_dir, 'src')
+        os.mkdir(self.src)
+        self.write('__init__.py', '')
+        self.write('first.py', MODULE_SOURCE.format(name='First', default=1))
+        self.write('second.py', MODULE_SOURCE.format(name='Second', default="'b'"))
+        self.cache_path = os.path.join(self.tmp_dir, '.lunni_cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write(self, filename, content, mtime=None):
+        path = os.path.join(self.src, filename)
+        with open(path, 'w') as f:
+            f.write(content)
+        if mtime:
+            os.utime(path, (mtime, mtime))
+
+    def collect(self):
+        cache = ScanCache(self.cache_path, 'static')
+        project = LundyProject('Lundy')
+        project.scan(self.src, mode='static', cache=cache)
+        cache.save()
+        return project, cache
+
+    def test_unchanged_files_come_from_cache(self):
+        scanned, cache = self.collect()
+        self.assertEqual((cache.hits, cache.misses), (0, 2))
+        cached, cache = self.collect()
+        self.assertEqual((cache.hits, cache.misses), (2, 0))
+        self.assertEqual(cached.to_string(), scanned.to_string())
+        self.assertEqual(cached.hash, scanned.hash)
+
+    def test_changed_file_is_rescanned(self):
+        self.collect()
+        self.write('first.py', MODULE_SOURCE.format(name='First', default=(1, 2)))
+        project, cache = self.collect()
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        fresh = LundyProject('Lundy')
+        fresh.scan(self.src, mode='static')
+        self.assertEqual(project.hash, fresh.hash)
+
+    def test_touched_file_with_same_content(self):
+        self.collect()
+        self.write('first.py', MODULE_SOURCE.format(name='First', default=1), mtime=1000)
+        project, cache = self.collect()
+        self.assertEqual((cache.hits, cache.misses), (2, 0))
+
+    def test_deleted_and_new_files(self):
+        self.collect()
+        os.remove(os.path.join(self.src, 'second.py'))
+        self.write('third.py', MODULE_SOURCE.format(name='Third', default=None))
+        project, cache = self.collect()
+        self.assertEqual(sorted(cache.entries), ['first.py', 'third.py'])
+        self.assertEqual(sorted(module.py_path for module in project.modules), ['first', 'third'])
+
+    def test_other_mode_is_not_reused(self):
+        self.collect()
+        self.assertEqual(ScanCache(self.cache_path, 'import').entries, {})
+
+    def test_import_mode_rescans_when_an_imported_module_changed(self):
+        self.write('third.py', 'from first import First\n\nclass Third(First):\n    pass\n')
+
+        def collect():
+            cache = ScanCache(self.cache_path, 'import')
+            LundyProject('Lundy').scan(self.src, mode='import', cache=cache)
+            cache.save()
+            return cache
+
+        self.assertEqual(collect().entries['third.py']['dependencies'].keys(), ['first.py'])
+        self.write('first.py', MODULE_SOURCE.format(name='First', default=(1, 2)))
+        cache = collect()
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
@@ -5,7 +5,7 @@ import mongomock as mongomock
 
 from lundy.datasets import LundyObject, LundyModule, ResultPackage
 from lundy.test.sample_project_dir.sample_class import SampleClass
-from main import Lundy
+from main import Lundy, MethodSignature, method_wrapper
 
 
 class BasicMethodTests(unittest.TestCase):
@@ -22,6 +22,148 @@ class BasicMethodTests(unittest.TestCase):
 
 
 
+def sample_function(a, b=1):
+    return a + b
+
+
+def other_sample_function(a, b=1, c=2):
+    return a + b + c
+
+
+class FirstStore(object):
+    @Lundy.collector()
+    def get(self, key):
+        return key
+
+
+class SecondStore(object):
+    @Lundy.collector()
+    def get(self, key):
+        return key
+
+
+@patch('main.get_shipper')
+class MethodSignatureTests(unittest.TestCase):
+    def setUp(self):
+        self.wrapped = method_wrapper(sample_function)
+        self.signature = self.wrapped.lundy_signature
+
+    def test_hash_computed_once(self, get_shipper_patch):
+        self.wrapped(1)
+        lundy_method = self.signature.method
+        self.wrapped(2)
+        self.assertIs(self.signature.method, lundy_method)
+        hashes = [call[0][1]['hash'] for call in get_shipper_patch.return_value.put.call_args_list
+                  if call[0][0] == 'lunni_run']
+        self.assertEqual(hashes, [self.signature.hash] * 2)
+
+    def test_invalidate(self, get_shipper_patch):
+        self.wrapped(1)
+        lundy_method = self.signature.method
+        Lundy.invalidate_signatures()
+        self.assertIsNone(self.signature.hash)
+        self.wrapped(1)
+        self.assertIsNot(self.signature.method, lundy_method)
+
+    def test_qualname_search_not_repeated(self, get_shipper_patch):
+        with patch('main.find_class_member', return_value=None) as find_patch:
+            self.wrapped(1)
+            self.wrapped(2)
+            self.assertEqual(self.signature.name(), __name__ + '.sample_function')
+        self.assertEqual(find_patch.call_count, 1)
+
+    def test_code_reload(self, get_shipper_patch):
+        function = lambda a: a
+        wrapped = method_wrapper(function)
+        wrapped(1)
+        old_hash = wrapped.lundy_signature.hash
+        function.__code__ = other_sample_function.__code__
+        function.__defaults__ = other_sample_function.__defaults__
+        wrapped(1)
+        self.assertNotEqual(wrapped.lundy_signature.hash, old_hash)
+
+
+@patch('main.get_shipper')
+class MethodStorageTests(unittest.TestCase):
+    def put_calls(self, get_shipper_patch, collection):
+        return [call[0][1] for call in get_shipper_patch.return_value.put.call_args_list
+                if call[0][0] == collection]
+
+    def test_method_stored_once(self, get_shipper_patch):
+        function = lambda stored_once, default='x': stored_once
+        wrapped = method_wrapper(function)
+        wrapped(1)
+        wrapped(2)
+        method_document, = self.put_calls(get_shipper_patch, 'lunni_method')
+        self.assertEqual(method_document['_id'], wrapped.lundy_signature.hash)
+        self.assertEqual(method_document['module'], __name__)
+        self.assertEqual(method_document['qualname'], '<lambda>')
+        self.assertEqual([arg['name'] for arg in method_document['args']], ['stored_once', 'default'])
+        self.assertEqual(len(self.put_calls(get_shipper_patch, 'lunni_run')), 2)
+
+    def test_same_signature_in_different_classes(self, get_shipper_patch):
+        FirstStore().get(1)
+        SecondStore().get(1)
+        first, second = self.put_calls(get_shipper_patch, 'lunni_method')
+        self.assertEqual((first['qualname'], second['qualname']), ('FirstStore.get', 'SecondStore.get'))
+        self.assertNotEqual(first['hash'], second['hash'])
+        self.assertEqual(first['signature_hash'], second['signature_hash'])
+        runs = self.put_calls(get_shipper_patch, 'lunni_run')
+        self.assertEqual([run['hash'] for run in runs], [first['hash'], second['hash']])
+
+    def test_lost_method_is_stored_again(self, get_shipper_patch):
+        wrapped = method_wrapper(lambda stored_again: stored_again)
+        wrapped(1)
+        method_call, = [call for call in get_shipper_patch.return_value.put.call_args_list
+                        if call[0][0] == 'lunni_method']
+        method_call[1]['on_lost']()
+        wrapped(2)
+        self.assertEqual(len(self.put_calls(get_shipper_patch, 'lunni_method')), 2)
+
+    def test_method_qualname(self, get_shipper_patch):
+        self.assertEqual(MethodSignature(SampleClass.sample_method).qualname(), 'SampleClass.sample_method')
+
+    def test_compact_run_document(self, get_shipper_patch):
+        method_wrapper(sample_function)(1)
+        document = self.put_calls(get_shipper_patch, 'lunni_run')[-1]
+        self.assertEqual(sorted(document), ['data', 'hash', 'timestamp'])
+        self.assertEqual(document['data']['args'], (1, 1))
+        self.assertNotIn('name', document['data'])
+
+
+@patch('main.get_shipper')
+class TimingTests(unittest.TestCase):
+    def recorded(self, get_shipper_patch):
+        return get_shipper_patch.return_value.put.call_args[0][1]['data']
+
+    def test_duration(self, get_shipper_patch):
+        method_wrapper(sample_function)(1)
+        data = self.recorded(get_shipper_patch)
+        self.assertIsInstance(data['duration_ns'], (int, long))
+        self.assertAlmostEqual(data['duration'], data['duration_ns'] / 1e9)
+        self.assertIsNone(data['cpu_time'])
+        self.assertIsNone(data['allocations'])
+
+    def test_cpu_time(self, get_shipper_patch):
+        method_wrapper(lambda: sum(range(100000)), cpu_time=True)()
+        self.assertGreater(self.recorded(get_shipper_patch)['cpu_time'], 0)
+
+
+    def test_lundy_work_is_not_measured(self, get_shipper_patch):
+        from clock import thread_cpu_ns
+
+        def slow_store(*args):
+            end = thread_cpu_ns() + 50000000
+            while thread_cpu_ns() < end:
+                pass
+            return 'hash'
+        with patch('main.store_method', side_effect=slow_store):
+            method_wrapper(sample_function, cpu_time=True)(1)
+        data = self.recorded(get_shipper_patch)
+        self.assertLess(data['cpu_time'], 25000000)
+        self.assertLess(data['duration_ns'], 25000000)
+
+
 class BasicCollectTests(unittest.TestCase):
     def setUp(self):
         pass
@@ -61,3 +203,100 @@ class BasicCollectTests(unittest.TestCase):
         for key, value in data['args'][0].items():
             setattr(fake_self, key, value)
         self.assertEqual(data['result'], SampleClass.__dict__['sample_method_with_args'](fake_self, data['args'][1], data['args'][2]))
+
+
+def failing_function(a):
+    raise ValueError("bad value {}".format(a))
+
+
+@patch('main.get_shipper')
+class ExceptionTests(unittest.TestCase):
+    def test_failed_call_is_recorded_and_reraised(self, get_shipper_patch):
+        wrapped = method_wrapper(failing_function)
+        with self.assertRaises(ValueError) as context:
+            wrapped(3)
+        self.assertEqual(str(context.exception), "bad value 3")
+        document = get_shipper_patch.return_value.put.call_args[0][1]
+        exception = document['data']['exception']
+        self.assertEqual(exception['type'], 'exceptions.ValueError')
+        self.assertEqual(exception['message'], 'bad value 3')
+        self.assertIn('failing_function', exception['traceback'])
+        self.assertGreater(document['data']['duration_ns'], 0)
+
+    def test_original_traceback_is_kept(self, get_shipper_patch):
+        import sys
+        import traceback
+        try:
+            method_wrapper(failing_function)(3)
+        except ValueError:
+            frames = traceback.extract_tb(sys.exc_info()[2])
+        self.assertEqual(frames[-1][2], 'failing_function')
+
+    def test_recording_error_does_not_mask_exception(self, get_shipper_patch):
+        get_shipper_patch.return_value.put.side_effect = IOError("queue is broken")
+        self.assertRaises(ValueError, method_wrapper(failing_function), 3)
+
+    def test_recording_error_does_not_fail_the_call(self, get_shipper_patch):
+        get_shipper_patch.return_value.put.side_effect = IOError("queue is broken")
+        self.assertEqual(method_wrapper(sample_function)(1), 2)
+
+    def test_successful_call_has_no_exception(self, get_shipper_patch):
+        method_wrapper(sample_function)(1)
+        self.assertIsNone(get_shipper_patch.return_value.put.call_args[0][1]['data']['exception'])
+
+
+class FakeFuture(object):
+    """ The part of the asyncio/concurrent.futures Future interface the collector uses """
+    def __init__(self):
+        self.callbacks = []
+        self._result = None
+        self._exception = None
+        self._cancelled = False
+
+    def add_done_callback(self, callback):
+        self.callbacks.append(callback)
+
+    def cancelled(self):
+        return self._cancelled
+
+    def exception(self):
+        return self._exception
+
+    def result(self):
+        return self._result
+
+    def complete(self, result=None, exception=None, cancelled=False):
+        self._result = result
+        self._exception = exception
+        self._cancelled = cancelled
+        for callback in self.callbacks:
+            callback(self)
+
+
+@patch('main.get_shipper')
+class FutureTests(unittest.TestCase):
+    def runs(self, get_shipper_patch):
+        return [call for call in get_shipper_patch.return_value.put.call_args_list if call[0][0] == 'lunni_run']
+
+    def test_recorded_when_done(self, get_shipper_patch):
+        future = FakeFuture()
+        wrapped = method_wrapper(lambda a: future)
+        self.assertIs(wrapped(1), future)
+        self.assertEqual(self.runs(get_shipper_patch), [])
+        future.complete(result=3)
+        run, = self.runs(get_shipper_patch)
+        self.assertEqual(run[0][1]['data']['result'], 3)
+        self.assertEqual(run[1], {'block': False})
+
+    def test_failed_future(self, get_shipper_patch):
+        future = FakeFuture()
+        method_wrapper(lambda: future)()
+        future.complete(exception=ValueError("bad value"))
+        run, = self.runs(get_shipper_patch)
+        self.assertEqual(run[0][1]['data']['exception']['type'], 'exceptions.ValueError')
+
+    def test_cancelled_future_is_not_recorded(self, get_shipper_patch):
+        future = FakeFuture()
+        method_wrapper(lambda: future)()
+        future.complete(cancelled=True)
+        self.assertEqual(self.runs(get_shipper_patch), [])
@@ -0,0 +1,76 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import patch
+
+from lundy import database
+from lundy.database import ConnectionManager, client_options, get_database, read_config
+
+
+class ReadConfigTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.config_path = os.path.join(self.tmp_dir, '.lunni')
+        self.write_config('uri=mongodb://localhost/lunni\npool_size=5\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_config(self, content, mtime=None):
+        with open(self.config_path, 'w') as f:
+            f.write(content)
+        if mtime:
+            os.utime(self.config_path, (mtime, mtime))
+
+    def test_parse(self):
+        config = read_config(self.config_path)
+        self.assertEqual(config, {'uri': 'mongodb://localhost/lunni', 'pool_size': '5'})
+
+    def test_parsed_once(self):
+        config = read_config(self.config_path)
+        with patch('lundy.database.open', create=True) as open_patch:
+            self.assertEqual(read_config(self.config_path), config)
+            self.assertFalse(open_patch.called)
+
+    def test_changes_do_not_reach_the_cache(self):
+        read_config(self.config_path)['uri'] = 'changed'
+        self.assertEqual(read_config(self.config_path)['uri'], 'mongodb://localhost/lunni')
+
+    def test_invalidated_on_change(self):
+        self.write_config('uri=mongodb://localhost/lunni\n', mtime=1000)
+        read_config(self.config_path)
+        self.write_config('uri=mongodb://otherhost/lunni\n', mtime=2000)
+        self.assertEqual(read_config(self.config_path)['uri'], 'mongodb://otherhost/lunni')
+
+    def test_missing_file(self):
+        self.assertEqual(read_config(os.path.join(self.tmp_dir, 'missing')), {})
+
+    def test_client_options(self):
+        options = client_options({'pool_size': '5', 'connect_timeout': '200', 'uri': 'x'})
+        self.assertEqual(options, {'maxPoolSize': 5, 'connectTimeoutMS': 200})
+
+    def test_get_database_reuses_client(self):
+        with patch.dict(os.environ, {'LUNNICONFIG': self.config_path}):
+            self.assertIs(get_database().client, get_database().client)
+
+    def test_get_database_creates_indexes(self):
+        with patch.dict(os.environ, {'LUNNICONFIG': self.config_path}):
+            db = get_database()
+        self.assertIn('hash_1_timestamp_1', db.lunni_run.index_information())
+        self.assertIn('module_1_qualname_1', db.lunni_method.index_information())
+
+
+class ConnectionManagerTests(unittest.TestCase):
+    def test_one_client_per_uri(self):
+        manager = ConnectionManager()
+        client = manager.get_client('mongodb://a', maxPoolSize=5)
+        self.assertIs(manager.get_client('mongodb://a', maxPoolSize=5), client)
+        self.assertIsNot(manager.get_client('mongodb://b', maxPoolSize=5), client)
+
+    def test_reconnect_after_fork(self):
+        manager = ConnectionManager()
+        client = manager.get_client('mongodb://a')
+        with patch.object(database.os, 'getpid', return_value=manager._pid + 1):
+            self.assertIsNot(manager.get_client('mongodb://a'), client)
@@ -0,0 +1,82 @@
+import json
+import os
+import unittest
+
+from lundy.datasets import LundyArg, LundyClass, LundyMethod, LundyModule, LundyProject
+from lundy.diff import apply_delta, diff_projects
+
+
+def build_project():
+    project = LundyProject('Lundy')
+    for module_name in ('first', 'second'):
+        module = LundyModule(module_name, module_name + '.py')
+        for class_name in ('A', 'B'):
+            lundy_class = LundyClass(class_name)
+            for method_name in ('__init__', 'run'):
+                method = LundyMethod(method_name)
+                method.args = [LundyArg('self'), LundyArg('size', 1, int)]
+                lundy_class.methods.append(method)
+            module.classes.append(lundy_class)
+        project.modules.append(module)
+    return project
+
+
+class DiffTests(unittest.TestCase):
+    def setUp(self):
+        self.old = build_project()
+        self.new = build_project()
+
+    def assert_applies(self):
+        delta = diff_projects(self.old, self.new)
+        # deltas are sent as JSON
+        delta = json.loads(json.dumps(delta))
+        patched = apply_delta(build_project(), delta)
+        self.assertEqual(patched.to_string(), self.new.to_string())
+        self.assertEqual(patched.hash, self.new.hash)
+        return delta
+
+    def test_equal_projects(self):
+        self.assertEqual(diff_projects(self.old, self.new), {})
+
+    def test_changed_arg(self):
+        self.new.modules[1].classes[0].methods[1].args[1] = LundyArg('size', 'big', str)
+        delta = self.assert_applies()
+        module_delta, = delta['changed']
+        self.assertEqual(module_delta['key'], 'second.py')
+        method_delta = module_delta['changed'][0]['changed'][0]
+        self.assertEqual(method_delta['key'], 'run')
+        self.assertEqual(method_delta['changed'],
+                         [{'key': 'size', 'fields': {'default': 'big', 'type': "<type 'str'>"}}])
+
+    def test_added_and_removed(self):
+        self.new.modules[0].classes.pop(0)
+        self.new.modules[0].classes[0].methods.append(LundyMethod('stop'))
+        self.new.modules.append(LundyModule('third', 'third.py'))
+        delta = self.assert_applies()
+        self.assertEqual([module['py_path'] for module in delta['added']], ['third'])
+        first_delta, = delta['changed']
+        self.assertEqual(first_delta['removed'], ['A'])
+        self.assertEqual(first_delta['changed'][0]['added'], [LundyMethod('stop').to_json()])
+        self.assertNotIn('order', delta)
+
+    def test_reordered(self):
+        self.new.modules.reverse()
+        delta = self.assert_applies()
+        self.assertEqual(delta['order'], ['second.py', 'first.py'])
+        self.assertNotIn('changed', delta)
+
+    def test_changed_field(self):
+        self.new.modules[0].py_path = 'package.first'
+        delta = self.assert_applies()
+        self.assertEqual(delta['changed'], [{'key': 'first.py', 'fields': {'py_path': 'package.first'}}])
+
+    def test_scanned_project(self):
+        project_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'sample_project_dir')
+        self.old = LundyProject('Lundy')
+        self.old.scan(project_dir, mode='static')
+        self.new = LundyProject.from_string(self.old.to_string())
+        self.new.modules[0].classes[0].methods[0].args.append(LundyArg('extra'))
+        delta = diff_projects(self.old, self.new)
+        self.assertEqual(len(json.dumps(delta)) * 10 < len(self.new.to_string()), True)
+        patched = apply_delta(LundyProject.from_string(self.old.to_string()), delta)
+        self.assertEqual(patched.hash, self.new.hash)
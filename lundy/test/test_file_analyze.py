@@ -1,6 +1,7 @@
 import importlib
 import os
 import unittest
+from mock import patch
 from types import NoneType
 
 from lundy.datasets import LundyModule, LundyMethod, LundyClass, LundyArg, LundyProject
@@ -11,9 +12,9 @@ module = 'sample_project_dir.sample_class'
 module = importlib.import_module(module)
 
 EXPECTED_MODULES = [
-    LundyModule('sample_class', 'sample_class.py'),
     LundyModule('a_bit_complex_class',
                 'a_bit_complex_class.py'),
+    LundyModule('sample_class', 'sample_class.py'),
     LundyModule('sample_package.second_sample_class',
                 'sample_package/second_sample_class.py'),
 ]
@@ -41,6 +42,27 @@ class LundyProjectTests(unittest.TestCase):
     def test_to_json(self):
         self.project.scan(self.project_dir)
         EXPECTED_JSON = {'modules': [{'classes': [{'methods': [{'args': [], 'name': '__doc__'},
+                                       {'args': [], 'name': '__module__'}],
+                           'name': 'ABitMoreComplexClass'},
+                          {'methods': [{'args': [], 'name': '__doc__'},
+                                       {'args': [{'default': None,
+                                                  'name': 'self',
+                                                  'type': None},
+                                                 {'default': None,
+                                                  'name': 'a',
+                                                  'type': None},
+                                                 {'default': None,
+                                                  'name': 'b',
+                                                  'type': None}],
+                                        'name': '__init__'},
+                                       {'args': [], 'name': '__module__'}],
+                           'name': 'NormalClass'},
+                          {'methods': [{'args': [], 'name': '__doc__'},
+                                       {'args': [], 'name': '__module__'}],
+                           'name': 'SomethingGoesCrazyClass'}],
+              'os_path': 'a_bit_complex_class.py',
+              'py_path': 'a_bit_complex_class'},
+             {'classes': [{'methods': [{'args': [], 'name': '__doc__'},
                                        {'args': [{'default': None,
                                                   'name': 'self',
                                                   'type': None},
@@ -98,27 +120,6 @@ class LundyProjectTests(unittest.TestCase):
                            'name': 'SampleClass2'}],
               'os_path': 'sample_class.py',
               'py_path': 'sample_class'},
-             {'classes': [{'methods': [{'args': [], 'name': '__doc__'},
-                                       {'args': [], 'name': '__module__'}],
-                           'name': 'ABitMoreComplexClass'},
-                          {'methods': [{'args': [], 'name': '__doc__'},
-                                       {'args': [{'default': None,
-                                                  'name': 'self',
-                                                  'type': None},
-                                                 {'default': None,
-                                                  'name': 'a',
-                                                  'type': None},
-                                                 {'default': None,
-                                                  'name': 'b',
-                                                  'type': None}],
-                                        'name': '__init__'},
-                                       {'args': [], 'name': '__module__'}],
-                           'name': 'NormalClass'},
-                          {'methods': [{'args': [], 'name': '__doc__'},
-                                       {'args': [], 'name': '__module__'}],
-                           'name': 'SomethingGoesCrazyClass'}],
-              'os_path': 'a_bit_complex_class.py',
-              'py_path': 'a_bit_complex_class'},
              {'classes': [{'methods': [{'args': [], 'name': '__doc__'},
                                        {'args': [], 'name': '__module__'}],
                            'name': 'SampleTwo'}],
@@ -126,7 +127,7 @@ class LundyProjectTests(unittest.TestCase):
               'py_path': 'sample_package.second_sample_class'}],
  'name': 'Lundy'}
         self.assertEqual(self.project.to_json(), EXPECTED_JSON)
-        EXPECTED_STRING = '''{"modules": [{"classes": [{"name": "SampleClass", "methods": [{"args": [], "name": "__doc__"}, {"args": [{"default": null, "type": null, "name": "self"}, {"default": null, "type": null, "name": "var2"}, {"default": null, "type": null, "name": "var3"}], "name": "__init__"}, {"args": [], "name": "__module__"}, {"args": [{"default": null, "type": null, "name": "self"}], "name": "sample_method"}, {"args": [{"default": null, "type": null, "name": "self"}, {"default": null, "type": null, "name": "arg1"}, {"default": null, "type": null, "name": "arg2"}], "name": "sample_method_with_args"}, {"args": [{"default": null, "type": null, "name": "self"}, {"default": null, "type": null, "name": "arg5"}, {"default": null, "type": null, "name": "arg6"}, {"default": null, "type": "<type \'NoneType\'>", "name": "arg7"}, {"default": 4, "type": "<type \'int\'>", "name": "arg8"}], "name": "sample_method_with_args_and_kwargs"}, {"args": [{"default": null, "type": null, "name": "self"}, {"default": null, "type": "<type \'NoneType\'>", "name": "arg3"}, {"default": 4, "type": "<type \'int\'>", "name": "arg4"}], "name": "sample_method_with_kwargs"}]}, {"name": "SampleClass2", "methods": [{"args": [], "name": "__doc__"}, {"args": [], "name": "__module__"}]}], "py_path": "sample_class", "os_path": "sample_class.py"}, {"classes": [{"name": "ABitMoreComplexClass", "methods": [{"args": [], "name": "__doc__"}, {"args": [], "name": "__module__"}]}, {"name": "NormalClass", "methods": [{"args": [], "name": "__doc__"}, {"args": [{"default": null, "type": null, "name": "self"}, {"default": null, "type": null, "name": "a"}, {"default": null, "type": null, "name": "b"}], "name": "__init__"}, {"args": [], "name": "__module__"}]}, {"name": "SomethingGoesCrazyClass", "methods": [{"args": [], "name": "__doc__"}, {"args": [], "name": "__module__"}]}], "py_path": "a_bit_complex_class", "os_path": "a_bit_complex_class.py"}, {"classes": [{"name": "SampleTwo", "methods": [{"args": [], "name": "__doc__"}, {"args": [], "name": "__module__"}]}], "py_path": "sample_package.second_sample_class", "os_path": "sample_package/second_sample_class.py"}], "name": "Lundy"}'''
+        EXPECTED_STRING = '''{"modules": [{"classes": [{"name": "ABitMoreComplexClass", "methods": [{"args": [], "name": "__doc__"}, {"args": [], "name": "__module__"}]}, {"name": "NormalClass", "methods": [{"args": [], "name": "__doc__"}, {"args": [{"default": null, "type": null, "name": "self"}, {"default": null, "type": null, "name": "a"}, {"default": null, "type": null, "name": "b"}], "name": "__init__"}, {"args": [], "name": "__module__"}]}, {"name": "SomethingGoesCrazyClass", "methods": [{"args": [], "name": "__doc__"}, {"args": [], "name": "__module__"}]}], "py_path": "a_bit_complex_class", "os_path": "a_bit_complex_class.py"}, {"classes": [{"name": "SampleClass", "methods": [{"args": [], "name": "__doc__"}, {"args": [{"default": null, "type": null, "name": "self"}, {"default": null, "type": null, "name": "var2"}, {"default": null, "type": null, "name": "var3"}], "name": "__init__"}, {"args": [], "name": "__module__"}, {"args": [{"default": null, "type": null, "name": "self"}], "name": "sample_method"}, {"args": [{"default": null, "type": null, "name": "self"}, {"default": null, "type": null, "name": "arg1"}, {"default": null, "type": null, "name": "arg2"}], "name": "sample_method_with_args"}, {"args": [{"default": null, "type": null, "name": "self"}, {"default": null, "type": null, "name": "arg5"}, {"default": null, "type": null, "name": "arg6"}, {"default": null, "type": "<type \'NoneType\'>", "name": "arg7"}, {"default": 4, "type": "<type \'int\'>", "name": "arg8"}], "name": "sample_method_with_args_and_kwargs"}, {"args": [{"default": null, "type": null, "name": "self"}, {"default": null, "type": "<type \'NoneType\'>", "name": "arg3"}, {"default": 4, "type": "<type \'int\'>", "name": "arg4"}], "name": "sample_method_with_kwargs"}]}, {"name": "SampleClass2", "methods": [{"args": [], "name": "__doc__"}, {"args": [], "name": "__module__"}]}], "py_path": "sample_class", "os_path": "sample_class.py"}, {"classes": [{"name": "SampleTwo", "methods": [{"args": [], "name": "__doc__"}, {"args": [], "name": "__module__"}]}], "py_path": "sample_package.second_sample_class", "os_path": "sample_package/second_sample_class.py"}], "name": "Lundy"}'''
         string_from_project = self.project.to_string()
         self.assertEqual(string_from_project, EXPECTED_STRING)
 
@@ -136,7 +137,7 @@ class LundyProjectTests(unittest.TestCase):
 
     def test_hash(self):
         self.project.scan(self.project_dir)
-        EXPECTED_HASH = 'cf92971ae32948efb0d608544981b4dea15d5294b117b50ecf040f87a62a507c'
+        EXPECTED_HASH = 'cf92971ae32948efb0d608544981b4dee9df8bb5c46f6e2b9cf4902df7dc36c1'
         self.assertEqual(self.project.hash, EXPECTED_HASH)
 
 
@@ -378,4 +379,121 @@ class LundyArgABitMoreComplexTests(unittest.TestCase):
         self.lundy_class = LundyClass('SampleClass')
 
     def test_scan(self):
-        self.lundy_class.scan(SomethingGoesCrazyClass)
\ No newline at end of file
+        self.lundy_class.scan(SomethingGoesCrazyClass)
+
+class StaticScanTests(unittest.TestCase):
+    def setUp(self):
+        dir_path = os.path.dirname(os.path.realpath(__file__))
+        self.project_dir = os.path.join(dir_path, 'sample_project_dir')
+
+    def test_same_as_import_scan(self):
+        imported = LundyProject("Lundy")
+        imported.scan(self.project_dir)
+        static = LundyProject("Lundy")
+        static.scan(self.project_dir, mode='static')
+        self.assertEqual(static.to_json(), imported.to_json())
+        self.assertEqual(static.hash, imported.hash)
+
+    def test_scan_source(self):
+        source = '''
+import os
+
+
+class Parsed:
+    """Doc"""
+    attribute = os.sep
+
+    def method(self, a, b='b', c=None, d=(1, 2), e=os.sep):
+        pass
+'''
+        lundy_module = LundyModule('parsed', 'parsed.py')
+        lundy_module.scan_source(source)
+        methods = lundy_module.classes[0].methods
+        self.assertEqual([method.name for method in methods], ['__doc__', '__module__', 'attribute', 'method'])
+        self.assertEqual([(arg.name, arg.default, arg.type) for arg in methods[3].args],
+                         [('self', None, None), ('a', None, None), ('b', 'b', str), ('c', None, NoneType),
+                          ('d', (1, 2), tuple), ('e', None, None)])
+
+    def test_unknown_mode(self):
+        self.assertRaises(ValueError, LundyProject("Lundy").scan, self.project_dir, mode='guess')
+
+
+class ParallelScanTests(unittest.TestCase):
+    def setUp(self):
+        dir_path = os.path.dirname(os.path.realpath(__file__))
+        self.project_dir = os.path.join(dir_path, 'sample_project_dir')
+
+    def test_same_as_sequential_scan(self):
+        for mode in LundyProject.SCAN_MODES:
+            sequential = LundyProject("Lundy")
+            sequential.scan(self.project_dir, mode=mode)
+            parallel = LundyProject("Lundy")
+            parallel.scan(self.project_dir, mode=mode, workers=2)
+            self.assertEqual(parallel.to_string(), sequential.to_string())
+            self.assertEqual(parallel.hash, sequential.hash)
+
+
+class HashMemoTests(unittest.TestCase):
+    def setUp(self):
+        self.lundy_class = LundyClass('SampleClass')
+        self.lundy_class.scan(SampleClass)
+        self.method = self.lundy_class.methods[-1]
+
+    def test_hash_is_memoized(self):
+        class_hash = self.lundy_class.hash
+        with patch.object(LundyClass, 'to_string') as to_string_patch:
+            self.assertEqual(self.lundy_class.hash, class_hash)
+            self.assertFalse(to_string_patch.called)
+
+    def test_child_change_invalidates_ancestors(self):
+        class_hash = self.lundy_class.hash
+        merkle_hash = self.lundy_class.merkle_hash
+        self.method.args[0].name = 'this'
+        self.assertNotEqual(self.lundy_class.hash, class_hash)
+        self.assertNotEqual(self.lundy_class.merkle_hash, merkle_hash)
+
+        class_hash = self.lundy_class.hash
+        self.method.args.append(LundyArg('extra'))
+        self.assertNotEqual(self.lundy_class.hash, class_hash)
+        class_hash = self.lundy_class.hash
+        self.method.args.pop()
+        self.method.args[0].name = 'self'
+        self.assertNotEqual(self.lundy_class.hash, class_hash)
+
+    def test_same_hash_as_fresh_tree(self):
+        self.lundy_class.hash
+        self.method.args = [LundyArg('self')]
+        fresh = LundyClass.from_string(self.lundy_class.to_string())
+        self.assertEqual(self.lundy_class.hash, fresh.hash)
+        self.assertEqual(self.lundy_class.merkle_hash, fresh.merkle_hash)
+
+    def test_merkle_hash_of_equal_subtrees(self):
+        other = LundyClass('SampleClass')
+        other.scan(SampleClass)
+        other.methods[0].name = '__changed__'
+        self.assertNotEqual(other.merkle_hash, self.lundy_class.merkle_hash)
+        for method, other_method in zip(self.lundy_class.methods[1:], other.methods[1:]):
+            self.assertEqual(method.merkle_hash, other_method.merkle_hash)
+
+    def test_to_json_ignores_cached_state(self):
+        expected = self.lundy_class.to_string()
+        self.lundy_class.hash
+        self.lundy_class.merkle_hash
+        self.assertEqual(self.lundy_class.to_string(), expected)
+
+
+class SlotsTests(unittest.TestCase):
+    def test_nodes_have_no_instance_dict(self):
+        for node in (LundyArg('a'), LundyMethod('m'), LundyClass('C'), LundyModule('m', 'm.py'), LundyProject('p')):
+            self.assertFalse(hasattr(node, '__dict__'))
+            with self.assertRaises(AttributeError):
+                node.unknown = 1
+
+    def test_names_are_interned(self):
+        method = LundyMethod.from_string('{"name": "run", "args": [{"name": "self", "default": null, "type": null}]}')
+        self.assertIs(method.name, LundyMethod('run').name)
+        self.assertIs(method.args[0].name, LundyArg('self').name)
+
+    def test_to_json_field_order(self):
+        arg = LundyArg('a', 1, int)
+        self.assertEqual(arg.to_string(), '{"default": 1, "type": "<type \'int\'>", "name": "a"}')
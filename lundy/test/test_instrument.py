@@ -0,0 +1,128 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from mock import patch
+
+from instrument import InstrumentHook, install, parse_patterns, uninstall
+
+MODULE_SOURCE = '''
+import os
+import json
+
+
+def hot(a, b=1):
+    return a + b
+
+
+def cold():
+    return 0
+
+
+class Cache:
+    def get(self, key):
+        return key
+
+    def get_many(self, keys):
+        return keys
+
+    def put(self, key):
+        return key
+
+    @staticmethod
+    def size():
+        return 0
+'''
+
+
+@patch('main.get_shipper')
+class InstrumentTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        package = os.path.join(self.directory, 'instrumented_app')
+        os.mkdir(package)
+        open(os.path.join(package, '__init__.py'), 'w').close()
+        for name in ('service', 'other'):
+            with open(os.path.join(package, name + '.py'), 'w') as f:
+                f.write(MODULE_SOURCE)
+        sys.path.insert(0, self.directory)
+        self.addCleanup(self.cleanup)
+
+    def cleanup(self):
+        uninstall()
+        sys.path.remove(self.directory)
+        for name in list(sys.modules):
+            if name.startswith('instrumented_app'):
+                del sys.modules[name]
+        shutil.rmtree(self.directory)
+
+    def runs(self, get_shipper_patch):
+        return [call[0][1] for call in get_shipper_patch.return_value.put.call_args_list
+                if call[0][0] == 'lunni_run']
+
+    def test_selected_functions_are_wrapped(self, get_shipper_patch):
+        hook = install({'instrument': 'instrumented_app.serv*:hot, instrumented_app.service:Cache.*',
+                        'instrument_exclude': 'instrumented_app.service:Cache.put'})
+        from instrumented_app import other, service
+        self.assertTrue(hasattr(service.hot, 'lundy_signature'))
+        self.assertFalse(hasattr(service.cold, 'lundy_signature'))
+        self.assertTrue(hasattr(service.Cache.__dict__['get'], 'lundy_signature'))
+        self.assertFalse(hasattr(service.Cache.__dict__['put'], 'lundy_signature'))
+        self.assertFalse(hasattr(other.hot, 'lundy_signature'))
+        self.assertEqual(hook.wrapped, 4)
+
+        self.assertEqual(service.hot(1), 2)
+        self.assertEqual(service.Cache().get('a'), 'a')
+        self.assertEqual(service.Cache.size(), 0)
+        self.assertEqual(other.hot(1), 2)
+        self.assertEqual(len(self.runs(get_shipper_patch)), 3)
+        methods = [call[0][1] for call in get_shipper_patch.return_value.put.call_args_list
+                   if call[0][0] == 'lunni_method']
+        self.assertIn(('instrumented_app.service', 'Cache.get'),
+                      [(method['module'], method['qualname']) for method in methods])
+
+    def test_module_with_imports(self, get_shipper_patch):
+        install({'instrument': 'instrumented_app.*'})
+        from instrumented_app import service
+        self.assertIs(service.os, os)
+        self.assertIsNone(sys.modules.get('instrumented_app.os'))
+        self.assertTrue(hasattr(service.hot, 'lundy_signature'))
+
+    def test_functions_are_left_unchanged(self, get_shipper_patch):
+        install({'instrument': 'instrumented_app.service:Cache.*'})
+        from instrumented_app import service
+        wrapper = service.Cache.__dict__['get']
+        self.assertEqual(wrapper.lundy_signature.qualname(), 'Cache.get')
+        self.assertFalse(hasattr(wrapper.__wrapped__, '__qualname__'))
+
+    def test_modules_imported_before_install(self, get_shipper_patch):
+        from instrumented_app import service
+        install({'instrument': 'instrumented_app.service:hot'})
+        self.assertEqual(service.hot(2), 3)
+        self.assertEqual(len(self.runs(get_shipper_patch)), 1)
+
+    def test_no_patterns(self, get_shipper_patch):
+        meta_path = list(sys.meta_path)
+        self.assertIsNone(install({}))
+        self.assertEqual(sys.meta_path, meta_path)
+
+    def test_sampling_from_config(self, get_shipper_patch):
+        install({'instrument': 'instrumented_app.service:hot', 'every_nth': '2'})
+        from instrumented_app import service
+        for _ in range(4):
+            service.hot(1)
+        self.assertEqual(len(self.runs(get_shipper_patch)), 2)
+
+
+class PatternTests(unittest.TestCase):
+    def test_matches(self):
+        hook = InstrumentHook(parse_patterns('app.*,lib:Query.*'), parse_patterns('app.tests*,app.models:*.__repr__'))
+        self.assertTrue(hook.matches('app.views', 'index'))
+        self.assertTrue(hook.matches('lib', 'Query.run'))
+        self.assertFalse(hook.matches('lib', 'run'))
+        self.assertFalse(hook.matches('app.tests.test_views', 'test_index'))
+        self.assertFalse(hook.matches('app.models', 'User.__repr__'))
+        self.assertTrue(hook.matches_module('app.tests'))
+        self.assertFalse(hook.matches_module('other'))
@@ -0,0 +1,40 @@
+import os
+import unittest
+from StringIO import StringIO
+
+from lundy.datasets import LundyArg, LundyProject
+from lundy.loader import iter_modules, load_project, stream_project
+
+
+class LoaderTests(unittest.TestCase):
+    def setUp(self):
+        project_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'sample_project_dir')
+        self.project = LundyProject('Lundy')
+        self.project.scan(project_dir, mode='static')
+        self.project.modules[0].classes[0].methods[0].args.append(LundyArg('size', 12345, int))
+        self.string = self.project.to_string()
+
+    def test_load_project(self):
+        project = load_project(StringIO(self.string))
+        self.assertEqual(project.to_string(), self.string)
+        self.assertEqual(project.hash, self.project.hash)
+
+    def test_stream_project(self):
+        for chunk_size in (1, 7, 100, 65536):
+            project = stream_project(StringIO(self.string), chunk_size)
+            self.assertEqual(project.to_string(), self.string)
+
+    def test_iter_modules(self):
+        fields = {}
+        modules = list(iter_modules(StringIO(self.string), 16, fields))
+        self.assertEqual([module.os_path for module in modules],
+                         [module.os_path for module in self.project.modules])
+        self.assertEqual(fields, {'name': 'Lundy'})
+
+    def test_empty_project(self):
+        self.assertEqual(stream_project(StringIO(' { "modules" : [ ] , "name" : "Lundy" } ')).name, 'Lundy')
+        self.assertEqual(list(iter_modules(StringIO('{}'))), [])
+
+    def test_truncated_file(self):
+        with self.assertRaises(ValueError):
+            stream_project(StringIO(self.string[:-30]), 16)
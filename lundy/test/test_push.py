@@ -0,0 +1,152 @@
+import BaseHTTPServer
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from lundy.datasets import LundyClass, LundyModule, LundyProject
+from lundy.push import Ledger, Uploader, UploadError
+
+
+class StubHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        with server.lock:
+            status = server.statuses.pop(0) if server.statuses else 201
+            server.requests.append((self.headers['Idempotency-Key'], body, status))
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class StubServer(BaseHTTPServer.HTTPServer):
+    def __init__(self):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), StubHandler)
+        self.lock = threading.Lock()
+        self.statuses = []
+        self.requests = []
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}/api/lundy_objects/'.format(self.server_port)
+
+
+def build_project(size):
+    project = LundyProject('Lundy')
+    for i in range(size):
+        module = LundyModule('module{}'.format(i), 'module{}.py'.format(i))
+        module.classes.append(LundyClass('Class{}'.format(i)))
+        project.modules.append(module)
+    return project
+
+
+class UploaderTests(unittest.TestCase):
+    def setUp(self):
+        self.server = StubServer()
+        thread = threading.Thread(target=self.server.serve_forever, args=(0.01, ))
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.ledger_path = os.path.join(self.tmp_dir, 'ledger')
+
+    def uploader(self, **kwargs):
+        kwargs.setdefault('chunk_size', 2)
+        kwargs.setdefault('backoff', 0)
+        kwargs.setdefault('ledger_path', self.ledger_path)
+        return Uploader(self.server.url, **kwargs)
+
+    def test_push_project_in_chunks(self):
+        project = build_project(20)
+        uploader = self.uploader()
+        uploader.push_project(project)
+        bodies = [body for key, body, status in self.server.requests]
+        modules = [module for body in bodies if body['type'] == 'modules' for module in body['modules']]
+        self.assertEqual(sorted(module['os_path'] for module in modules),
+                         sorted(module.os_path for module in project.modules))
+        self.assertTrue(all(len(body['modules']) <= 8 for body in bodies[:-1]))
+        self.assertEqual(bodies[-1]['type'], 'project')
+        self.assertEqual(bodies[-1]['modules'], [module.hash for module in project.modules])
+        for key, body, status in self.server.requests:
+            self.assertEqual(key, body['key'])
+        self.assertEqual(uploader.progress.chunks, len(bodies))
+
+    def test_resumed_push_skips_sent_chunks(self):
+        project = build_project(20)
+        self.server.statuses = [201, 400]
+        with self.assertRaises(UploadError):
+            self.uploader(workers=1).push_project(project)
+        uploader = self.uploader(workers=1)
+        uploader.push_project(project)
+        self.assertEqual(uploader.progress.skipped, 1)
+        self.assertEqual(self.server.requests[-1][1]['type'], 'project')
+
+    def test_added_module_changes_one_chunk(self):
+        project = build_project(40)
+        self.uploader().push_project(project)
+        sent = len(self.server.requests)
+        module = LundyModule('added', 'added.py')
+        project.modules.insert(10, module)
+        project.invalidate()
+        uploader = self.uploader()
+        uploader.push_project(project)
+        resent = [body for key, body, status in self.server.requests[sent:] if body['type'] == 'modules']
+        self.assertLessEqual(len(resent), 2)
+        self.assertIn('added.py', [module['os_path'] for body in resent for module in body['modules']])
+
+    def test_push_delta(self):
+        previous = build_project(5)
+        project = build_project(6)
+        self.uploader().push_delta(previous, project)
+        (key, body, status), = self.server.requests
+        self.assertEqual((body['type'], body['base'], body['hash']), ('project_delta', previous.hash, project.hash))
+        self.assertEqual([module['os_path'] for module in body['data']['added']], ['module5.py'])
+
+    def test_retries_with_backoff(self):
+        self.server.statuses = [503, 500, 409]
+        uploader = self.uploader()
+        uploader.push_documents([('lunni_run', {'hash': 'a', 'data': {}})])
+        self.assertEqual([status for key, body, status in self.server.requests], [503, 500, 409])
+        self.assertEqual(uploader.progress.retries, 2)
+        self.assertIn(self.server.requests[0][0], uploader.ledger)
+
+    def test_gives_up_after_retries(self):
+        self.server.statuses = [503] * 3
+        with self.assertRaises(UploadError):
+            self.uploader(retries=2).push_documents([('lunni_run', {'hash': 'a', 'data': {}})])
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_same_runs_same_key(self):
+        batch = [('lunni_run', {'hash': 'a', 'data': {'i': i}}) for i in range(3)]
+        self.uploader(ledger_path=None).push_documents(batch)
+        Uploader(self.server.url, chunk_size=2).push_documents(batch)
+        keys = [key for key, body, status in self.server.requests]
+        self.assertEqual(len(keys), 4)
+        self.assertEqual(sorted(keys[:2]), sorted(keys[2:]))
+
+    def test_documents_grouped_by_collection(self):
+        batch = [('lunni_run', {'hash': 'a'}), ('lunni_method', {'_id': 'a'}), ('lunni_run', {'hash': 'b'})]
+        self.uploader().push_documents(batch)
+        bodies = sorted((body['collection'], body['documents']) for key, body, status in self.server.requests)
+        self.assertEqual(bodies, [('lunni_method', [{'_id': 'a'}]), ('lunni_run', [{'hash': 'a'}, {'hash': 'b'}])])
+
+
+class LedgerTests(unittest.TestCase):
+    def test_compacted(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        path = os.path.join(tmp_dir, 'ledger')
+        ledger = Ledger(path, max_keys=3)
+        for i in range(7):
+            ledger.add(str(i))
+        with open(path) as f:
+            self.assertEqual(f.read().split(), ['4', '5', '6'])
+        self.assertEqual(list(Ledger(path, max_keys=2).keys), ['5', '6'])
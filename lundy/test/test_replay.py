@@ -0,0 +1,123 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from StringIO import StringIO
+
+import mongomock
+from mock import patch
+
+from main import method_wrapper
+from replay import format_reports, load_from_database, load_from_file, replay, resolve
+from snapshot import SnapshotWriter, pack
+
+MODULE_SOURCE = '''
+from main import Lundy
+
+
+def add(a, b=1):
+    return a + b
+
+
+def fail(a):
+    raise ValueError(a)
+
+
+@Lundy.collector()
+class Counter:
+    def __init__(self, start):
+        self.start = start
+
+    def count(self, step):
+        return self.start + step
+
+    @staticmethod
+    def double(a):
+        return a * 2
+
+
+class Greeter(object):
+    @Lundy.collector()
+    def greet(self, name):
+        return 'hi ' + name
+'''
+
+
+class ReplayTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        with open(os.path.join(self.directory, 'replayed_app.py'), 'w') as f:
+            f.write(MODULE_SOURCE)
+        sys.path.insert(0, self.directory)
+        self.addCleanup(self.cleanup)
+
+    def cleanup(self):
+        sys.path.remove(self.directory)
+        sys.modules.pop('replayed_app', None)
+        shutil.rmtree(self.directory)
+
+    def record(self):
+        """(collection, document) pairs recorded by calling the sample module"""
+        import replayed_app
+        with patch('main.get_shipper') as get_shipper_patch, patch('main._stored_methods', set()):
+            add = method_wrapper(replayed_app.add)
+            add(1)
+            add(2, b=3)
+            self.assertRaises(ValueError, method_wrapper(replayed_app.fail), 'x')
+            replayed_app.Counter(10).count(5)
+            replayed_app.Greeter().greet('you')
+        # replays run against code imported afresh
+        sys.modules.pop('replayed_app')
+        return [call[0][:2] for call in get_shipper_patch.return_value.put.call_args_list]
+
+    def methods(self, documents):
+        f = StringIO()
+        writer = SnapshotWriter(f, compress=False)
+        for document in documents:
+            writer.write(pack(document))
+        writer.close()
+        return list(load_from_file(StringIO(f.getvalue())))
+
+    def test_replay_matches_recording(self):
+        reports = replay(self.methods(self.record()), [self.directory], workers=1)
+        self.assertEqual(sorted((report['qualname'], report['calls'], report['mismatches']) for report in reports),
+                         [('Counter.__init__', 1, 0), ('Counter.count', 1, 0), ('Greeter.greet', 1, 0), ('add', 2, 0),
+                          ('fail', 1, 0)])
+        self.assertTrue(all(len(report['replayed_ns']) == report['calls'] for report in reports))
+        self.assertIn('add: 2 calls', format_reports(reports))
+
+    def test_changed_code_is_reported(self):
+        methods = self.methods(self.record())
+        with open(os.path.join(self.directory, 'replayed_app.py'), 'w') as f:
+            f.write(MODULE_SOURCE.replace('return a + b', 'return a - b'))
+        for name in os.listdir(self.directory):
+            if name.endswith('.pyc'):
+                os.remove(os.path.join(self.directory, name))
+        reports = replay(methods, [self.directory], workers=2)
+        mismatches = dict((report['qualname'], report['mismatches']) for report in reports)
+        self.assertEqual(mismatches, {'add': 2, 'fail': 0, 'Counter.__init__': 0, 'Counter.count': 0, 'Greeter.greet': 0})
+
+    @patch('replay.get_database')
+    def test_load_from_database(self, get_database_patch):
+        db = get_database_patch.return_value = mongomock.MongoClient().db
+        for collection, document in self.record():
+            db[collection].insert_one(document)
+        methods = dict((method['qualname'], runs) for method, runs in load_from_database(sample=1))
+        self.assertEqual(sorted(methods), ['Counter.__init__', 'Counter.count', 'Greeter.greet', 'add', 'fail'])
+        self.assertEqual(list(methods['add'][0]['data']['args']), [2, 3])
+
+    def test_unknown_method(self):
+        methods = [({'hash': 'h', 'module': 'replayed_app', 'qualname': 'missing'},
+                    [{'hash': 'h', 'data': {'args': [], 'kwargs': {}, 'result': None, 'duration': 0.1}}])]
+        report, = replay(methods, [self.directory], workers=1)
+        self.assertEqual(report['calls'], 0)
+        self.assertIn('Cannot find replayed_app.missing', report['failures'][0])
+
+    def test_resolve_unwraps(self):
+        import replayed_app
+        function, owner, kind = resolve('replayed_app', 'Counter.count')
+        self.assertIs(owner, replayed_app.Counter)
+        self.assertEqual(kind, 'method')
+        self.assertFalse(hasattr(function, 'lundy_signature'))
+        self.assertEqual(resolve('replayed_app', 'Counter.double')[2], 'staticmethod')
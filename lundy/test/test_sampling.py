@@ -0,0 +1,102 @@
+import unittest
+
+from mock import patch
+
+from lundy.sampling import SamplingPolicy, TokenBucket
+from main import Lundy, method_wrapper
+
+
+class FakeSignature(object):
+    def __init__(self, hash):
+        self.hash = hash
+
+    def get_hash(self):
+        return self.hash
+
+
+def sample_function():
+    return 1
+
+
+class First(object):
+    @Lundy.collector(every_nth=2)
+    def method(self):
+        return 1
+
+
+class Second(object):
+    @Lundy.collector(every_nth=3)
+    def method(self):
+        return 2
+
+
+class SamplingPolicyTests(unittest.TestCase):
+    def decisions(self, policy, calls, duration=0):
+        signature = FakeSignature('sampling-test-{}'.format(id(policy)))
+        return [policy.keep(policy.sample(signature), duration) for _ in range(calls)]
+
+    def test_record_all_by_default(self):
+        policy = SamplingPolicy()
+        self.assertEqual(self.decisions(policy, 3), [True] * 3)
+        self.assertEqual(policy.stats(), {'sampled': 3, 'slow': 0, 'dropped': 0})
+
+    def test_every_nth(self):
+        policy = SamplingPolicy(every_nth=3)
+        self.assertEqual(self.decisions(policy, 6), [True, False, False] * 2)
+        self.assertEqual(policy.stats(), {'sampled': 2, 'slow': 0, 'dropped': 4})
+
+    @patch('lundy.sampling.random.random')
+    def test_sample_rate(self, random_patch):
+        random_patch.side_effect = [0.05, 0.5, 0.09]
+        policy = SamplingPolicy(sample_rate=0.1)
+        self.assertEqual(self.decisions(policy, 3), [True, False, True])
+
+    def test_rate_limit(self):
+        policy = SamplingPolicy(rate_limit=0.001, burst=2)
+        self.assertEqual(self.decisions(policy, 4), [True, True, False, False])
+
+    def test_slow_calls_always_recorded(self):
+        policy = SamplingPolicy(every_nth=1000, slow_ms=10)
+        self.assertEqual(self.decisions(policy, 3, duration=0.02), [True] * 3)
+        self.assertEqual(policy.stats(), {'sampled': 1, 'slow': 2, 'dropped': 0})
+
+    def test_from_options(self):
+        policy = SamplingPolicy.from_options({'every_nth': 5, 'config': 'x'},
+                                             {'every_nth': '10', 'slow_ms': '20'})
+        self.assertEqual(policy.every_nth, 5)
+        self.assertEqual(policy.slow_ms, 20.0)
+        self.assertIsNone(policy.sample_rate)
+
+    def test_invalid_options(self):
+        for options in ({'every_nth': 0}, {'every_nth': -2}, {'sample_rate': 1.5}, {'sample_rate': -0.1}):
+            self.assertRaises(ValueError, SamplingPolicy.from_options, options)
+        self.assertRaises(ValueError, Lundy.collector(every_nth='0'), sample_function)
+
+class TokenBucketTests(unittest.TestCase):
+    @patch('lundy.sampling.time.time')
+    def test_refill(self, time_patch):
+        time_patch.return_value = 100.0
+        bucket = TokenBucket(rate=2, burst=1)
+        self.assertTrue(bucket.take())
+        self.assertFalse(bucket.take())
+        time_patch.return_value = 100.5
+        self.assertTrue(bucket.take())
+
+
+@patch('main.get_shipper')
+class SampledWrapperTests(unittest.TestCase):
+    def test_dropped_calls_are_not_recorded(self, get_shipper_patch):
+        wrapped = method_wrapper(sample_function, SamplingPolicy(every_nth=2))
+        self.assertEqual([wrapped() for _ in range(4)], [1] * 4)
+        runs = [call for call in get_shipper_patch.return_value.put.call_args_list if call[0][0] == 'lunni_run']
+        self.assertEqual(len(runs), 2)
+        self.assertEqual(Lundy.sampling_stats()[wrapped.lundy_signature.name()],
+                         {'sampled': 2, 'slow': 0, 'dropped': 2})
+
+    def test_same_named_methods_of_different_classes(self, get_shipper_patch):
+        for _ in range(3):
+            First().method()
+            Second().method()
+        stats = Lundy.sampling_stats()
+        self.assertEqual(stats['{}.First.method'.format(__name__)], {'sampled': 2, 'slow': 0, 'dropped': 1})
+        self.assertEqual(stats['{}.Second.method'.format(__name__)], {'sampled': 1, 'slow': 0, 'dropped': 2})
@@ -0,0 +1,58 @@
+import collections
+import unittest
+
+from lundy.serializer import CYCLE, TRUNCATED, Serializer
+from lundy.test.sample_project_dir.a_bit_complex_class import NormalClass
+
+
+class NewStyle(object):
+    def __init__(self, value):
+        self.value = value
+
+
+class SerializerTests(unittest.TestCase):
+    def setUp(self):
+        self.serializer = Serializer()
+
+    def test_containers(self):
+        value = {'a': [1, (2, 'x')], 'b': (None, [])}
+        self.assertEqual(self.serializer.serialize(value), {'a': [1, (2, 'x')], 'b': ('type', [])})
+        self.assertIsInstance(self.serializer.serialize(value)['a'][1], tuple)
+
+    def test_objects(self):
+        value = NormalClass(NewStyle(1), NormalClass)
+        self.assertEqual(self.serializer.serialize(value), {'a': {'value': 1}, 'b': 'type'})
+
+    def test_subclasses(self):
+        value = collections.OrderedDict([('a', collections.namedtuple('Point', 'x y')(1, 2))])
+        self.assertEqual(self.serializer.serialize(value), {'a': (1, 2)})
+
+    def test_cycles(self):
+        value = [1]
+        value.append(value)
+        self.assertEqual(self.serializer.serialize(value), [1, CYCLE])
+        obj = NewStyle(None)
+        obj.value = obj
+        self.assertEqual(self.serializer.serialize(obj), {'value': CYCLE})
+
+    def test_shared_references_are_not_cycles(self):
+        shared = [1]
+        self.assertEqual(self.serializer.serialize([shared, shared]), [[1], [1]])
+
+    def test_deep(self):
+        value = []
+        for _ in range(100000):
+            value = [value]
+        serialized = Serializer(max_depth=3).serialize(value)
+        self.assertEqual(serialized, [[[TRUNCATED]]])
+
+    def test_max_items(self):
+        serialized = Serializer(max_items=4).serialize(range(100))
+        self.assertEqual(serialized, [0, 1, 2, TRUNCATED])
+        serialized = Serializer(max_items=3).serialize({'a': 1, 'b': 2, 'c': 3})
+        self.assertEqual(len(serialized), 3)
+        self.assertEqual(sorted(serialized.values()).count(TRUNCATED), 1)
+
+    def test_max_bytes(self):
+        serialized = Serializer(max_bytes=10).serialize(['abcdef', 'ghijkl'])
+        self.assertEqual(serialized, ['abcdef', 'ghij' + TRUNCATED])
@@ -0,0 +1,113 @@
+import threading
+import unittest
+
+from mock import patch
+
+import mongomock as mongomock
+
+from lundy.shipper import RunShipper
+from lundy.datasets import ResultPackage
+
+
+class RunShipperTests(unittest.TestCase):
+    def setUp(self):
+        self.batches = []
+        self.shipped_event = threading.Event()
+
+    def sink(self, batch):
+        self.batches.append(batch)
+        self.shipped_event.set()
+
+    def test_flush_ships_in_batches(self):
+        shipper = RunShipper(self.sink, batch_size=2, linger=60)
+        self.addCleanup(shipper.close)
+        for i in range(5):
+            shipper.put('lunni_run', {'i': i})
+        shipper.flush()
+        documents = [document for batch in self.batches for collection, document in batch]
+        self.assertEqual(documents, [{'i': i} for i in range(5)])
+        self.assertTrue(all(len(batch) <= 2 for batch in self.batches))
+        self.assertEqual(shipper.shipped, 5)
+
+    def test_worker_ships_after_linger(self):
+        shipper = RunShipper(self.sink, batch_size=100, linger=0.01)
+        self.addCleanup(shipper.close)
+        shipper.put('lunni_run', {'i': 1})
+        self.assertTrue(self.shipped_event.wait(5))
+        self.assertEqual(self.batches, [[('lunni_run', {'i': 1})]])
+
+    def test_drop_oldest(self):
+        shipper = RunShipper(self.sink, queue_size=2, batch_size=100, linger=60)
+        self.addCleanup(shipper.close)
+        for i in range(4):
+            shipper.put('lunni_run', {'i': i})
+        shipper.flush()
+        self.assertEqual(self.batches, [[('lunni_run', {'i': 2}), ('lunni_run', {'i': 3})]])
+        self.assertEqual(shipper.dropped, 2)
+
+    def test_sample_keeps_queue_bounded(self):
+        shipper = RunShipper(self.sink, queue_size=10, batch_size=100, linger=60, overflow='sample')
+        self.addCleanup(shipper.close)
+        for i in range(1000):
+            shipper.put('lunni_run', {'i': i})
+        shipper.flush()
+        self.assertEqual(len(self.batches[0]), 10)
+        self.assertEqual(shipper.dropped, 990)
+
+    def test_non_blocking_put_drops_when_full(self):
+        shipper = RunShipper(self.sink, queue_size=2, batch_size=100, linger=60, overflow='block')
+        self.addCleanup(shipper.close)
+        for i in range(3):
+            shipper.put('lunni_run', {'i': i}, block=False)
+        shipper.flush()
+        self.assertEqual(self.batches, [[('lunni_run', {'i': 0}), ('lunni_run', {'i': 1})]])
+        self.assertEqual(shipper.dropped, 1)
+
+    def test_sink_errors_are_counted(self):
+        def broken_sink(batch):
+            raise IOError("database is down")
+        shipper = RunShipper(broken_sink, linger=60)
+        self.addCleanup(shipper.close)
+        shipper.put('lunni_run', {'i': 1})
+        shipper.flush()
+        self.assertEqual(shipper.failed, 1)
+
+    def test_lost_documents_are_reported(self):
+        lost = []
+        shipper = RunShipper(self.sink, queue_size=1, batch_size=100, linger=60)
+        self.addCleanup(shipper.close)
+        shipper.put('lunni_method', {'i': 0}, on_lost=lambda: lost.append(0))
+        shipper.put('lunni_run', {'i': 1}, on_lost=lambda: lost.append(1))
+        self.assertEqual(lost, [0])
+        shipper.sink = self.broken_sink
+        shipper.flush()
+        self.assertEqual(lost, [0, 1])
+
+    def broken_sink(self, batch):
+        raise IOError("database is down")
+
+    def test_unknown_overflow_policy(self):
+        self.assertRaises(ValueError, RunShipper, self.sink, overflow='explode')
+
+    @patch('lundy.datasets.get_database')
+    def test_default_sink_inserts_documents(self, get_database_patch):
+        db = mongomock.MongoClient().lunni_test
+        get_database_patch.return_value = db
+        shipper = RunShipper(linger=60)
+        self.addCleanup(shipper.close)
+        package = ResultPackage("test", ['1'], ['2'], ['3'], 'adsa', 3, 3)
+        shipper.put('lunni_run', package.to_document())
+        shipper.put('lunni_run', package.to_document())
+        shipper.flush()
+        self.assertEqual(db.lunni_run.count_documents({'hash': 'adsa'}), 2)
+
+    @patch('lundy.datasets.get_database')
+    def test_default_sink_upserts_methods(self, get_database_patch):
+        db = mongomock.MongoClient().lunni_test
+        get_database_patch.return_value = db
+        shipper = RunShipper(linger=60)
+        self.addCleanup(shipper.close)
+        for name in ('first', 'second'):
+            shipper.put('lunni_method', {'_id': 'adsa', 'hash': 'adsa', 'name': name})
+        shipper.flush()
+        self.assertEqual(list(db.lunni_method.find()), [{'_id': 'adsa', 'hash': 'adsa', 'name': 'first'}])
@@ -0,0 +1,70 @@
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+from lundy import snapshot
+from lundy.datasets import LundyArg, LundyProject, ResultPackage
+
+
+class SnapshotTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'snapshot')
+        project_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'sample_project_dir')
+        self.project = LundyProject('Lundy')
+        self.project.scan(project_dir, mode='static')
+        self.project.modules[0].classes[0].methods[0].args.append(LundyArg(u'size', (1, 2), tuple))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_project_round_trip(self):
+        for compress in (True, False):
+            snapshot.save_project(self.project, self.path, compress)
+            loaded = snapshot.load_project(self.path)
+            self.assertEqual(loaded.to_string(), self.project.to_string())
+            self.assertEqual(loaded.hash, self.project.hash)
+
+    def test_smaller_than_json(self):
+        snapshot.save_project(self.project, self.path, compress=False)
+        self.assertLess(os.path.getsize(self.path), len(self.project.to_string()))
+
+    def test_runs_round_trip(self):
+        package = ResultPackage('sample', ('a', 1, [None]), {'b': 2.5}, {'c': (1, 2)}, 'hash',
+                                datetime.datetime(2026, 10, 18, 9, 30, 1, 250), 0.5, 500000000)
+        documents = [package.to_document()] * 3
+        snapshot.save_runs(documents, self.path)
+        self.assertEqual(snapshot.load_runs(self.path), documents)
+
+    def test_wrong_kind(self):
+        snapshot.save_runs([], self.path)
+        with self.assertRaises(snapshot.SnapshotError):
+            snapshot.load_project(self.path)
+
+    def test_not_a_snapshot(self):
+        with open(self.path, 'w') as f:
+            f.write(self.project.to_string())
+        with self.assertRaises(snapshot.SnapshotError):
+            snapshot.load_project(self.path)
+
+    def test_truncated(self):
+        snapshot.save_project(self.project, self.path, compress=False)
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        with open(self.path, 'wb') as f:
+            f.write(data[:-10])
+        with self.assertRaises(snapshot.SnapshotError):
+            snapshot.load_project(self.path)
+
+    def test_small_compressed_chunks(self):
+        snapshot.save_project(self.project, self.path, compress=True)
+        with open(self.path, 'rb') as f:
+            records = list(snapshot.iter_records(f, chunk_size=1))
+        self.assertEqual(len(records), len(self.project.modules) + 1)
+
+    def test_unmarshallable_values(self):
+        import decimal
+        snapshot.save_runs([{'data': {'result': decimal.Decimal('1.5')}}], self.path)
+        self.assertEqual(snapshot.load_runs(self.path), [{'data': {'result': "Decimal('1.5')"}}])
@@ -0,0 +1,117 @@
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import patch
+
+from lundy.snapshot import HEADER_SIZE
+from lundy.spool import Spool
+
+
+def documents(start, stop):
+    return [('lunni_run', {'i': i, 'timestamp': datetime.datetime(2026, 10, 18, 9, 0, i % 60)})
+            for i in range(start, stop)]
+
+
+class SpoolTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = os.path.join(tempfile.mkdtemp(), 'spool')
+        self.addCleanup(shutil.rmtree, os.path.dirname(self.directory))
+        self.batches = []
+
+    def sink(self, batch):
+        self.batches.append(batch)
+
+    def shipped(self):
+        return [item for batch in self.batches for item in batch]
+
+    def test_drain_ships_appended_runs(self):
+        spool = Spool(self.directory)
+        spool.append(documents(0, 5))
+        spool.append(documents(5, 7))
+        self.assertEqual(spool.drain(self.sink, batch_size=3), 7)
+        self.assertEqual(self.shipped(), documents(0, 7))
+        self.assertEqual([len(batch) for batch in self.batches], [3, 3, 1])
+
+    def test_drain_resumes_from_offset(self):
+        spool = Spool(self.directory)
+        spool.append(documents(0, 3))
+        spool.drain(self.sink)
+        spool.append(documents(3, 5))
+        spool.close()
+        Spool(self.directory).drain(self.sink)
+        self.assertEqual(self.shipped(), documents(0, 5))
+        self.assertEqual(spool.segments(), [])
+
+    def test_failed_sink_keeps_records(self):
+        spool = Spool(self.directory)
+        spool.append(documents(0, 4))
+        spool.close()
+
+        def broken_sink(batch):
+            if len(self.batches) == 1:
+                raise IOError("database is down")
+            self.sink(batch)
+        with self.assertRaises(IOError):
+            spool.drain(broken_sink, batch_size=2)
+        spool.drain(self.sink, batch_size=2)
+        self.assertEqual(self.shipped(), documents(0, 4))
+
+    def test_offsets_are_saved_after_each_batch(self):
+        spool = Spool(self.directory)
+        spool.append(documents(0, 10))
+        spool.close()
+        saved = []
+
+        def sink(batch):
+            saved.append(spool._load_offsets())
+            self.sink(batch)
+        spool.drain(sink, batch_size=4)
+        # what a drain killed while shipping each batch would resume from
+        self.assertEqual([len(offsets) for offsets in saved], [0, 1, 1])
+        self.assertLess(HEADER_SIZE, saved[1].values()[0])
+        self.assertLess(saved[1].values()[0], saved[2].values()[0])
+
+    def test_rotation_removes_drained_segments(self):
+        spool = Spool(self.directory, segment_size=100)
+        for i in range(5):
+            spool.append(documents(i, i + 1))
+        self.assertEqual(len(spool.segments()), 5)
+        spool.drain(self.sink)
+        self.assertEqual(self.shipped(), documents(0, 5))
+        self.assertEqual(spool.segments(), [])
+
+    def test_max_bytes(self):
+        spool = Spool(self.directory, max_bytes=100)
+        spool.append(documents(0, 10))
+        spool.append(documents(10, 12))
+        self.assertEqual((spool.written, spool.dropped), (10, 2))
+        spool.drain(self.sink)
+        self.assertEqual(self.shipped(), documents(0, 10))
+
+    def test_size_is_not_recounted_for_every_batch(self):
+        spool = Spool(self.directory)
+        spool.append(documents(0, 1))
+        with patch.object(spool, 'size') as size_patch:
+            spool.append(documents(1, 2))
+            self.assertFalse(size_patch.called)
+        spool.close()
+
+    def test_appending_resumes_after_drain(self):
+        spool = Spool(self.directory, max_bytes=100)
+        spool.append(documents(0, 10))
+        spool.append(documents(10, 11))
+        spool.close()
+        spool.drain(self.sink)
+        spool.append(documents(11, 12))
+        self.assertEqual((spool.written, spool.dropped), (11, 1))
+
+    def test_new_segment_has_its_header(self):
+        spool = Spool(self.directory)
+        spool._open_segment()
+        self.addCleanup(spool.close)
+        name, = spool.segments()
+        self.assertEqual(os.path.getsize(os.path.join(self.directory, name)), HEADER_SIZE)
+        self.assertEqual(spool.drain(self.sink), 0)
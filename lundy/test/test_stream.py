@@ -0,0 +1,52 @@
+import os
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+
+from lundy.cache import ScanCache
+from lundy.datasets import LundyProject
+from lundy.stream import ProjectWriter, write_project
+from lundy import snapshot
+
+
+class StreamTests(unittest.TestCase):
+    def setUp(self):
+        self.project_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'sample_project_dir')
+        self.project = LundyProject('Lundy')
+        self.project.scan(self.project_dir, mode='static')
+
+    def test_iter_scan(self):
+        project = LundyProject('Lundy')
+        modules = list(project.iter_scan(self.project_dir, mode='static'))
+        self.assertEqual(project.modules, [])
+        self.assertEqual([module.hash for module in modules],
+                         [module.hash for module in self.project.modules])
+
+    def test_iter_scan_cache(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        cache = ScanCache(os.path.join(directory, 'cache'), 'static')
+        first = [module.hash for module in LundyProject('Lundy').iter_scan(self.project_dir, 'static', cache)]
+        second = [module.hash for module in LundyProject('Lundy').iter_scan(self.project_dir, 'static', cache)]
+        self.assertEqual(first, second)
+        self.assertEqual(cache.hits, len(second))
+
+    def test_write_project(self):
+        f = StringIO()
+        project_hash = write_project(f, 'Lundy', iter(self.project.modules))
+        self.assertEqual(f.getvalue(), self.project.to_string())
+        self.assertEqual(project_hash, self.project.hash)
+
+    def test_empty_project(self):
+        f = StringIO()
+        writer = ProjectWriter(f, 'Lundy')
+        self.assertEqual(writer.close(), LundyProject('Lundy').hash)
+        self.assertEqual(f.getvalue(), LundyProject('Lundy').to_string())
+
+    def test_save_modules(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'project.luns')
+        snapshot.save_modules('Lundy', LundyProject('Lundy').iter_scan(self.project_dir, 'static'), path)
+        self.assertEqual(snapshot.load_project(path).hash, self.project.hash)